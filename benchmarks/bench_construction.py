@@ -0,0 +1,61 @@
+"""Construction throughput of stimulus patterns and sites, one at a time and in batches."""
+import numpy as np
+from pynwb.device import Device
+
+from ndx_holostim import OptogeneticStimulusPattern, PatternedOptogeneticStimulusSite
+
+
+class PatternConstruction:
+    params = [100, 10000]
+    param_names = ['number_patterns']
+
+    def setup(self, number_patterns):
+        self.names = ['pattern%d' % number for number in range(number_patterns)]
+        self.duration = np.linspace(0.01, 0.1, number_patterns)
+
+    def time_constructor(self, number_patterns):
+        for name, duration in zip(self.names, self.duration.tolist()):
+            OptogeneticStimulusPattern(
+                name=name,
+                description='benchmark pattern',
+                duration=duration,
+                number_of_stimulus_presentation=10,
+                inter_stimulus_interval=0.1,
+            )
+
+    def time_from_arrays(self, number_patterns):
+        OptogeneticStimulusPattern.from_arrays(
+            self.names,
+            description='benchmark pattern',
+            duration=self.duration,
+            number_of_stimulus_presentation=10,
+            inter_stimulus_interval=0.1,
+        )
+
+
+class SiteConstruction:
+    params = [100, 10000]
+    param_names = ['number_sites']
+
+    def setup(self, number_sites):
+        self.device = Device(name='device')
+        self.names = ['site%d' % number for number in range(number_sites)]
+
+    def time_constructor(self, number_sites):
+        for name in self.names:
+            PatternedOptogeneticStimulusSite(
+                name=name,
+                device=self.device,
+                description='benchmark site',
+                excitation_lambda=1040.0,
+                location='V1',
+            )
+
+    def time_from_arrays(self, number_sites):
+        PatternedOptogeneticStimulusSite.from_arrays(
+            self.names,
+            device=self.device,
+            description='benchmark site',
+            excitation_lambda=1040.0,
+            location='V1',
+        )
@@ -0,0 +1,14 @@
+"""Import-time benchmarks. Each ``timeraw_`` benchmark runs in a fresh interpreter."""
+
+
+def timeraw_import_pynwb():
+    return "import pynwb"
+
+
+def timeraw_import_ndx_holostim():
+    # pynwb is imported in the setup so that the benchmark measures ndx_holostim only
+    return "import ndx_holostim", "import pynwb"
+
+
+def timeraw_import_ndx_holostim_cold_cache():
+    return "import ndx_holostim", "import os, pynwb; os.environ['NDX_HOLOSTIM_CACHE_DIR'] = ''"
@@ -0,0 +1,212 @@
+"""Write and read paths of PatternedOptogeneticSeries at production scale, for every ROI representation and backend.
+
+Each benchmark is parameterized by the number of ROIs, the representation of the ROIs and the storage backend.
+The ROIs are disks of 4 to 12 pixels in radius spread over the planes of a 128 x 128 x 2 field of view, stored as:
+
+- ``dense``: ``image_mask_roi``, one boolean mask per ROI
+- ``sparse``: ``image_mask_roi_indices`` and ``image_mask_roi_index``
+- ``packed``: ``image_mask_roi_packed``, 8 pixels per byte
+- ``centers``: ``center_rois`` only
+- ``pixels``: ragged ``pixel_rois`` and ``pixel_rois_index``
+
+Combinations whose backend is not installed are skipped. Note that ``peakmem_`` benchmarks include the memory
+of the ROI arrays built in ``setup``.
+"""
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+from pynwb import NWBHDF5IO, NWBFile
+
+from ndx_holostim import (
+    LightSource,
+    OptogeneticStimulusPattern,
+    PatternedOptogeneticSeries,
+    PatternedOptogeneticStimulusSite,
+    SpatialLightModulator,
+)
+from ndx_holostim.conversion import centers_to_masks, masks_to_pixels
+from ndx_holostim.masks import encode_sparse_masks, pack_masks
+
+MASK_SHAPE = (128, 128, 2)
+
+REPRESENTATIONS = ['dense', 'sparse', 'packed', 'centers', 'pixels']
+
+BACKENDS = ['hdf5', 'zarr']
+
+_MASK_REPRESENTATIONS = ('dense', 'sparse', 'packed')
+
+
+def make_center_rois(number_rois, seed=0):
+    """Return reproducible [x, y, z, r] centers of disks that fit in MASK_SHAPE."""
+    rng = np.random.default_rng(seed)
+    radius = rng.uniform(4, 12, number_rois)
+    return np.column_stack((
+        rng.uniform(radius, MASK_SHAPE[0] - radius),
+        rng.uniform(radius, MASK_SHAPE[1] - radius),
+        rng.integers(0, MASK_SHAPE[2], number_rois),
+        radius,
+    ))
+
+
+def make_roi_fields(number_rois, representation):
+    """Return the ROI arguments of PatternedOptogeneticSeries for a representation."""
+    center_rois = make_center_rois(number_rois)
+    if representation == 'centers':
+        return dict(center_rois=center_rois)
+    masks = centers_to_masks(center_rois, MASK_SHAPE)
+    if representation == 'dense':
+        return dict(image_mask_roi=masks)
+    if representation == 'sparse':
+        indices, index, mask_shape = encode_sparse_masks(masks)
+        return dict(image_mask_roi_indices=indices, image_mask_roi_index=index, image_mask_shape=mask_shape)
+    if representation == 'packed':
+        packed, mask_shape = pack_masks(masks)
+        return dict(image_mask_roi_packed=packed, image_mask_shape=mask_shape)
+    if representation == 'pixels':
+        pixels, index = masks_to_pixels(masks)
+        return dict(pixel_rois=pixels.astype(np.uint16), pixel_rois_index=index.astype(np.uint32))
+    raise ValueError("unknown representation '%s'" % representation)
+
+
+def _io_class(backend):
+    if backend == 'hdf5':
+        return NWBHDF5IO
+    try:
+        from hdmf_zarr.nwb import NWBZarrIO
+    except ImportError:
+        raise NotImplementedError("hdmf-zarr is not installed")
+    return NWBZarrIO
+
+
+def make_nwbfile(roi_fields, backend):
+    """Return an NWBFile holding one PatternedOptogeneticSeries with the given ROI arguments."""
+    nwbfile = NWBFile(
+        session_description='ROI benchmark',
+        identifier='bench_rois',
+        session_start_time=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    )
+    device = nwbfile.create_device(name='device')
+    light_source = LightSource(
+        name='light_source',
+        stimulation_wavelength=1035.0,
+        filter_description='none',
+        peak_power=0.7,
+        pulse_rate=500e3,
+    )
+    spatial_light_modulator = SpatialLightModulator(name='slm', model_name='benchmark SLM', resolution=0.65)
+    for dev in (light_source, spatial_light_modulator):
+        nwbfile.add_device(dev)
+    stimulus_pattern = OptogeneticStimulusPattern(
+        name='pattern',
+        description='benchmark pattern',
+        duration=0.01,
+        number_of_stimulus_presentation=10,
+        inter_stimulus_interval=0.1,
+    )
+    nwbfile.add_lab_meta_data(stimulus_pattern)
+    site = PatternedOptogeneticStimulusSite(
+        name='site',
+        device=device,
+        description='benchmark site',
+        excitation_lambda=1035.0,
+        location='V1',
+    )
+    nwbfile.add_ogen_site(site)
+    series = PatternedOptogeneticSeries(
+        name='photostim',
+        site=site,
+        device=device,
+        light_source=light_source,
+        spatial_light_modulator=spatial_light_modulator,
+        stimulus_pattern=stimulus_pattern,
+        roi_dataio=dict(backend=backend),
+        **roi_fields
+    )
+    nwbfile.add_acquisition(series)
+    return nwbfile
+
+
+def _path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class _RoiBenchmark:
+    params = [[10, 100, 1000, 10000], REPRESENTATIONS, BACKENDS]
+    param_names = ['number_rois', 'representation', 'backend']
+    timeout = 600
+
+    def setup(self, number_rois, representation, backend):
+        self.io_class = _io_class(backend)
+        self.roi_fields = make_roi_fields(number_rois, representation)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'bench.nwb' if backend == 'hdf5' else 'bench.nwb.zarr')
+
+    def teardown(self, number_rois, representation, backend):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, backend):
+        with self.io_class(self.path, mode='w') as io:
+            io.write(make_nwbfile(self.roi_fields, backend))
+
+
+class Construction(_RoiBenchmark):
+    def time_construct(self, number_rois, representation, backend):
+        make_nwbfile(self.roi_fields, backend)
+
+
+class Write(_RoiBenchmark):
+    # a new file is written in each repeat, after setup
+    number = 1
+    warmup_time = 0
+
+    def time_write(self, number_rois, representation, backend):
+        self.write(backend)
+
+    def peakmem_write(self, number_rois, representation, backend):
+        self.write(backend)
+
+    def track_file_size(self, number_rois, representation, backend):
+        self.write(backend)
+        return _path_size(self.path)
+
+    track_file_size.unit = 'bytes'
+
+
+class Read(_RoiBenchmark):
+    """Read times once the file is open, so that they exclude building the object graph."""
+
+    def setup(self, number_rois, representation, backend):
+        super().setup(number_rois, representation, backend)
+        self.write(backend)
+        self.representation = representation
+        self.roi = number_rois // 2
+        self.io = self.io_class(self.path, mode='r')
+        self.series = self.io.read().acquisition['photostim']
+
+    def teardown(self, number_rois, representation, backend):
+        self.io.close()
+        super().teardown(number_rois, representation, backend)
+
+    def time_read_all(self, number_rois, representation, backend):
+        if representation in _MASK_REPRESENTATIONS:
+            self.series.get_image_masks()
+        elif representation == 'centers':
+            np.asarray(self.series.center_rois[:])
+        else:
+            np.asarray(self.series.pixel_rois[:])
+
+    def peakmem_read_all(self, number_rois, representation, backend):
+        self.time_read_all(number_rois, representation, backend)
+
+    def time_read_roi(self, number_rois, representation, backend):
+        if representation in _MASK_REPRESENTATIONS:
+            self.series.get_roi(self.roi)
+        elif representation == 'centers':
+            np.asarray(self.series.center_rois[self.roi])
+        else:
+            self.series.get_roi_pixels(self.roi)
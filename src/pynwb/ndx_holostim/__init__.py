@@ -1,6 +1,5 @@
 from importlib.resources import files
 import os
-from pynwb import load_namespaces, get_class
 
 # Get path to the namespace.yaml file with the expected location when installed not in editable mode
 __location_of_this_file = files(__name__)
@@ -10,31 +9,33 @@ __spec_path = __location_of_this_file / 'spec' / 'ndx-holostim.namespace.yaml'
 if not os.path.exists(__spec_path):
     __spec_path = __location_of_this_file.parent.parent.parent / 'spec' / 'ndx-holostim.namespace.yaml'
 
-# Load the namespace
-load_namespaces(str(__spec_path))
+# Load the namespace, reading the parsed spec from the cache when possible
+from .namespace import load_cached_namespace  # noqa: E402
 
-# TODO: Define your classes here to make them accessible at the package level.
-# Either have PyNWB generate a class from the spec using `get_class` as shown
-# below or write a custom class and register it using the class decorator
-# `@register_class('TetrodeSeries', 'ndx-holostim')`
-OptogeneticStimulusPattern = get_class('OptogeneticStimulusPattern', 'ndx-holostim')
-SpiralScanning = get_class('SpiralScanning', 'ndx-holostim')
-TemporalFocusing = get_class('TemporalFocusing', 'ndx-holostim')
-PatternedOptogeneticStimulusSite = get_class('PatternedOptogeneticStimulusSite', 'ndx-holostim')
-PatternedOptogeneticSeries = get_class('PatternedOptogeneticSeries', 'ndx-holostim')
-SpatialLightModulator = get_class('SpatialLightModulator', 'ndx-holostim')
-LightSource = get_class('LightSource', 'ndx-holostim')
+load_cached_namespace(str(__spec_path))
 
-# TODO: Add all classes to __all__ to make them accessible at the package level
+# Classes must be registered before any file is read, so they are all imported here
+from .devices import LightSource, SpatialLightModulator  # noqa: E402
+from .patterns import OptogeneticStimulusPattern, SpiralScanning, TemporalFocusing  # noqa: E402
+from .site import PatternedOptogeneticStimulusSite  # noqa: E402
+from .events import PatternedOptogeneticStimulusTable  # noqa: E402
+from .library import StimulusPatternLibrary  # noqa: E402
+from .pyramid import RoiMaskPyramid  # noqa: E402
+from .series import PatternedOptogeneticSeries  # noqa: E402
+
+# every neurodata type of the extension, in the order of the spec
 __all__ = [
     'OptogeneticStimulusPattern',
     'SpiralScanning',
     'TemporalFocusing',
     'PatternedOptogeneticStimulusSite',
+    'PatternedOptogeneticStimulusTable',
+    'StimulusPatternLibrary',
+    'RoiMaskPyramid',
     'PatternedOptogeneticSeries',
     'SpatialLightModulator',
-    'LightSource'
+    'LightSource',
 ]
 
 # Remove these functions/modules from the package
-del load_namespaces, get_class, files, os, __location_of_this_file, __spec_path
+del load_cached_namespace, files, os, __location_of_this_file, __spec_path
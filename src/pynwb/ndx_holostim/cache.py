@@ -0,0 +1,213 @@
+"""Persistent cache of the metadata extracted by :py:func:`ndx_holostim.scan.scan_file`.
+
+:py:class:`ScanCache` stores the result of scanning each file in an SQLite database, keyed by the path, size and
+modification time of the file and by a hash of its content. A file whose path, size and modification time are
+unchanged is served from the cache without being opened, so unchanged files are never scanned twice.
+
+By default the content hash is a fingerprint of the size and of the first and last :py:data:`FINGERPRINT_BYTES` of
+the file, which holds the HDF5 superblock and the most recently written objects and costs a couple of reads. A
+fingerprint does not see edits in the middle of a file that keep its size, so it is combined with the modification
+time and any change of size or modification time makes the file be scanned again. Pass ``full_hash=True`` to hash
+the whole file instead, at the cost of reading it entirely each time it changed: a cached result is then reused when
+the content is the same, e.g. after the file was copied or touched.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+from .namespace import get_cache_dir
+
+# bytes read from each end of a file to compute its fingerprint
+FINGERPRINT_BYTES = 1024**2
+
+# version of the database layout and of the scan results. Databases of another version are cleared on open.
+_SCHEMA_VERSION = 2
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)",
+    "CREATE TABLE IF NOT EXISTS scans (hash TEXT PRIMARY KEY, rows TEXT)",
+    "CREATE TABLE IF NOT EXISTS rois (hash TEXT, series TEXT, centers BLOB)",
+    "CREATE INDEX IF NOT EXISTS rois_hash ON rois (hash)",
+)
+
+
+def file_hash(path, full_hash=False):
+    """Return the hash of the content of a file used as a key of :py:class:`ScanCache`.
+
+    :param path: path to the file
+    :param full_hash: if True, the SHA-1 digest of the whole file. Otherwise the SHA-1 digest of the size and of the
+        first and last :py:data:`FINGERPRINT_BYTES` of the file.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as stream:
+        if full_hash:
+            for block in iter(lambda: stream.read(FINGERPRINT_BYTES), b''):
+                digest.update(block)
+            return 'sha1:' + digest.hexdigest()
+        size = os.fstat(stream.fileno()).st_size
+        digest.update(str(size).encode('ascii'))
+        digest.update(stream.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            stream.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(stream.read(FINGERPRINT_BYTES))
+    return 'fp:' + digest.hexdigest()
+
+
+class ScanCache:
+    """SQLite cache of the metadata of NWB files, see :py:func:`ndx_holostim.scan.scan_files`.
+
+    :param path: path to the database. Defaults to ``scan-cache.sqlite`` in the directory of
+        :py:func:`ndx_holostim.namespace.get_cache_dir`, or to an in-memory database if the cache is disabled.
+    :param full_hash: whether to hash the whole content of files instead of a fingerprint, see
+        :py:func:`file_hash`. Only full hashes let the cached scan of a file be reused after its modification time
+        changed.
+    """
+
+    def __init__(self, path=None, full_hash=False):
+        if path is None:
+            cache_dir = get_cache_dir()
+            if cache_dir is None:
+                path = ':memory:'
+            else:
+                os.makedirs(cache_dir, exist_ok=True)
+                path = os.path.join(cache_dir, 'scan-cache.sqlite')
+        self.path = os.fspath(path)
+        self.full_hash = full_hash
+        self._connection = sqlite3.connect(self.path)
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+            for table in ('files', 'scans', 'rois'):
+                self._connection.execute("DROP TABLE IF EXISTS %s" % table)
+            self._connection.execute("PRAGMA user_version = %d" % _SCHEMA_VERSION)
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        self._connection.commit()
+        # stat and hash of the files looked up but not found, so that storing their scan does not hash them again
+        self._pending = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        """Close the database."""
+        self._connection.close()
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._connection:
+            for table in ('files', 'scans', 'rois'):
+                self._connection.execute("DELETE FROM %s" % table)
+        self._pending.clear()
+
+    def get(self, path):
+        """Return the cached scan of a file, or None if the file was never scanned or has changed.
+
+        :param path: path to the file
+        :returns: the rows returned by :py:func:`ndx_holostim.scan.scan_file`
+        """
+        return self.get_many([path])[0]
+
+    def get_many(self, paths):
+        """Return the cached scans of many files, reading the database with a few bulk queries.
+
+        :param paths: paths to the files
+        :returns: list with the rows of each file, or None for the files that have to be scanned
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        known = self._select("SELECT path, size, mtime_ns, hash FROM files WHERE path IN (%s)", paths)
+        known = {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest in known}
+        digests = [None] * len(paths)
+        updated = []
+        for number, path in enumerate(paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = known.get(path)
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                digests[number] = entry[2]
+                continue
+            try:
+                digest = self._content_key(path, stat)
+            except OSError:
+                continue
+            self._pending[path] = (stat.st_size, stat.st_mtime_ns, digest)
+            digests[number] = digest
+            updated.append(path)
+        scans = dict(self._select("SELECT hash, rows FROM scans WHERE hash IN (%s)", set(filter(None, digests))))
+        rois = dict()
+        for digest, series, centers in self._select("SELECT hash, series, centers FROM rois WHERE hash IN (%s)",
+                                                    scans):
+            rois.setdefault(digest, []).append((series, np.frombuffer(centers, dtype=np.float64).reshape(-1, 4)))
+        # files whose content is unchanged, according to their full hash, are up to date again
+        with self._connection:
+            for path in updated:
+                if self._pending[path][2] in scans:
+                    entry = self._pending.pop(path)
+                    self._connection.execute("REPLACE INTO files VALUES (?, ?, ?, ?)", (path,) + entry)
+        results = []
+        for digest in digests:
+            if digest not in scans:
+                results.append(None)
+                continue
+            rows = json.loads(scans[digest])
+            rows['rois'] = rois.get(digest, [])
+            results.append(rows)
+        return results
+
+    def put(self, path, rows):
+        """Store the scan of a file.
+
+        :param path: path to the file
+        :param rows: the rows returned by :py:func:`ndx_holostim.scan.scan_file`
+        """
+        self.put_many([path], [rows])
+
+    def put_many(self, paths, results):
+        """Store the scans of many files in a single transaction.
+
+        :param paths: paths to the files
+        :param results: the rows returned by :py:func:`ndx_holostim.scan.scan_file` for each file
+        """
+        with self._connection:
+            for path, rows in zip(paths, results):
+                path = os.path.abspath(path)
+                entry = self._pending.pop(path, None)
+                if entry is None:
+                    stat = os.stat(path)
+                    entry = (stat.st_size, stat.st_mtime_ns, self._content_key(path, stat))
+                digest = entry[2]
+                tables = {table: table_rows for table, table_rows in rows.items() if table != 'rois'}
+                self._connection.execute("REPLACE INTO files VALUES (?, ?, ?, ?)", (path,) + entry)
+                self._connection.execute("REPLACE INTO scans VALUES (?, ?)", (digest, json.dumps(tables)))
+                self._connection.execute("DELETE FROM rois WHERE hash = ?", (digest,))
+                self._connection.executemany(
+                    "INSERT INTO rois VALUES (?, ?, ?)",
+                    [(digest, series, np.ascontiguousarray(centers, dtype=np.float64).tobytes())
+                     for series, centers in rows['rois']],
+                )
+
+    def _content_key(self, path, stat):
+        """Return the key of the scan of a file in the ``scans`` and ``rois`` tables."""
+        digest = file_hash(path, full_hash=self.full_hash)
+        if self.full_hash:
+            return digest
+        # a fingerprint misses same-size edits in the middle of the file, so it only holds for this modification time
+        return '%s@%d' % (digest, stat.st_mtime_ns)
+
+    def _select(self, query, values):
+        """Run a query with an ``IN (%s)`` clause over many values, in batches within the SQLite variable limit."""
+        values = list(values)
+        found = []
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            found.extend(self._connection.execute(query % ", ".join("?" * len(batch)), batch).fetchall())
+        return found
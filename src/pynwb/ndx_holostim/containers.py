@@ -0,0 +1,195 @@
+"""Batch construction of containers without docval validation of every object.
+
+Constructing a container goes through the docval validation of each ``__init__`` in its class hierarchy and of
+each field setter, which dominates the cost of creating thousands of small objects such as stimulus patterns. The
+helpers below validate whole columns of arguments once, against the docval of the class, and then create the
+objects directly.
+
+Creating objects directly skips their ``__init__``, so it is only allowed for the classes registered with
+:py:func:`fields_only_init`, whose constructor does nothing else than setting fields from its arguments. Subclasses
+are not registered with their parent: a subclass that validates or derives values in its constructor must not be
+created this way.
+
+The direct creation relies on two HDMF internals, true from HDMF 3.14 to 6.2: ``AbstractContainer.__init__`` sets up
+all the state a container needs apart from its fields, and ``AbstractContainer.fields`` is the dict that the field
+setters fill. Both are checked at run time: the first container of every batch is created by the public constructor,
+and the others are only created directly if a container created directly has the same instance attributes and
+fields. Otherwise all containers are created by the public constructor, which is slower but always correct.
+"""
+import numpy as np
+from hdmf.container import AbstractContainer
+from hdmf.utils import get_docval
+
+# classes whose constructor only sets fields from its arguments, see fields_only_init
+_FIELD_ONLY_CLASSES = set()
+
+
+def _termset_config_loaded():
+    """Return whether a TermSet configuration is loaded, in which case field setters may wrap values."""
+    try:
+        from hdmf.common import get_type_map
+
+        return bool(get_type_map(copy=False).type_config.paths)
+    except (AttributeError, TypeError):  # HDMF versions without type configuration
+        return False
+
+
+def fields_only_init(cls):
+    """Class decorator allowing :py:func:`containers_from_arrays` for ``cls``.
+
+    Only apply it to classes whose constructor, and the constructors of their parents, do nothing else than setting
+    fields from their arguments.
+    """
+    _FIELD_ONLY_CLASSES.add(cls)
+    return cls
+
+
+def _ndim(value):
+    """Return the number of dimensions of an array-like, or None if it is ragged."""
+    try:
+        return np.ndim(value)
+    except ValueError:
+        return None
+
+
+def _check_array_column(arg, values, number):
+    """Validate one column of array arguments, either one array shared by all containers or one array per name."""
+    name, shape = arg['name'], arg['shape']
+    ndim = len(shape)
+    if (isinstance(values, (list, tuple)) and len(values) and _ndim(values) != ndim
+            and all(value is None or _ndim(value) == ndim for value in values)) or _ndim(values) == ndim + 1:
+        if len(values) != number:
+            raise ValueError("'%s' must have one value per name, got %d values for %d names"
+                             % (name, len(values), number))
+        values = [None if value is None else np.asarray(value) for value in values]
+    elif values is None or _ndim(values) == ndim:
+        values = [None if values is None else np.asarray(values)] * number
+    else:
+        raise ValueError("'%s' must be an array of shape %s, or one such array per name" % (name, shape))
+    for value in values:
+        if value is None:
+            if 'default' not in arg:
+                raise TypeError("'%s' must be an array" % name)
+        elif value.dtype.kind not in 'biuf':
+            raise TypeError("'%s' must be numeric, got dtype %s" % (name, value.dtype))
+        elif any(expected is not None and size != expected for size, expected in zip(value.shape, shape)):
+            raise ValueError("'%s' must be an array of shape %s, got shape %s" % (name, shape, value.shape))
+    return values
+
+
+def _check_column(arg, values, number):
+    """Validate one column of arguments against its docval specification and return a list of Python values."""
+    name, types = arg['name'], arg['type']
+    types = types if isinstance(types, tuple) else (types,)
+    if isinstance(arg.get('shape'), tuple) and all(size is None or isinstance(size, int) for size in arg['shape']):
+        return _check_array_column(arg, values, number)
+    if isinstance(values, (list, tuple, np.ndarray)):
+        if len(values) != number:
+            raise ValueError("'%s' must have one value per name, got %d values for %d names"
+                             % (name, len(values), number))
+    else:
+        values = [values] * number
+    classes = tuple(t for t in types if isinstance(t, type) and not issubclass(t, (str, int, float, np.generic)))
+    if str in types:
+        if not all(isinstance(value, str) or (value is None and 'default' in arg) for value in values):
+            raise TypeError("'%s' must be str" % name)
+        return list(values)
+    if float in types or int in types:
+        array = np.asarray(values)
+        kinds = 'iu' if float not in types else 'iuf'
+        if array.dtype.kind not in kinds:
+            raise TypeError("'%s' must be %s, got dtype %s" % (name, 'float' if float in types else 'int',
+                                                               array.dtype))
+        return array.astype(np.float64 if float in types else np.int64).tolist()
+    if classes:
+        if not all(isinstance(value, classes) or (value is None and 'default' in arg) for value in values):
+            raise TypeError("'%s' must be %s" % (name, " or ".join(c.__name__ for c in classes)))
+        return list(values)
+    raise TypeError("'%s' is not supported by from_arrays" % name)
+
+
+def containers_from_arrays(cls, names, **kwargs):
+    """Create many containers of ``cls``, validating each argument once for all containers.
+
+    Each keyword argument of the constructor of ``cls`` is either a single value shared by all containers or a
+    sequence with one value per name. Array arguments are either a single array shared by all containers or a
+    sequence with one array (or None) per name. Arguments are checked against the docval of ``cls.__init__`` as
+    whole columns. The first container is then created by the constructor and the others without calling
+    ``__init__``, so this only applies to classes registered with :py:func:`fields_only_init`.
+
+    :param cls: the container class
+    :param names: the name of each container
+    :returns: list of containers
+    :raises TypeError: if ``cls`` is not registered with :py:func:`fields_only_init`
+    """
+    if cls not in _FIELD_ONLY_CLASSES:
+        raise TypeError("%s cannot be created from arrays, its constructor does more than setting fields"
+                        % cls.__name__)
+    names = [str(name) for name in names]
+    return _build_containers(cls, names, _check_columns(cls, len(names), kwargs))
+
+
+def _check_columns(cls, number, kwargs):
+    """Validate the arguments of ``number`` containers of ``cls`` and return a dict of columns of values.
+
+    Arguments that are not given and default to None have no column.
+    """
+    kwargs = dict(kwargs)
+    columns = dict()
+    for arg in get_docval(cls.__init__):
+        if arg['name'] == 'name':
+            continue
+        if arg['name'] not in kwargs:
+            if 'default' not in arg:
+                raise TypeError("missing argument '%s'" % arg['name'])
+            if arg['default'] is not None:
+                columns[arg['name']] = [arg['default']] * number
+            continue
+        columns[arg['name']] = _check_column(arg, kwargs.pop(arg['name']), number)
+    if kwargs:
+        raise TypeError("unrecognized arguments: %s" % ", ".join(sorted(kwargs)))
+    return columns
+
+
+def _build_containers(cls, names, columns):
+    """Create containers of ``cls`` from validated columns of field values, bypassing ``__init__`` where possible.
+
+    The first container is created by the public constructor and serves as the reference for the others, see the
+    module docstring. Classes that are not registered with :py:func:`fields_only_init` may only use this after doing
+    the checks and derivations of their constructor on the columns, see
+    :py:meth:`ndx_holostim.TemporalFocusing.from_arrays`.
+    """
+    if not names:
+        return list()
+    reference = cls(name=names[0], **_row(columns, 0))
+    use_setters = _termset_config_loaded()
+    if not _matches_direct_creation(reference, columns, use_setters):
+        return [reference] + [cls(name=name, **_row(columns, row)) for row, name in enumerate(names[1:], 1)]
+    return [reference] + [_new_container(cls, name, columns, row, use_setters)
+                          for row, name in enumerate(names[1:], 1)]
+
+
+def _matches_direct_creation(reference, columns, use_setters):
+    """Return whether creating the first row without ``__init__`` gives the same container as the constructor."""
+    try:
+        probe = _new_container(type(reference), reference.name, columns, 0, use_setters)
+        return vars(probe).keys() == vars(reference).keys() and probe.fields.keys() == reference.fields.keys()
+    except (AttributeError, TypeError):  # HDMF internals differ from the ones described in the module docstring
+        return False
+
+
+def _row(columns, row):
+    """Return the constructor arguments of one row of columns, leaving out the values that default to None."""
+    return {field: values[row] for field, values in columns.items() if values[row] is not None}
+
+
+def _new_container(cls, name, columns, row, use_setters):
+    """Create a container of ``cls`` without calling its ``__init__`` and set its fields from one row of columns."""
+    container = cls.__new__(cls)
+    AbstractContainer.__init__(container, name=name)
+    for field, value in _row(columns, row).items():
+        if use_setters:
+            setattr(container, field, value)
+        else:
+            container.fields[field] = value
+    return container
@@ -0,0 +1,214 @@
+"""Vectorized conversions between the ROI representations of PatternedOptogeneticSeries.
+
+The series can describe the same ROIs as masks (``image_mask_roi``), as centers and radii (``center_rois``,
+``[x, y, z, r]``) or as lists of pixels (``pixel_rois``, ``[x, y, z]``). The functions below convert between
+these representations for all ROIs at once, without Python loops over ROIs or pixels.
+
+Pixel lists are represented as a ragged array: ``pixels`` of shape (number_pixels, 3) holds the pixels of all
+ROIs concatenated and ``index`` holds the end offset of each ROI in ``pixels``, following the NWB ragged array
+convention (``VectorData`` / ``VectorIndex``).
+"""
+import numpy as np
+
+# maximum number of candidate pixels evaluated at once when rasterizing centers
+_MAX_CANDIDATES = 2**22
+
+
+def _starts(index):
+    index = np.asarray(index, dtype=np.int64)
+    return np.concatenate(([0], index[:-1])), index
+
+
+def _roi_numbers(index):
+    starts, stops = _starts(index)
+    return np.repeat(np.arange(len(index)), stops - starts)
+
+
+def _as_4d(masks):
+    masks = np.asarray(masks)
+    if masks.ndim == 3:
+        masks = masks[..., np.newaxis]
+    if masks.ndim != 4:
+        raise ValueError("masks must have shape (number_rois, x, y) or (number_rois, x, y, z), got %s"
+                         % str(masks.shape))
+    return masks
+
+
+def centers_to_pixels(center_rois, mask_shape=None):
+    """Rasterize ROI centers and radii into the pixels of a disk in the plane of each ROI.
+
+    A pixel belongs to a ROI if its distance to the center, in the x-y plane, is at most the radius. The z
+    coordinate of the center is rounded to select the plane.
+
+    :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI. An array of shape
+        (number_rois, 3) is interpreted as [x, y, r] in plane 0.
+    :param mask_shape: [x, y, z] shape of the field of view. If given, pixels outside of it are dropped.
+    :returns: tuple ``(pixels, index)`` with int64 pixels of shape (number_pixels, 3)
+    """
+    center_rois = np.asarray(center_rois, dtype=np.float64)
+    if center_rois.ndim != 2 or center_rois.shape[1] not in (3, 4):
+        raise ValueError("center_rois must have shape (number_rois, 4) or (number_rois, 3), got %s"
+                         % str(center_rois.shape))
+    if center_rois.shape[1] == 3:
+        center_rois = np.insert(center_rois, 2, 0, axis=1)
+    if len(center_rois) == 0:
+        return np.zeros((0, 3), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # candidate offsets on a square grid large enough for the largest ROI, shared by all ROIs
+    reach = int(np.ceil(center_rois[:, 3].max())) + 1
+    grid = np.arange(-reach, reach + 1)
+    offsets = np.stack(np.meshgrid(grid, grid, indexing='ij'), axis=-1).reshape(-1, 2)
+    # process the ROIs in batches so that the candidate grid stays within a few tens of MB
+    batch_size = max(1, _MAX_CANDIDATES // len(offsets))
+    pixels, counts = [], []
+    for start in range(0, len(center_rois), batch_size):
+        batch_pixels, batch_counts = _rasterize_disks(center_rois[start:start + batch_size], offsets, mask_shape)
+        pixels.append(batch_pixels)
+        counts.append(batch_counts)
+    return np.concatenate(pixels), np.cumsum(np.concatenate(counts))
+
+
+def _rasterize_disks(center_rois, offsets, mask_shape):
+    xy, z, radius = center_rois[:, :2], np.rint(center_rois[:, 2]).astype(np.int64), center_rois[:, 3]
+    candidates = np.rint(xy).astype(np.int64)[:, np.newaxis, :] + offsets  # (number_rois, candidates, 2)
+    inside = ((candidates - xy[:, np.newaxis, :]) ** 2).sum(axis=-1) <= radius[:, np.newaxis] ** 2
+    if mask_shape is not None:
+        inside &= (candidates >= 0).all(axis=-1) & (candidates < np.asarray(mask_shape[:2])).all(axis=-1)
+        inside &= ((z >= 0) & (z < mask_shape[2]))[:, np.newaxis]
+    rois, columns = np.nonzero(inside)
+    return np.column_stack((candidates[rois, columns], z[rois])), inside.sum(axis=1)
+
+
+def pixels_to_masks(pixels, index, mask_shape):
+    """Expand ragged pixel lists into dense boolean masks.
+
+    :param pixels: array of shape (number_pixels, 3) or (number_pixels, 2) with the pixels of all ROIs
+    :param index: end offset of each ROI in ``pixels``
+    :param mask_shape: [x, y, z] shape of one mask
+    :returns: boolean array of shape (number_rois, x, y, z)
+    """
+    pixels = np.asarray(pixels, dtype=np.int64)
+    if pixels.ndim == 2 and pixels.shape[1] == 2:
+        pixels = np.column_stack((pixels, np.zeros(len(pixels), dtype=np.int64)))
+    masks = np.zeros((len(index),) + tuple(int(s) for s in mask_shape), dtype=bool)
+    masks[(_roi_numbers(index),) + tuple(pixels.T)] = True
+    return masks
+
+
+def masks_to_pixels(masks):
+    """Convert ROI masks into ragged pixel lists.
+
+    :param masks: array of shape (number_rois, x, y) or (number_rois, x, y, z). Non-zero values belong to the ROI.
+    :returns: tuple ``(pixels, index)`` with int64 pixels of shape (number_pixels, 3) in C order within each ROI
+    """
+    masks = _as_4d(masks)
+    rois, x, y, z = np.nonzero(masks)
+    return np.column_stack((x, y, z)), np.cumsum(np.bincount(rois, minlength=len(masks)))
+
+
+def pixels_to_centers(pixels, index):
+    """Fit a center and a radius to each ROI from its pixels.
+
+    The center is the centroid of the pixels and the radius is the radius of the disk with the same area as the
+    ROI in its plane, i.e. ``sqrt(number_pixels_per_plane / pi)``. Empty ROIs get NaN centers and a zero radius.
+
+    :param pixels: array of shape (number_pixels, 3) with the pixels of all ROIs
+    :param index: end offset of each ROI in ``pixels``
+    :returns: float64 array of shape (number_rois, 4) holding [x, y, z, r]
+    """
+    pixels = np.asarray(pixels, dtype=np.float64)
+    rois = _roi_numbers(index)
+    number_rois = len(index)
+    counts = np.bincount(rois, minlength=number_rois).astype(np.float64)
+    centers = np.full((number_rois, 4), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for axis in range(3):
+            centers[:, axis] = np.bincount(rois, weights=pixels[:, axis], minlength=number_rois) / counts
+        # number of distinct planes spanned by each ROI, to get the area in a single plane
+        plane_keys = np.unique(np.column_stack((rois, pixels[:, 2])), axis=0)
+        planes = np.maximum(np.bincount(plane_keys[:, 0].astype(np.int64), minlength=number_rois), 1)
+    centers[:, 3] = np.sqrt(counts / planes / np.pi)
+    return centers
+
+
+def masks_to_centers(masks):
+    """Fit a center and a radius to each ROI mask. See :py:func:`pixels_to_centers`.
+
+    :param masks: array of shape (number_rois, x, y) or (number_rois, x, y, z)
+    :returns: float64 array of shape (number_rois, 4) holding [x, y, z, r]
+    """
+    return pixels_to_centers(*masks_to_pixels(masks))
+
+
+def centers_to_masks(center_rois, mask_shape):
+    """Rasterize ROI centers and radii into dense boolean masks. See :py:func:`centers_to_pixels`.
+
+    :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI
+    :param mask_shape: [x, y, z] shape of one mask
+    :returns: boolean array of shape (number_rois, x, y, z)
+    """
+    return pixels_to_masks(*centers_to_pixels(center_rois, mask_shape=mask_shape), mask_shape)
+
+
+def pixels_to_sparse(pixels, index, mask_shape):
+    """Convert ragged pixel lists into the sparse mask encoding of ``image_mask_roi_indices``.
+
+    :param pixels: array of shape (number_pixels, 3) with the pixels of all ROIs
+    :param index: end offset of each ROI in ``pixels``
+    :param mask_shape: [x, y, z] shape of one mask
+    :returns: tuple ``(indices, index)`` of uint32 arrays
+    """
+    indices = np.ravel_multi_index(tuple(np.asarray(pixels, dtype=np.int64).T), tuple(int(s) for s in mask_shape))
+    return indices.astype(np.uint32), np.asarray(index, dtype=np.uint32)
+
+
+def sparse_to_pixels(indices, index, mask_shape):
+    """Convert the sparse mask encoding of ``image_mask_roi_indices`` into ragged pixel lists.
+
+    :param indices: flat pixel indices of all ROIs
+    :param index: end offset of each ROI in ``indices``
+    :param mask_shape: [x, y, z] shape of one mask
+    :returns: tuple ``(pixels, index)`` with int64 pixels of shape (number_pixels, 3)
+    """
+    coords = np.unravel_index(np.asarray(indices, dtype=np.int64), tuple(int(s) for s in mask_shape))
+    return np.column_stack(coords), np.asarray(index, dtype=np.int64)
+
+
+def group_rois_by_plane(rois, planes, number_planes=None):
+    """Group ROI numbers by imaging plane into the ragged ``plane_rois`` / ``plane_rois_index`` encoding.
+
+    :param rois: ROI number of each (ROI, plane) pair. A ROI may be paired with several planes.
+    :param planes: plane of each pair
+    :param number_planes: number of planes. Defaults to the highest plane plus one.
+    :returns: tuple ``(plane_rois, plane_rois_index)`` of uint32 arrays, with the ROIs sorted within each plane
+    """
+    rois = np.asarray(rois, dtype=np.int64).ravel()
+    planes = np.asarray(planes, dtype=np.int64).ravel()
+    if len(planes) and planes.min() < 0:
+        raise ValueError("planes must be non-negative")
+    if number_planes is None:
+        number_planes = int(planes.max()) + 1 if len(planes) else 0
+    elif len(planes) and planes.max() >= number_planes:
+        raise ValueError("plane %d is out of range for %d planes" % (planes.max(), number_planes))
+    order = np.lexsort((rois, planes))
+    plane_rois_index = np.cumsum(np.bincount(planes, minlength=number_planes))
+    return rois[order].astype(np.uint32), plane_rois_index.astype(np.uint32)
+
+
+def centers_to_plane_index(center_rois, number_planes=None):
+    """Group ROIs by the plane of their center, i.e. the rounded z coordinate.
+
+    :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI. An array of shape
+        (number_rois, 3) is interpreted as [x, y, r] in plane 0. ROIs with a NaN z, e.g. empty ROIs, are left out.
+    :param number_planes: number of planes. Defaults to the highest plane plus one.
+    :returns: tuple ``(plane_rois, plane_rois_index)``, see :py:func:`group_rois_by_plane`
+    """
+    center_rois = np.asarray(center_rois, dtype=np.float64)
+    if center_rois.ndim != 2 or center_rois.shape[1] not in (3, 4):
+        raise ValueError("center_rois must have shape (number_rois, 4) or (number_rois, 3), got %s"
+                         % str(center_rois.shape))
+    if center_rois.shape[1] == 3:
+        return group_rois_by_plane(np.arange(len(center_rois)), np.zeros(len(center_rois)), number_planes)
+    z = center_rois[:, 2]
+    rois = np.flatnonzero(~np.isnan(z))
+    return group_rois_by_plane(rois, np.rint(z[rois]), number_planes)
+
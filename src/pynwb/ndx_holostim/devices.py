@@ -0,0 +1,67 @@
+import numpy as np
+from hdmf.utils import docval, get_docval, popargs_to_dict
+from pynwb import register_class
+from pynwb.device import Device
+
+_FLOAT = (float, np.float32, np.float64)
+
+# Device arguments accepted by every supported version of PyNWB. Later versions add more (e.g. model_name), which are
+# not spliced in so that the docval of the extension types does not depend on the installed version.
+_DEVICE_ARGS = ('description', 'manufacturer')
+
+
+@register_class('SpatialLightModulator', 'ndx-holostim')
+class SpatialLightModulator(Device):
+    """An extension of Device to include the Spatial Light Modulator metadata"""
+
+    # PyNWB >= 3 declares model_name on Device too
+    __nwbfields__ = ('resolution', 'dimensions') + (() if 'model_name' in Device.__nwbfields__ else ('model_name',))
+
+    @docval(
+        *get_docval(Device.__init__, 'name'),
+        {'name': 'resolution', 'type': _FLOAT, 'doc': 'Resolution of the Spatial Light Modulator in um'},
+        {'name': 'model_name', 'type': str, 'doc': 'Model of the Spatial Light Modulator'},
+        *get_docval(Device.__init__, *_DEVICE_ARGS),
+        {'name': 'dimensions', 'type': ('array_data', 'data'), 'shape': (2,), 'default': None,
+         'doc': 'number of pixels [x, y] of the Spatial Light Modulator'},
+    )
+    def __init__(self, **kwargs):
+        fields = popargs_to_dict(('resolution', 'model_name', 'dimensions'), kwargs)
+        super().__init__(**kwargs)
+        for key, val in fields.items():
+            setattr(self, key, val)
+
+
+@register_class('LightSource', 'ndx-holostim')
+class LightSource(Device):
+    """An extension of Device to include the Light Source metadata"""
+
+    __nwbfields__ = (
+        'stimulation_wavelength',
+        'filter_description',
+        'peak_power',
+        'intensity',
+        'exposure_time',
+        'pulse_rate',
+    )
+
+    @docval(
+        *get_docval(Device.__init__, 'name'),
+        {'name': 'stimulation_wavelength', 'type': _FLOAT, 'doc': 'stimulation wavelength in nm'},
+        {'name': 'filter_description', 'type': str, 'doc': 'description of the filter'},
+        *get_docval(Device.__init__, *_DEVICE_ARGS),
+        {'name': 'peak_power', 'type': _FLOAT, 'doc': 'peak power of the stimulation in W', 'default': None},
+        {'name': 'intensity', 'type': _FLOAT, 'doc': 'intensity of the excitation in W/m^2', 'default': None},
+        {'name': 'exposure_time', 'type': _FLOAT, 'doc': 'exposure time of the sample', 'default': None},
+        {'name': 'pulse_rate', 'type': _FLOAT,
+         'doc': 'pulse rate of the light source, if the light source is a pulsed laser', 'default': None},
+    )
+    def __init__(self, **kwargs):
+        fields = popargs_to_dict(
+            ('stimulation_wavelength', 'filter_description', 'peak_power', 'intensity', 'exposure_time',
+             'pulse_rate'),
+            kwargs,
+        )
+        super().__init__(**kwargs)
+        for key, val in fields.items():
+            setattr(self, key, val)
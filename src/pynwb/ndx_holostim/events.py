@@ -0,0 +1,253 @@
+import numpy as np
+from hdmf.common import ElementIdentifiers, VectorData
+from hdmf.utils import docval, get_docval, popargs
+from pynwb import register_class
+from pynwb.epoch import TimeIntervals
+
+from .io import wrap_time_data
+
+
+def expand_stimulus_pattern(pattern, train_start_times, rois):
+    """Expand the parameters of a stimulus pattern into individual pulses, one per presentation and ROI.
+
+    Each train starts at one of ``train_start_times`` and presents the stimulus ``number_of_stimulus_presentation``
+    times. Every presentation lasts ``duration`` and is followed by ``inter_stimulus_interval`` before the next one.
+    All ROIs are stimulated simultaneously by each presentation. The expansion is done with array broadcasting, so
+    millions of pulses are generated in a single call.
+
+    :param pattern: an OptogeneticStimulusPattern, or any object with duration, number_of_stimulus_presentation and
+        inter_stimulus_interval attributes
+    :param train_start_times: start time of each train, in seconds
+    :param rois: indices of the ROIs stimulated by the pattern
+    :returns: tuple ``(start_time, stop_time, roi)`` of arrays sorted by start_time
+    """
+    train_start_times = np.asarray(train_start_times, dtype=np.float64).ravel()
+    rois = np.asarray(rois, dtype=np.uint32).ravel()
+    period = float(pattern.duration) + float(pattern.inter_stimulus_interval)
+    presentations = np.arange(int(pattern.number_of_stimulus_presentation)) * period
+    onsets = (train_start_times[:, np.newaxis] + presentations).ravel()
+    order = np.argsort(onsets, kind='stable')
+    start_time = np.repeat(onsets[order], len(rois))
+    stop_time = start_time + float(pattern.duration)
+    roi = np.tile(rois, len(onsets))
+    return start_time, stop_time, roi
+
+
+def _index_column(values, dtype, name):
+    """Cast a column of indices to the unsigned integer dtype of the spec, raising instead of wrapping around."""
+    values = np.asarray(values)
+    limit = np.iinfo(dtype).max
+    if len(values) and (values.min() < 0 or values.max() > limit):
+        raise ValueError("'%s' must be between 0 and %d, got values between %s and %s"
+                         % (name, limit, values.min(), values.max()))
+    return values.astype(dtype)
+
+
+def build_interval_index(start_time, stop_time):
+    """Return the running maximum of ``stop_time``, which indexes intervals sorted by ``start_time``.
+
+    :param start_time: onset of each interval, sorted
+    :param stop_time: offset of each interval
+    :returns: float64 array of the latest offset of each interval and all earlier ones
+    """
+    start_time = np.asarray(start_time, dtype=np.float64)
+    if np.any(start_time[1:] < start_time[:-1]):
+        raise ValueError("start_time must be sorted to build an interval index")
+    return np.maximum.accumulate(np.asarray(stop_time, dtype=np.float64))
+
+
+def query_interval_index(start_time, max_stop_time, stop_time, start, stop=None):
+    """Find the intervals active at a batch of times, or overlapping a batch of time ranges.
+
+    Intervals are sorted by ``start_time`` and indexed by ``max_stop_time`` (see :py:func:`build_interval_index`).
+    Both columns are non-decreasing, so two binary searches bound the candidate rows of each query, which are then
+    checked against ``stop_time``. All queries are processed at once, in O(log n) per query plus the number of
+    candidate rows.
+
+    :param start_time: onset of each interval, sorted
+    :param max_stop_time: running maximum of stop_time
+    :param stop_time: offset of each interval
+    :param start: query times, or the start of the query ranges if ``stop`` is given
+    :param stop: end of the query ranges. If None, ``start`` holds point queries.
+    :returns: tuple ``(rows, index)`` with the rows matching all queries concatenated and the end offset of the
+        rows of each query. Point queries match intervals with start_time <= t < stop_time and range queries match
+        intervals with start_time < stop and stop_time > start.
+    """
+    start_time = np.asarray(start_time, dtype=np.float64)
+    max_stop_time = np.asarray(max_stop_time, dtype=np.float64)
+    stop_time = np.asarray(stop_time, dtype=np.float64)
+    start = np.atleast_1d(np.asarray(start, dtype=np.float64))
+    if stop is None:
+        last = np.searchsorted(start_time, start, side='right')
+    else:
+        stop = np.broadcast_to(np.asarray(stop, dtype=np.float64), start.shape)
+        last = np.searchsorted(start_time, stop, side='left')
+    # all the rows before first end at or before the query, so none of them can match
+    first = np.searchsorted(max_stop_time, start, side='right')
+    counts = np.maximum(last - first, 0)
+    query = np.repeat(np.arange(len(start)), counts)
+    rows = np.arange(counts.sum()) + np.repeat(first - (np.cumsum(counts) - counts), counts)
+    keep = stop_time[rows] > start[query]
+    return rows[keep], np.cumsum(np.bincount(query[keep], minlength=len(start)))
+
+
+@register_class('PatternedOptogeneticStimulusTable', 'ndx-holostim')
+class PatternedOptogeneticStimulusTable(TimeIntervals):
+    """Table of individual photostimulation pulses, one row per pulse and ROI."""
+
+    __nwbfields__ = ('pattern_names',)
+
+    __columns__ = (
+        {'name': 'roi', 'description': 'index of the stimulated ROI', 'required': True},
+        {'name': 'pattern', 'description': 'index into pattern_names of the stimulus pattern', 'required': True},
+        {'name': 'max_stop_time', 'description': 'running maximum of stop_time', 'required': False},
+    )
+
+    @docval(
+        *get_docval(TimeIntervals.__init__),
+        {
+            'name': 'pattern_names',
+            'type': ('array_data', 'data'),
+            'doc': 'names of the OptogeneticStimulusPattern objects referred to by the pattern column',
+            'default': None,
+        },
+    )
+    def __init__(self, **kwargs):
+        pattern_names = popargs('pattern_names', kwargs)
+        super().__init__(**kwargs)
+        self.pattern_names = pattern_names
+
+    @classmethod
+    @docval(
+        {'name': 'name', 'type': str, 'doc': 'name of the table'},
+        {'name': 'start_time', 'type': 'array_data', 'doc': 'onset of each pulse, in seconds'},
+        {'name': 'stop_time', 'type': 'array_data', 'doc': 'offset of each pulse, in seconds'},
+        {'name': 'roi', 'type': 'array_data', 'doc': 'index of the ROI stimulated by each pulse'},
+        {'name': 'pattern', 'type': 'array_data',
+         'doc': 'index into pattern_names of the pattern of each pulse, stored as uint16'},
+        {'name': 'pattern_names', 'type': ('array_data', 'data'), 'doc': 'names of the stimulus patterns'},
+        {'name': 'description', 'type': str, 'doc': 'description of the table', 'default': 'photostimulation pulses'},
+        {'name': 'dataio', 'type': (bool, dict), 'default': True,
+         'doc': ('whether to chunk and compress the columns for writing. A dict overrides some of the settings in '
+                 'ndx_holostim.io.DEFAULT_ROI_DATAIO.')},
+    )
+    def from_columns(cls, **kwargs):
+        """Build the table from whole columns at once, without adding rows one by one.
+
+        Rows are sorted by start_time if they are not already, and the max_stop_time column of the interval index
+        is computed from them.
+        """
+        name, description, pattern_names, dataio = popargs('name', 'description', 'pattern_names', 'dataio', kwargs)
+        columns = dict(
+            start_time=np.asarray(kwargs['start_time'], dtype=np.float64),
+            stop_time=np.asarray(kwargs['stop_time'], dtype=np.float64),
+            roi=_index_column(kwargs['roi'], np.uint32, 'roi'),
+            pattern=_index_column(kwargs['pattern'], np.uint16, 'pattern'),
+        )
+        lengths = {len(data) for data in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("all columns must have the same length")
+        if np.any(columns['start_time'][1:] < columns['start_time'][:-1]):
+            order = np.argsort(columns['start_time'], kind='stable')
+            columns = {key: data[order] for key, data in columns.items()}
+        columns['max_stop_time'] = build_interval_index(columns['start_time'], columns['stop_time'])
+        settings = dataio if isinstance(dataio, dict) else dict()
+        vector_data = [
+            VectorData(
+                name=column['name'],
+                description=column['description'],
+                data=wrap_time_data(columns[column['name']], **settings) if dataio else columns[column['name']],
+            )
+            for column in cls.__columns__ if column['name'] in columns
+        ]
+        return cls(
+            name=name,
+            description=description,
+            id=ElementIdentifiers(name='id', data=np.arange(lengths.pop())),
+            columns=vector_data,
+            pattern_names=list(pattern_names),
+        )
+
+    @classmethod
+    @docval(
+        {'name': 'name', 'type': str, 'doc': 'name of the table'},
+        {'name': 'patterns', 'type': (list, tuple), 'doc': 'the OptogeneticStimulusPattern objects'},
+        {'name': 'train_start_times', 'type': (list, tuple),
+         'doc': 'for each pattern, the start time of each of its trains, in seconds'},
+        {'name': 'rois', 'type': (list, tuple), 'doc': 'for each pattern, the indices of the ROIs it stimulates'},
+        {'name': 'description', 'type': str, 'doc': 'description of the table', 'default': 'photostimulation pulses'},
+        {'name': 'dataio', 'type': (bool, dict), 'default': True,
+         'doc': ('whether to chunk and compress the columns for writing. A dict overrides some of the settings in '
+                 'ndx_holostim.io.DEFAULT_ROI_DATAIO.')},
+    )
+    def from_patterns(cls, **kwargs):
+        """Build the table by expanding stimulus patterns into pulses. See :py:func:`expand_stimulus_pattern`."""
+        name, patterns, train_start_times, rois = popargs('name', 'patterns', 'train_start_times', 'rois', kwargs)
+        if not len(patterns) == len(train_start_times) == len(rois):
+            raise ValueError("patterns, train_start_times and rois must have the same length")
+        start_time, stop_time, roi, pattern = [], [], [], []
+        for number, (stim_pattern, starts, pattern_rois) in enumerate(zip(patterns, train_start_times, rois)):
+            pulses = expand_stimulus_pattern(stim_pattern, starts, pattern_rois)
+            start_time.append(pulses[0])
+            stop_time.append(pulses[1])
+            roi.append(pulses[2])
+            pattern.append(np.full(len(pulses[0]), number, dtype=np.int64))
+        return cls.from_columns(
+            name=name,
+            start_time=np.concatenate(start_time),
+            stop_time=np.concatenate(stop_time),
+            roi=np.concatenate(roi),
+            pattern=np.concatenate(pattern),
+            pattern_names=[stim_pattern.name for stim_pattern in patterns],
+            **kwargs
+        )
+
+    def _get_interval_index(self):
+        """Load the columns of the interval index, computing max_stop_time if the table does not store it."""
+        cached = getattr(self, '_interval_index', None)
+        if cached is not None and cached[0] == len(self):
+            return cached[1]
+        start_time = np.asarray(self.start_time.data[:], dtype=np.float64)
+        stop_time = np.asarray(self.stop_time.data[:], dtype=np.float64)
+        roi = np.asarray(self.roi.data[:])
+        order = None
+        if np.any(start_time[1:] < start_time[:-1]):
+            # rows added one by one may be out of order
+            order = np.argsort(start_time, kind='stable')
+            start_time, stop_time, roi = start_time[order], stop_time[order], roi[order]
+            max_stop_time = build_interval_index(start_time, stop_time)
+        elif self.max_stop_time is not None and len(self.max_stop_time) == len(self):
+            max_stop_time = np.asarray(self.max_stop_time.data[:], dtype=np.float64)
+        else:
+            max_stop_time = build_interval_index(start_time, stop_time)
+        index = (start_time, max_stop_time, stop_time, roi, order)
+        self._interval_index = (len(self), index)
+        return index
+
+    def get_active_rows(self, times, stop=None):
+        """Find the pulses active at each of the given times, or overlapping each of the given time ranges.
+
+        The columns of the interval index are read once and kept in memory, and all times are queried at once. See
+        :py:func:`query_interval_index`.
+
+        :param times: query times, in seconds, e.g. the times of all imaging frames. Start of the ranges if
+            ``stop`` is given.
+        :param stop: end of the query ranges, in seconds
+        :returns: tuple ``(rows, index)`` with the table rows matching all queries concatenated and the end offset
+            of the rows of each query
+        """
+        start_time, max_stop_time, stop_time, _, order = self._get_interval_index()
+        rows, index = query_interval_index(start_time, max_stop_time, stop_time, times, stop)
+        return (rows if order is None else order[rows]), index
+
+    def get_active_rois(self, times, stop=None):
+        """Find the ROIs stimulated at each of the given times, or during each of the given time ranges.
+
+        :param times: query times, in seconds. Start of the ranges if ``stop`` is given.
+        :param stop: end of the query ranges, in seconds
+        :returns: tuple ``(rois, index)`` with the ROIs of all queries concatenated and the end offset of the ROIs of
+            each query. A ROI appears once per matching pulse.
+        """
+        start_time, max_stop_time, stop_time, roi, _ = self._get_interval_index()
+        rows, index = query_interval_index(start_time, max_stop_time, stop_time, times, stop)
+        return roi[rows], index
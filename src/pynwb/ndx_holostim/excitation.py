@@ -0,0 +1,166 @@
+"""Excitation volumes of ROIs stimulated through a point spread function, e.g. with TemporalFocusing.
+
+The light delivered to a ROI is modeled as its mask convolved with the 3-D point spread function (PSF) of the
+stimulation, normalized to a unit sum, so that the excitation is close to 1 inside large ROIs and falls off around
+them. The PSF is either measured, or a Gaussian whose full widths at half maximum are the lateral and axial PSF
+widths of :py:class:`ndx_holostim.TemporalFocusing`.
+
+:py:func:`convolve_masks` convolves a batch of masks with the PSF with one FFT over the stack, using
+:py:mod:`scipy.fft` with ``workers`` threads when scipy is installed and :py:mod:`numpy.fft` otherwise.
+:py:func:`estimate_excitation` iterates over the masks in batches and reduces each excitation to the volume it
+excites and to the crosstalk on the other ROIs, so that the full excitation volumes never have to be in memory.
+
+Crosstalk is returned as a ragged array ``(rois, values, index)``, where ``index`` holds the end offset of the ROIs
+excited by each stimulated ROI, like :py:mod:`ndx_holostim.spatial`.
+"""
+import re
+
+import numpy as np
+
+from .masks import encode_sparse_masks
+
+# ratio of the full width at half maximum to the standard deviation of a Gaussian
+_FWHM_TO_SIGMA = 1 / (2 * np.sqrt(2 * np.log(2)))
+
+# scale of the units accepted by parse_point_spread_function, to um
+_UNITS = (('nm', 1e-3), ('mm', 1e3), ('um', 1.0), ('µm', 1.0), ('μm', 1.0))
+
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def parse_point_spread_function(text):
+    """Parse a PSF width written as "mean +/- s.d", e.g. '1.2 ± 0.3 µm', into numbers.
+
+    :param text: the description of the width, in um unless another unit (nm, mm) is given
+    :returns: float64 array ``[mean, sd]`` in um, with a NaN s.d. if only the mean is given, or None if the text holds
+        no number
+    """
+    numbers = [float(number) for number in _NUMBER.findall(text.replace('+/-', ' ').replace('±', ' '))]
+    if not numbers:
+        return None
+    scale = next((factor for unit, factor in _UNITS if unit in text), 1.0)
+    mean, sd = numbers[0], numbers[1] if len(numbers) > 1 else np.nan
+    return np.array([mean, sd], dtype=np.float64) * scale
+
+
+def gaussian_psf(lateral_fwhm, axial_fwhm, voxel_size, truncate=3.0):
+    """Return a Gaussian PSF sampled on voxels, normalized to a unit sum.
+
+    :param lateral_fwhm: full width at half maximum along x and y, in um
+    :param axial_fwhm: full width at half maximum along z, in um
+    :param voxel_size: size [x, y, z] of a voxel, in um
+    :param truncate: half-size of the PSF, in standard deviations
+    :returns: float32 array of shape (2 * hx + 1, 2 * hy + 1, 2 * hz + 1)
+    """
+    sigma = np.array([lateral_fwhm, lateral_fwhm, axial_fwhm], dtype=np.float64) * _FWHM_TO_SIGMA
+    sigma = sigma / np.broadcast_to(np.asarray(voxel_size, dtype=np.float64), (3,))
+    profiles = []
+    for s in sigma.tolist():
+        half = int(np.ceil(truncate * s))
+        grid = np.arange(-half, half + 1)
+        profiles.append(np.exp(-0.5 * (grid / s) ** 2) if s > 0 else np.ones(1))
+    psf = profiles[0][:, None, None] * profiles[1][None, :, None] * profiles[2][None, None, :]
+    return (psf / psf.sum()).astype(np.float32)
+
+
+def _fft_functions(workers=None):
+    """Return the (rfftn, irfftn, next_fast_len) functions, with ``workers`` threads if scipy is installed."""
+    try:
+        import scipy.fft
+    except ImportError:
+        return np.fft.rfftn, np.fft.irfftn, lambda size: size
+
+    def rfftn(data, s, axes):
+        return scipy.fft.rfftn(data, s=s, axes=axes, workers=workers)
+
+    def irfftn(data, s, axes):
+        return scipy.fft.irfftn(data, s=s, axes=axes, workers=workers)
+
+    return rfftn, irfftn, lambda size: scipy.fft.next_fast_len(size, real=True)
+
+
+def convolve_masks(masks, psf, workers=None):
+    """Convolve a batch of masks with a PSF, keeping the shape of the masks.
+
+    :param masks: array of shape (number_rois, x, y, z), or (number_rois, x, y) for a single plane
+    :param psf: array of shape (kx, ky, kz) centered on its middle voxel, e.g. from :py:func:`gaussian_psf`, or
+        (kx, ky)
+    :param workers: number of threads of each FFT, if scipy is installed
+    :returns: float32 excitation of the shape of ``masks``
+    """
+    masks = np.asarray(masks)
+    psf = np.asarray(psf, dtype=np.float32)
+    squeeze = masks.ndim == 3
+    if squeeze:
+        masks = masks[..., np.newaxis]
+    if psf.ndim == 2:
+        psf = psf[..., np.newaxis]
+    if masks.ndim != 4 or psf.ndim != 3:
+        raise ValueError("masks must have shape (number_rois, x, y[, z]) and psf (kx, ky[, kz]), got %s and %s"
+                         % (str(masks.shape), str(psf.shape)))
+    rfftn, irfftn, next_fast_len = _fft_functions(workers)
+    # linear convolution along each axis, padded to a size that is fast for the FFT
+    shape = [next_fast_len(m + k - 1) for m, k in zip(masks.shape[1:], psf.shape)]
+    axes = (1, 2, 3)
+    spectrum = rfftn(masks.astype(np.float32), s=shape, axes=axes) * rfftn(psf[np.newaxis], s=shape, axes=axes)
+    full = irfftn(spectrum, s=shape, axes=axes)
+    start = [(k - 1) // 2 for k in psf.shape]
+    excitation = full[:, start[0]:start[0] + masks.shape[1], start[1]:start[1] + masks.shape[2],
+                      start[2]:start[2] + masks.shape[3]].astype(np.float32)
+    return excitation[..., 0] if squeeze else excitation
+
+
+def estimate_excitation(batches, psf, threshold=0.5, voxel_volume=1.0, min_crosstalk=0.01, workers=None):
+    """Estimate the volume excited by each ROI and its crosstalk on the other ROIs, one batch of masks at a time.
+
+    The crosstalk of a stimulated ROI on another ROI is the mean excitation of the stimulated ROI over the voxels
+    of the other ROI. The masks are read twice, so ``batches`` must be re-iterable, e.g. a list of arrays or a
+    function returning a new iterator.
+
+    :param batches: iterable of boolean masks of shape (batch, x, y, z), covering the ROIs in order, or a callable
+        returning such an iterable, e.g. ``lambda: (masks for _, masks in series.iter_rois())``
+    :param psf: array of shape (kx, ky, kz) normalized to a unit sum
+    :param threshold: fraction of the peak excitation of a ROI above which a voxel counts in its excited volume.
+        The default counts the voxels excited at half maximum or more.
+    :param voxel_volume: volume of a voxel, e.g. in um^3
+    :param min_crosstalk: smallest crosstalk returned
+    :param workers: number of threads of each FFT, if scipy is installed
+    :returns: tuple ``(volumes, (rois, values, index))`` with the excited volume of each ROI and the ragged crosstalk
+        of each stimulated ROI on the other ROIs, sorted by ROI
+    """
+    iterate = batches if callable(batches) else (lambda: batches)
+    # flat voxel indices of every ROI, to gather the excitation over each ROI
+    indices, counts = [], []
+    for masks in iterate():
+        batch_indices, batch_index, _ = encode_sparse_masks(masks)
+        indices.append(batch_indices.astype(np.int64))
+        counts.append(np.diff(np.concatenate(([0], batch_index))))
+    indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+    counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+    number_rois = len(counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    nonempty = counts > 0
+    volumes = np.zeros(number_rois, dtype=np.float64)
+    rois, values, per_roi = [], [], []
+    first = 0
+    for masks in iterate():
+        if len(masks) == 0:
+            continue
+        excitation = convolve_masks(masks, psf, workers=workers).reshape(len(masks), -1)
+        peak = excitation.max(axis=1, keepdims=True)
+        excited = (excitation >= threshold * peak) & (peak > 0)
+        volumes[first:first + len(masks)] = excited.sum(axis=1) * voxel_volume
+        # mean excitation of each stimulated ROI of the batch over the voxels of every ROI
+        crosstalk = np.zeros((len(masks), number_rois), dtype=np.float32)
+        if len(indices):
+            sums = np.add.reduceat(excitation[:, indices], starts[nonempty], axis=1)
+            crosstalk[:, nonempty] = sums / counts[nonempty]
+        crosstalk[np.arange(len(masks)), np.arange(first, first + len(masks))] = 0
+        stimulated, excited = np.nonzero(crosstalk >= min_crosstalk)
+        rois.append(excited)
+        values.append(crosstalk[stimulated, excited])
+        per_roi.append(np.bincount(stimulated, minlength=len(masks)))
+        first += len(masks)
+    if not rois:
+        return volumes, (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64))
+    return volumes, (np.concatenate(rois), np.concatenate(values), np.cumsum(np.concatenate(per_roi)))
@@ -0,0 +1,162 @@
+"""SLM phase masks that project the ROI centers of PatternedOptogeneticSeries as holographic spots.
+
+A hologram targets a group of ROIs stimulated together. Its phase mask, displayed on the spatial light modulator,
+produces a spot at the center of each ROI in the focal plane, which is modeled as the Fourier transform of the field
+at the SLM. The phase masks are computed with the Gerchberg–Saxton algorithm, which alternates between the SLM plane,
+where the amplitude is set to 1, and the focal plane, where the amplitude is set to the target, keeping the phase of
+each plane. All the holograms of a batch are iterated together, with one 2-D FFT over the stack per step.
+
+The FFTs use :py:mod:`scipy.fft` when scipy is installed, which keeps single precision and can split the stack over
+``workers`` threads, and otherwise fall back to :py:mod:`numpy.fft` on a single thread.
+
+The field of view of the ROIs is assumed to fill the addressable field of the SLM: pixel (x, y) of a field of view of
+shape (fov_x, fov_y) maps to the focal-plane pixel ((x - fov_x / 2) * slm_x / fov_x, (y - fov_y / 2) * slm_y / fov_y)
+relative to the zero order, wrapped to the FFT grid. Apply the calibration of the setup to center_rois beforehand if
+it differs. The z of the centers is ignored, i.e. all ROIs of a hologram are projected in the nominal focal plane.
+"""
+import numpy as np
+
+# default number of Gerchberg–Saxton iterations
+DEFAULT_ITERATIONS = 30
+
+
+def _has_scipy():
+    try:
+        import scipy.fft  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _fft_functions(workers=None):
+    """Return the (fft2, ifft2) functions over the last two axes, with ``workers`` threads if scipy is installed."""
+    if _has_scipy():
+        import scipy.fft
+
+        def fft2(field):
+            return scipy.fft.fft2(field, overwrite_x=True, workers=workers)
+
+        def ifft2(field):
+            return scipy.fft.ifft2(field, overwrite_x=True, workers=workers)
+
+        return fft2, ifft2
+    return np.fft.fft2, np.fft.ifft2
+
+
+def target_pixels(center_rois, fov_shape, slm_shape):
+    """Return the focal-plane pixel of the FFT grid that targets each ROI center.
+
+    :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI, or (number_rois, 3)
+        holding [x, y, r]
+    :param fov_shape: [x, y] shape of the field of view of the ROIs, in pixels
+    :param slm_shape: [x, y] number of pixels of the SLM
+    :returns: int64 array of shape (number_rois, 2), with -1 for ROIs with a NaN center
+    """
+    center_rois = np.asarray(center_rois, dtype=np.float64)
+    if center_rois.ndim != 2 or center_rois.shape[1] not in (3, 4):
+        raise ValueError("center_rois must have shape (number_rois, 4) or (number_rois, 3), got %s"
+                         % str(center_rois.shape))
+    fov_shape = np.asarray(fov_shape[:2], dtype=np.float64)
+    slm_shape = np.asarray(slm_shape[:2], dtype=np.int64)
+    xy = center_rois[:, :2]
+    valid = ~np.isnan(xy).any(axis=1)
+    pixels = np.full((len(xy), 2), -1, dtype=np.int64)
+    pixels[valid] = np.rint((xy[valid] - fov_shape / 2) * slm_shape / fov_shape).astype(np.int64) % slm_shape
+    return pixels
+
+
+def targets_to_amplitudes(center_rois, rois, index, fov_shape, slm_shape):
+    """Build the focal-plane target amplitudes of holograms, with a unit spot at the center of each of their ROIs.
+
+    :param center_rois: array of shape (number_rois, 4) or (number_rois, 3) with the centers of all ROIs
+    :param rois: ROI numbers targeted by each hologram, concatenated over holograms
+    :param index: end offset of the ROIs of each hologram in ``rois``
+    :param fov_shape: [x, y] shape of the field of view of the ROIs
+    :param slm_shape: [x, y] number of pixels of the SLM
+    :returns: float32 array of shape (number_holograms, slm_x, slm_y)
+    """
+    rois = np.asarray(rois, dtype=np.int64)
+    index = np.asarray(index, dtype=np.int64)
+    holograms = np.repeat(np.arange(len(index)), np.diff(np.concatenate(([0], index))))
+    pixels = target_pixels(np.asarray(center_rois)[rois], fov_shape, slm_shape)
+    valid = pixels[:, 0] >= 0
+    amplitudes = np.zeros((len(index),) + tuple(int(s) for s in slm_shape[:2]), dtype=np.float32)
+    amplitudes[holograms[valid], pixels[valid, 0], pixels[valid, 1]] = 1
+    return amplitudes
+
+
+def gerchberg_saxton(target_amplitudes, iterations=DEFAULT_ITERATIONS, workers=None, seed=0):
+    """Compute the phase masks that produce a stack of focal-plane target amplitudes, all at once.
+
+    All holograms start from the same random phase, so the phase mask of a hologram does not depend on the other
+    holograms of the stack.
+
+    :param target_amplitudes: array of shape (number_holograms, slm_x, slm_y), or (slm_x, slm_y) for one hologram,
+        with the zero order at pixel [0, 0], see :py:func:`targets_to_amplitudes`
+    :param iterations: number of Gerchberg–Saxton iterations
+    :param workers: number of threads of each FFT, if scipy is installed. -1 uses all CPUs.
+    :param seed: seed of the random initial phase
+    :returns: float32 phase masks in radians in [0, 2 pi), of the shape of ``target_amplitudes``
+    """
+    target = np.asarray(target_amplitudes, dtype=np.float32)
+    if target.ndim not in (2, 3):
+        raise ValueError("target_amplitudes must have shape (number_holograms, slm_x, slm_y) or (slm_x, slm_y), "
+                         "got %s" % str(target.shape))
+    fft2, ifft2 = _fft_functions(workers)
+    tiny = np.finfo(np.float32).tiny
+    phase = np.random.default_rng(seed).uniform(0, 2 * np.pi, target.shape[-2:]).astype(np.float32)
+    field = np.broadcast_to(np.exp(1j * phase).astype(np.complex64), target.shape).copy()
+    for _ in range(iterations):
+        image = fft2(field)
+        # keep the phase of the focal plane and impose the target amplitude
+        image *= target / np.maximum(np.abs(image), tiny)
+        field = ifft2(image)
+        # keep the phase of the SLM plane and impose a uniform illumination
+        field /= np.maximum(np.abs(field), tiny)
+    return np.mod(np.angle(field), 2 * np.pi).astype(np.float32)
+
+
+def focal_plane_intensity(phase_masks, workers=None):
+    """Return the focal-plane intensity produced by phase masks, normalized to a total of 1 per hologram.
+
+    :param phase_masks: array of shape (number_holograms, slm_x, slm_y) or (slm_x, slm_y), in radians
+    :param workers: number of threads of each FFT, if scipy is installed
+    :returns: float32 array of the shape of ``phase_masks``, with the zero order at pixel [0, 0]
+    """
+    fft2, _ = _fft_functions(workers)
+    phase_masks = np.asarray(phase_masks, dtype=np.float32)
+    intensity = np.abs(fft2(np.exp(1j * phase_masks).astype(np.complex64))) ** 2
+    return (intensity / intensity.sum(axis=(-2, -1), keepdims=True)).astype(np.float32)
+
+
+def compute_phase_masks(center_rois, rois, index, fov_shape, slm_shape, iterations=DEFAULT_ITERATIONS,
+                        batch_size=16, workers=None, seed=0):
+    """Compute the phase mask of each hologram targeting a group of ROIs, in batches of holograms.
+
+    :param center_rois: array of shape (number_rois, 4) or (number_rois, 3) with the centers of all ROIs
+    :param rois: ROI numbers targeted by each hologram, concatenated over holograms
+    :param index: end offset of the ROIs of each hologram in ``rois``
+    :param fov_shape: [x, y] shape of the field of view of the ROIs
+    :param slm_shape: [x, y] number of pixels of the SLM
+    :param iterations: number of Gerchberg–Saxton iterations
+    :param batch_size: maximum number of holograms iterated at once. Each takes 8 bytes per SLM pixel for the field.
+    :param workers: number of threads of each FFT, if scipy is installed
+    :param seed: seed of the random initial phase
+    :returns: float32 phase masks of shape (number_holograms, slm_x, slm_y), in radians in [0, 2 pi)
+    """
+    center_rois = np.asarray(center_rois)
+    rois = np.asarray(rois, dtype=np.int64)
+    index = np.asarray(index, dtype=np.int64)
+    if len(rois) and (rois.min() < 0 or rois.max() >= len(center_rois)):
+        raise IndexError("rois must be between 0 and %d" % (len(center_rois) - 1))
+    slm_shape = tuple(int(s) for s in slm_shape[:2])
+    phase_masks = np.zeros((len(index),) + slm_shape, dtype=np.float32)
+    starts = np.concatenate(([0], index[:-1]))
+    for start in range(0, len(index), batch_size):
+        stop = min(start + batch_size, len(index))
+        offset = starts[start]
+        batch_rois = rois[offset:index[stop - 1]]
+        batch_index = index[start:stop] - offset
+        targets = targets_to_amplitudes(center_rois, batch_rois, batch_index, fov_shape, slm_shape)
+        phase_masks[start:stop] = gerchberg_saxton(targets, iterations=iterations, workers=workers, seed=seed)
+    return phase_masks
@@ -0,0 +1,338 @@
+"""HDF5 and Zarr storage settings for the ROI and time-resolved datasets of PatternedOptogeneticSeries."""
+import os
+import sys
+
+import h5py
+import numpy as np
+from hdmf.backends.hdf5 import H5DataIO
+from hdmf.data_utils import DataIO
+
+from .zarr_io import ArrayChunkIterator
+
+# datasets of PatternedOptogeneticSeries that hold one entry (or a block of entries) per ROI
+ROI_DATASETS = (
+    'image_mask_roi',
+    'image_mask_roi_indices',
+    'image_mask_roi_index',
+    'image_mask_roi_packed',
+    'center_rois',
+    'pixel_rois',
+    'pixel_rois_index',
+    'library_roi_index',
+    'plane_rois',
+    'plane_rois_index',
+)
+
+# datasets of PatternedOptogeneticSeries that hold one entry (or a block of entries) per hologram, chunked like the
+# ROI datasets
+HOLOGRAM_DATASETS = ('phase_masks', 'phase_mask_rois', 'phase_mask_rois_index')
+
+# datasets of PatternedOptogeneticSeries whose first dimension is time
+TIME_DATASETS = ('data', 'timestamps')
+
+# Default settings used to wrap the ROI datasets. gzip is the only filter that ships with every HDF5
+# installation, so it is used by default; set 'compression' to 'lzf' or 'blosc' to trade portability for speed.
+# Set 'backend' to 'zarr' to wrap the datasets for NWBZarrIO instead of NWBHDF5IO, see ndx_holostim.zarr_io.
+DEFAULT_ROI_DATAIO = dict(
+    compression='gzip',
+    compression_opts=4,
+    shuffle=True,
+    chunk_bytes=1024**2,
+    backend='hdf5',
+)
+
+BACKENDS = ('hdf5', 'zarr')
+
+_MIN_CHUNK_BYTES = 64 * 1024
+
+
+def set_default_roi_dataio(**kwargs):
+    """Update the default settings used to wrap the ROI datasets of new PatternedOptogeneticSeries.
+
+    Accepts the same keys as :py:data:`DEFAULT_ROI_DATAIO`, i.e., ``compression``, ``compression_opts``,
+    ``shuffle``, ``chunk_bytes`` and ``backend``.
+    """
+    _check_settings(kwargs)
+    DEFAULT_ROI_DATAIO.update(kwargs)
+
+
+def _check_settings(settings):
+    unknown = set(settings) - set(DEFAULT_ROI_DATAIO)
+    if unknown:
+        raise ValueError("unknown ROI dataio settings: %s" % ", ".join(sorted(unknown)))
+    if settings.get('backend', 'hdf5') not in BACKENDS:
+        raise ValueError("unknown backend '%s', expected one of %s" % (settings['backend'], ", ".join(BACKENDS)))
+
+
+def roi_chunk_shape(shape, itemsize, chunk_bytes=None):
+    """Choose a chunk shape for a dataset whose first dimension indexes ROIs.
+
+    ROIs of at least 64 KiB (e.g., masks) get one ROI per chunk so that reading one ROI reads a single chunk.
+    Smaller ROIs (e.g., centers) are grouped into chunks of about 64 KiB, as reading less than that costs about the
+    same. ROIs larger than ``chunk_bytes`` are split along their largest remaining dimensions, keeping chunks
+    within the default HDF5 chunk cache.
+
+    :param shape: shape of the dataset. The number of ROIs may be None for resizable datasets.
+    :param itemsize: size in bytes of one element
+    :param chunk_bytes: target maximum size of a chunk in bytes. Defaults to ``DEFAULT_ROI_DATAIO['chunk_bytes']``.
+    """
+    if chunk_bytes is None:
+        chunk_bytes = DEFAULT_ROI_DATAIO['chunk_bytes']
+    number_rois = np.inf if shape[0] is None else int(shape[0])
+    row = [int(s) for s in shape[1:]]
+    row_bytes = int(np.prod(row, dtype=np.int64)) * itemsize
+    if row_bytes < _MIN_CHUNK_BYTES:
+        return (int(max(1, min(number_rois, _MIN_CHUNK_BYTES // max(row_bytes, 1)))),) + tuple(row)
+    while int(np.prod(row, dtype=np.int64)) * itemsize > chunk_bytes:
+        axis = int(np.argmax(row))
+        if row[axis] == 1:
+            break
+        row[axis] = -(-row[axis] // 2)
+    return (1,) + tuple(row)
+
+
+def time_chunk_shape(shape, itemsize, chunk_bytes=None):
+    """Choose a chunk shape for a dataset whose first dimension is time, e.g., data of shape (time, number_rois).
+
+    Each chunk holds a block of consecutive samples of all ROIs, up to ``chunk_bytes``, so that reading a time
+    window touches only the chunks overlapping it. One-dimensional datasets (timestamps) use chunks of 64 KiB to keep
+    the reads of a binary search small.
+
+    :param shape: shape of the dataset. The number of samples may be None for resizable datasets.
+    :param itemsize: size in bytes of one element
+    :param chunk_bytes: target maximum size of a chunk in bytes. Defaults to ``DEFAULT_ROI_DATAIO['chunk_bytes']``.
+    """
+    if chunk_bytes is None:
+        chunk_bytes = DEFAULT_ROI_DATAIO['chunk_bytes']
+    if len(shape) == 1:
+        chunk_bytes = _MIN_CHUNK_BYTES
+    number_samples = np.inf if shape[0] is None else int(shape[0])
+    row = [int(s) for s in shape[1:]]
+    row_bytes = int(np.prod(row, dtype=np.int64)) * itemsize
+    if row_bytes <= chunk_bytes:
+        return (int(max(1, min(number_samples, chunk_bytes // max(row_bytes, 1)))),) + tuple(row)
+    return roi_chunk_shape(shape, itemsize, chunk_bytes)
+
+
+def _compression_settings(compression, compression_opts, shuffle):
+    if compression == 'blosc':
+        try:
+            import hdf5plugin
+        except ImportError:
+            raise ImportError("Blosc compression requires the 'hdf5plugin' package. "
+                              "Run `pip install hdf5plugin` to install it.")
+        blosc = hdf5plugin.Blosc(cname='zstd', clevel=compression_opts or 5,
+                                 shuffle=hdf5plugin.Blosc.BITSHUFFLE if shuffle else hdf5plugin.Blosc.NOSHUFFLE)
+        return dict(compression=blosc.filter_id, compression_opts=blosc.filter_options, allow_plugin_filters=True)
+    if compression == 'lzf':
+        compression_opts = None
+    return dict(compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+
+
+def wrap_roi_data(data, resizable=False, **kwargs):
+    """Wrap an in-memory ROI array with :py:class:`~hdmf.backends.hdf5.H5DataIO` using per-ROI chunks.
+
+    With ``backend='zarr'`` the array is wrapped with ``hdmf_zarr.ZarrDataIO`` instead, using the same chunks.
+
+    Data that is already wrapped, that is not an in-memory array (e.g., an ``h5py.Dataset`` on read) or that is
+    empty is returned unchanged.
+
+    :param data: the ROI array. Arrays of strings are written as variable-length text.
+    :param resizable: whether the written HDF5 dataset can be extended along its first dimension with
+        :py:func:`append_to_dataset`. Zarr arrays can always be extended.
+    :param kwargs: overrides for the settings in :py:data:`DEFAULT_ROI_DATAIO`
+    """
+    _check_settings(kwargs)
+    if not isinstance(data, (np.ndarray, list, tuple)):
+        return data
+    data = np.asarray(data)
+    if data.ndim == 0 or data.size == 0:
+        return data
+    return _wrap(data, kwargs, resizable=resizable)
+
+
+def wrap_time_data(data, **kwargs):
+    """Wrap an in-memory time-resolved array with :py:class:`~hdmf.backends.hdf5.H5DataIO`, chunked along time.
+
+    Data that is already wrapped, that is not an in-memory array or that is empty is returned unchanged.
+
+    :param data: the array, e.g., data of shape (time, number_rois) or timestamps
+    :param kwargs: overrides for the settings in :py:data:`DEFAULT_ROI_DATAIO`
+    """
+    _check_settings(kwargs)
+    if not isinstance(data, (np.ndarray, list, tuple)):
+        return data
+    data = np.asarray(data)
+    if data.ndim == 0 or data.size == 0:
+        return data
+    return _wrap(data, kwargs, time_chunk_shape)
+
+
+def _wrap(data, overrides, chunk_shape=None, resizable=False):
+    settings = dict(DEFAULT_ROI_DATAIO, **overrides)
+    if settings['backend'] == 'zarr':
+        from .zarr_io import wrap_zarr_data
+
+        return wrap_zarr_data(data, _chunks(data.shape, data.dtype, settings, chunk_shape), settings)
+    io_settings = _dataio_settings(data.shape, data.dtype, overrides, chunk_shape)
+    if resizable:
+        io_settings['maxshape'] = (None,) + data.shape[1:]
+    return H5DataIO(data=data, **io_settings)
+
+
+def appendable_roi_dataio(shape, dtype, **kwargs):
+    """Create an empty, resizable ROI dataset to be filled while the experiment is running.
+
+    Pass the result to PatternedOptogeneticSeries in place of the array, write the file, and then add ROIs with
+    :py:meth:`PatternedOptogeneticSeries.append_rois`. Only the ROIs of each call are held in memory.
+
+    :param shape: shape of one ROI, e.g., (x, y, z) for image_mask_roi, (4,) for center_rois or (3,) for a ragged
+        pixel_rois. Use () for the one-dimensional sparse and ragged indices.
+    :param dtype: data type of the dataset
+    :param kwargs: overrides for the settings in :py:data:`DEFAULT_ROI_DATAIO`
+    """
+    _check_settings(kwargs)
+    return _appendable_dataio(shape, dtype, kwargs)
+
+
+def appendable_time_dataio(shape, dtype, **kwargs):
+    """Create an empty, resizable time-resolved dataset to be filled while the experiment is running.
+
+    Pass the result to PatternedOptogeneticSeries in place of data or timestamps, write the file, and then add
+    samples with :py:meth:`PatternedOptogeneticSeries.append_power`.
+
+    :param shape: shape of one sample, e.g., (number_rois,) for data or () for timestamps
+    :param dtype: data type of the dataset
+    :param kwargs: overrides for the settings in :py:data:`DEFAULT_ROI_DATAIO`
+    """
+    _check_settings(kwargs)
+    return _appendable_dataio(shape, dtype, kwargs, time_chunk_shape)
+
+
+class _EmptyH5DataIO(H5DataIO):
+    """H5DataIO of an empty dataset that exposes its maxshape, which older HDMF versions only read from the data."""
+
+    @property
+    def maxshape(self):
+        return self.io_settings['maxshape']
+
+
+def _appendable_dataio(shape, dtype, overrides, chunk_shape=None):
+    dtype = np.dtype(dtype)
+    shape = tuple(int(s) for s in shape)
+    settings = dict(DEFAULT_ROI_DATAIO, **overrides)
+    if settings['backend'] == 'zarr':
+        from .zarr_io import wrap_zarr_data
+
+        # Zarr arrays can always be resized, so an empty array is enough
+        chunks = _chunks((None,) + shape, dtype, settings, chunk_shape)
+        return wrap_zarr_data(np.zeros((0,) + shape, dtype=dtype), chunks, settings)
+    settings = _dataio_settings((None,) + shape, dtype, overrides, chunk_shape)
+    return _EmptyH5DataIO(shape=(0,) + shape, dtype=dtype, maxshape=(None,) + shape, **settings)
+
+
+def _dataio_settings(shape, dtype, overrides, chunk_shape=None):
+    settings = dict(DEFAULT_ROI_DATAIO, **overrides)
+    compression = {}
+    if settings['compression']:
+        compression = _compression_settings(settings['compression'], settings['compression_opts'],
+                                            settings['shuffle'])
+    return dict(chunks=_chunks(shape, dtype, settings, chunk_shape), **compression)
+
+
+def _chunks(shape, dtype, settings, chunk_shape=None):
+    if chunk_shape is not None:
+        return chunk_shape(shape, dtype.itemsize, settings['chunk_bytes'])
+    if len(shape) == 1:
+        number_rois = np.inf if shape[0] is None else shape[0]
+        return (int(max(1, min(number_rois, _MIN_CHUNK_BYTES // dtype.itemsize))),)
+    return roi_chunk_shape(shape, dtype.itemsize, settings['chunk_bytes'])
+
+
+def append_to_dataset(data, values):
+    """Append values along the first dimension of a written, resizable dataset and flush them to disk.
+
+    :param data: an ``h5py.Dataset`` or a written :py:class:`~hdmf.backends.hdf5.H5DataIO`, e.g., one created with
+        :py:func:`appendable_roi_dataio`, or a ``zarr.Array`` read from a file opened in append mode
+    :param values: array of values to append
+    :returns: the number of elements in the dataset before appending
+    """
+    dataset = data.dataset if isinstance(data, H5DataIO) else data
+    if _is_zarr_array(dataset):
+        start = dataset.shape[0]
+        dataset.append(np.asarray(values, dtype=dataset.dtype), axis=0)
+        if '.zmetadata' in dataset.store:
+            # readers of the file use the consolidated metadata, which holds the shape of every array
+            sys.modules['zarr'].consolidate_metadata(dataset.store)
+        return start
+    if not isinstance(dataset, h5py.Dataset):
+        raise ValueError("can only append to a dataset that has been written to a file. "
+                         "Use appendable_roi_dataio to create a resizable dataset and write the file first.")
+    if dataset.maxshape[0] is not None:
+        raise ValueError("cannot append to '%s' because it is not resizable" % dataset.name)
+    # h5py writes variable-length strings from object arrays only
+    values = np.asarray(values, dtype=object if h5py.check_string_dtype(dataset.dtype) else None)
+    start = dataset.shape[0]
+    dataset.resize(start + len(values), axis=0)
+    dataset[start:] = values
+    dataset.file.flush()
+    return start
+
+
+def memmap_dataset(data):
+    """Map the raw data of a contiguous, uncompressed HDF5 dataset to a read-only :py:class:`numpy.memmap`.
+
+    Slicing the memmap reads the file through the page cache, without the copies made by h5py, and pages that are no
+    longer used can be dropped by the operating system. Write the dataset without chunks or filters to use this, e.g.
+    with ``roi_dataio=False``.
+
+    :param data: an ``h5py.Dataset`` or a written :py:class:`~hdmf.backends.hdf5.H5DataIO`
+    :raises ValueError: if the dataset is chunked, compressed, not yet allocated in the file or not in a local file
+    """
+    dataset = data.dataset if isinstance(data, H5DataIO) else data
+    if not isinstance(dataset, h5py.Dataset):
+        raise ValueError("can only map a dataset that has been written to an HDF5 file")
+    if dataset.chunks is not None or dataset.compression is not None or dataset.external:
+        raise ValueError("cannot map '%s' because it is chunked, compressed or external. Write it without chunks or "
+                         "filters, e.g. with roi_dataio=False." % dataset.name)
+    if dataset.dtype.hasobject:
+        raise ValueError("cannot map '%s' because its elements have a variable length" % dataset.name)
+    offset = dataset.id.get_offset()
+    if offset is None:
+        raise ValueError("cannot map '%s' because its data has not been written" % dataset.name)
+    file = dataset.file
+    if file.driver not in ('sec2', 'stdio') or not os.path.isfile(file.filename) or file.userblock_size:
+        raise ValueError("cannot map '%s' because it is not stored in a plain local file" % dataset.name)
+    return np.memmap(file.filename, mode='r', dtype=dataset.dtype, offset=offset, shape=dataset.shape)
+
+
+def _is_zarr_array(data):
+    zarr = sys.modules.get('zarr')
+    return zarr is not None and isinstance(data, zarr.Array)
+
+
+def _unwrap(data):
+    """Return the array wrapped by a DataIO, or its written dataset if the DataIO was created without data."""
+    if isinstance(data, DataIO):
+        if isinstance(data.data, ArrayChunkIterator):
+            return data.data.array
+        if data.data is not None:
+            return data.data
+        if getattr(data, 'dataset', None) is not None:
+            return data.dataset
+    return data
+
+
+def _read_rows(data, rows, key=()):
+    """Read the given rows of an array or dataset, issuing a single sorted selection for h5py datasets.
+
+    :param key: tuple of indices or slices along the following axes, to read only a window of each row
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    data = _unwrap(data)
+    if isinstance(data, np.ndarray):
+        return data[(rows,) + key]
+    if not len(rows):
+        return np.asarray(data[(slice(0, 0),) + key])
+    unique, inverse = np.unique(rows, return_inverse=True)
+    return np.asarray(data[(unique.tolist(),) + key])[inverse]
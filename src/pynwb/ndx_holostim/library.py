@@ -0,0 +1,241 @@
+"""Library of the stimulus patterns and ROI masks of a session, each stored once.
+
+Protocols typically reuse a few stimulus parameter sets and ROI masks across many trials and series.
+:py:class:`StimulusPatternLibrary` stores each distinct mask once, in the sparse encoding of
+:py:mod:`ndx_holostim.masks`, and identifies it by a SHA-1 digest of its content, so adding a mask that is already in
+the library returns the index of the existing entry. Stimulus patterns are deduplicated the same way on their
+parameters. Series refer to library masks by index through ``library_roi_index``.
+
+The mask datasets built by :py:meth:`StimulusPatternLibrary.add_masks` are written resizable, so masks can still be
+added after the file is reopened in append mode, e.g. by
+:py:meth:`ndx_holostim.PatternedOptogeneticSeries.append_rois` on a series whose ``library_roi_index`` was created
+with :py:func:`ndx_holostim.io.appendable_roi_dataio`.
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from hdmf.container import MultiContainerInterface
+from hdmf.utils import docval, get_docval, popargs_to_dict
+from pynwb import register_class
+from pynwb.file import LabMetaData
+
+from .io import _unwrap, append_to_dataset, wrap_roi_data
+from .masks import decode_sparse_masks, encode_sparse_masks, sparse_roi_bounds
+from .patterns import OptogeneticStimulusPattern
+
+# default number of decoded masks kept in memory by StimulusPatternLibrary.get_masks
+DEFAULT_MASK_CACHE_SIZE = 256
+
+
+def hash_sparse_masks(indices, index, mask_shape):
+    """Return the hexadecimal SHA-1 digest of the content of each mask in the sparse encoding.
+
+    The digest covers the mask shape and the sorted flat indices of the pixels of the mask, so two masks have the
+    same digest exactly when they are equal.
+
+    :param indices: flat pixel indices of all masks, see :py:func:`ndx_holostim.masks.encode_sparse_masks`
+    :param index: end offset of each mask in ``indices``
+    :param mask_shape: [x, y, z] shape of one mask
+    :returns: list of digests, one per mask
+    """
+    indices = np.asarray(indices, dtype='<u4')
+    header = np.asarray(mask_shape, dtype='<u4').tobytes()
+    starts, stops = sparse_roi_bounds(index)
+    return [hashlib.sha1(header + indices[start:stop].tobytes()).hexdigest() for start, stop in zip(starts, stops)]
+
+
+def _normalize_value(value):
+    """Return a (dtype, shape, bytes) description of a pattern parameter that does not depend on its storage.
+
+    Numbers are compared as float64 and booleans as bool, so a Python ``0.5``, ``np.float32(0.5)`` and a value read
+    back from a file are equal. Arrays and datasets are described by their full content, never by their repr, which
+    numpy abbreviates for large arrays.
+    """
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    if isinstance(value, str):
+        return 'text', (), value.encode('utf-8')
+    array = np.asarray(value)
+    if array.dtype.kind == 'b':
+        return 'bool', array.shape, np.ascontiguousarray(array, dtype='|b1').tobytes()
+    if array.dtype.kind in 'iuf':
+        return 'float64', array.shape, np.ascontiguousarray(array, dtype='<f8').tobytes()
+    strings = [v.decode('utf-8') if isinstance(v, bytes) else str(v) for v in array.ravel().tolist()]
+    return 'text', array.shape, repr(strings).encode('utf-8')
+
+
+def hash_pattern(pattern):
+    """Return the hexadecimal SHA-1 digest of the type and parameters of a stimulus pattern, ignoring its name."""
+    digest = hashlib.sha1(repr((pattern.data_type, pattern.namespace)).encode('utf-8'))
+    for key, value in sorted(pattern.fields.items()):
+        if hasattr(value, 'fields'):
+            continue
+        dtype, shape, content = _normalize_value(value)
+        digest.update(repr((key, dtype, shape, len(content))).encode('utf-8'))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+@register_class('StimulusPatternLibrary', 'ndx-holostim')
+class StimulusPatternLibrary(LabMetaData, MultiContainerInterface):
+    """Library of the stimulus patterns and ROI masks used in a session, each stored once."""
+
+    __nwbfields__ = ('mask_shape', 'mask_indices', 'mask_index', 'mask_hashes')
+
+    __clsconf__ = {
+        'attr': 'optogenetic_stimulus_patterns',
+        'type': OptogeneticStimulusPattern,
+        'add': 'add_optogenetic_stimulus_patterns',
+        'get': 'get_optogenetic_stimulus_patterns',
+        'create': 'create_optogenetic_stimulus_patterns',
+    }
+
+    @docval(
+        *get_docval(LabMetaData.__init__),
+        {'name': 'optogenetic_stimulus_patterns', 'type': (list, tuple, dict, OptogeneticStimulusPattern),
+         'doc': 'the distinct stimulus patterns of the library', 'default': None},
+        {'name': 'mask_shape', 'type': ('array_data', 'data'), 'shape': (3,), 'default': None,
+         'doc': 'shape [x, y, z] of a single mask'},
+        {'name': 'mask_indices', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'flat pixel indices of all masks, see ndx_holostim.masks.encode_sparse_masks'},
+        {'name': 'mask_index', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'end offset of the pixels of each mask in mask_indices'},
+        {'name': 'mask_hashes', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'hexadecimal SHA-1 digest of the content of each mask'},
+        {'name': 'mask_cache_size', 'type': int, 'default': DEFAULT_MASK_CACHE_SIZE,
+         'doc': 'maximum number of decoded masks kept in memory by get_masks'},
+    )
+    def __init__(self, **kwargs):
+        patterns = kwargs.pop('optogenetic_stimulus_patterns')
+        self.mask_cache_size = kwargs.pop('mask_cache_size')
+        fields = popargs_to_dict(('mask_shape', 'mask_indices', 'mask_index', 'mask_hashes'), kwargs)
+        super().__init__(**kwargs)
+        self.optogenetic_stimulus_patterns = patterns
+        for key, val in fields.items():
+            setattr(self, key, val)
+        self._mask_cache = OrderedDict()
+        self._mask_lookup = None
+        self._pattern_lookup = None
+
+    @property
+    def number_masks(self):
+        """Number of distinct masks in the library"""
+        return 0 if self.mask_index is None else len(self.mask_index)
+
+    def add_masks(self, masks):
+        """Add dense masks to the library, storing only the masks that it does not hold yet.
+
+        :param masks: array-like of shape (number_masks, x, y) or (number_masks, x, y, z)
+        :returns: uint32 array with the library index of each mask, to be stored in ``library_roi_index``
+        """
+        indices, index, mask_shape = encode_sparse_masks(masks)
+        return self.add_sparse_masks(indices, index, mask_shape)
+
+    def add_sparse_masks(self, indices, index, mask_shape):
+        """Add masks in the sparse encoding to the library, storing only the masks that it does not hold yet.
+
+        :param indices: flat pixel indices of all masks, see :py:func:`ndx_holostim.masks.encode_sparse_masks`
+        :param index: end offset of each mask in ``indices``
+        :param mask_shape: [x, y, z] shape of one mask
+        :returns: uint32 array with the library index of each mask
+        """
+        indices = np.asarray(indices, dtype=np.uint32)
+        index = np.asarray(index, dtype=np.int64)
+        mask_shape = np.asarray(mask_shape, dtype=np.uint32)
+        if self.mask_shape is None:
+            self.mask_shape = mask_shape
+        elif not np.array_equal(np.asarray(self.mask_shape), mask_shape):
+            raise ValueError("masks of shape %s cannot be added to library '%s' of masks of shape %s"
+                             % (tuple(mask_shape.tolist()), self.name, tuple(np.asarray(self.mask_shape).tolist())))
+        lookup = self._get_mask_lookup()
+        hashes = hash_sparse_masks(indices, index, mask_shape)
+        result = np.empty(len(hashes), dtype=np.uint32)
+        new = []
+        for row, digest in enumerate(hashes):
+            entry = lookup.get(digest)
+            if entry is None:
+                entry = lookup[digest] = self.number_masks + len(new)
+                new.append(row)
+            result[row] = entry
+        if new:
+            starts, stops = sparse_roi_bounds(index, new)
+            lengths = stops - starts
+            source = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            self._extend('mask_indices', indices[source])
+            offset = len(_unwrap(self.mask_indices)) - len(source)
+            self._extend('mask_index', (np.cumsum(lengths) + offset).astype(np.uint32))
+            self._extend('mask_hashes', [hashes[row] for row in new])
+        return result
+
+    def _extend(self, name, values):
+        """Append values to a mask dataset, in memory or in a resizable dataset of a written file."""
+        current = getattr(self, name)
+        data = _unwrap(current)
+        if current is None or isinstance(data, (np.ndarray, list, tuple)):
+            values = values if current is None else np.concatenate((np.asarray(data), values))
+            # fields of a container can only be set once, so the extended array replaces the field value directly.
+            # The written datasets are resizable, so that masks can be added after the file is reopened for append.
+            self.fields[name] = wrap_roi_data(values, resizable=True)
+        else:
+            append_to_dataset(current, values)
+
+    def _get_mask_lookup(self):
+        """Return the dict from mask digest to library index, reading the digests once."""
+        if self._mask_lookup is None:
+            hashes = [] if self.mask_hashes is None else self.mask_hashes[:]
+            self._mask_lookup = {h.decode('utf-8') if isinstance(h, bytes) else str(h): i for i, h in enumerate(hashes)}
+        return self._mask_lookup
+
+    def get_masks(self, entries):
+        """Return the library masks with the given indices as a dense boolean array of shape (len(entries), x, y, z).
+
+        Decoded masks are kept in a least-recently-used cache of ``mask_cache_size`` masks, so resolving the masks
+        of many series that share the same library entries decodes each mask once.
+
+        :param entries: library indices, e.g. the ``library_roi_index`` of a series
+        """
+        if self.mask_shape is None:
+            raise ValueError("library '%s' has no masks" % self.name)
+        entries = np.asarray(entries, dtype=np.int64).ravel()
+        unique, inverse = np.unique(entries, return_inverse=True)
+        if len(unique) and (unique[0] < 0 or unique[-1] >= self.number_masks):
+            raise IndexError("mask index out of range for library '%s' with %d masks" % (self.name, self.number_masks))
+        cache = self._mask_cache
+        missing = [entry for entry in unique.tolist() if entry not in cache]
+        if missing:
+            decoded = decode_sparse_masks(_unwrap(self.mask_indices), np.asarray(_unwrap(self.mask_index)[:]),
+                                          self.mask_shape, rois=missing)
+            for entry, mask in zip(missing, decoded):
+                cache[entry] = mask
+        masks = []
+        for entry in unique.tolist():
+            cache.move_to_end(entry)
+            masks.append(cache[entry])
+        stack = np.stack(masks) if masks else np.zeros((0,) + tuple(int(s) for s in self.mask_shape), dtype=bool)
+        while len(cache) > self.mask_cache_size:
+            cache.popitem(last=False)
+        return stack[inverse]
+
+    def get_mask(self, entry):
+        """Return the boolean mask of shape (x, y, z) of a single library entry."""
+        return self.get_masks([entry])[0]
+
+    def add_pattern(self, pattern):
+        """Add a stimulus pattern to the library unless an identical one is already there.
+
+        Patterns are compared on their type and parameters, not on their name.
+
+        :param pattern: an OptogeneticStimulusPattern
+        :returns: the pattern of the library with these parameters, i.e. ``pattern`` itself or an existing pattern.
+            Link series to the returned pattern so that each parameter set is stored once.
+        """
+        if self._pattern_lookup is None:
+            self._pattern_lookup = {hash_pattern(p): p for p in self.optogenetic_stimulus_patterns.values()}
+        digest = hash_pattern(pattern)
+        existing = self._pattern_lookup.get(digest)
+        if existing is not None:
+            return existing
+        self.add_optogenetic_stimulus_patterns(pattern)
+        self._pattern_lookup[digest] = pattern
+        return pattern
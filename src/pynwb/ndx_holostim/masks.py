@@ -0,0 +1,263 @@
+"""Encoding and decoding of ROI masks stored on PatternedOptogeneticSeries.
+
+The sparse encoding stores, for every ROI, the flat (C-order) indices of the pixels or voxels that belong to it.
+The indices of all ROIs are concatenated into one array and a second array holds the end offset of each ROI,
+following the NWB ragged array convention (``VectorData`` / ``VectorIndex``).
+
+The bit-packed encoding stores each mask with 8 pixels per byte along x (:py:func:`numpy.packbits` on axis 1), a
+fixed 8-fold reduction from bool masks and 64-fold from float64 masks that keeps one row per ROI, so single ROIs are
+still read with one hyperslab.
+"""
+import numpy as np
+
+# largest pixel index and end offset that the uint32 datasets of the sparse encoding can hold
+_MAX_INDEX = np.iinfo(np.uint32).max
+
+
+def encode_sparse_masks(masks):
+    """Encode a stack of ROI masks of shape (number_rois, x, y[, z]) into the sparse representation.
+
+    Any non-zero value is considered as belonging to the ROI.
+
+    :param masks: array-like of shape (number_rois, x, y) or (number_rois, x, y, z)
+    :returns: tuple ``(indices, index, mask_shape)`` where ``indices`` are the flat pixel indices of all ROIs,
+        ``index`` is the end offset of each ROI in ``indices`` and ``mask_shape`` is the [x, y, z] shape of one mask
+    """
+    masks = np.asarray(masks)
+    if masks.ndim == 3:
+        masks = masks[..., np.newaxis]
+    if masks.ndim != 4:
+        raise ValueError("masks must have shape (number_rois, x, y) or (number_rois, x, y, z), got %s"
+                         % str(masks.shape))
+    mask_shape = np.asarray(masks.shape[1:], dtype=np.uint32)
+    if np.prod(mask_shape, dtype=np.uint64) > _MAX_INDEX:
+        raise ValueError("masks of shape %s are too large for the sparse encoding" % str(tuple(mask_shape)))
+    rois, indices = np.nonzero(masks.reshape(len(masks), int(np.prod(masks.shape[1:]))))
+    if len(indices) > _MAX_INDEX:
+        raise ValueError("masks with %d pixels in total are too many for the uint32 offsets of the sparse encoding"
+                         % len(indices))
+    index = np.cumsum(np.bincount(rois, minlength=masks.shape[0])).astype(np.uint32)
+    return indices.astype(np.uint32), index, mask_shape
+
+
+def sparse_roi_bounds(index, rois=None):
+    """Return the start and stop offsets into the sparse indices for the given ROIs.
+
+    :param index: end offsets of each ROI, as stored in ``image_mask_roi_index``
+    :param rois: ROI numbers to look up. If None, all ROIs are returned.
+    :returns: tuple ``(starts, stops)`` of int64 arrays
+    """
+    index = np.asarray(index, dtype=np.int64)
+    starts = np.concatenate(([0], index[:-1]))
+    if rois is None:
+        return starts, index
+    rois = np.asarray(rois, dtype=np.int64)
+    return starts[rois], index[rois]
+
+
+def decode_sparse_masks(indices, index, mask_shape, rois=None):
+    """Expand the sparse representation into dense boolean masks.
+
+    Only the parts of ``indices`` belonging to the requested ROIs are read, so ``indices`` may be an
+    ``h5py.Dataset`` that is never loaded in full.
+
+    :param indices: flat pixel indices of all ROIs, as stored in ``image_mask_roi_indices``
+    :param index: end offsets of each ROI, as stored in ``image_mask_roi_index``
+    :param mask_shape: [x, y, z] shape of one mask, as stored in ``image_mask_shape``
+    :param rois: ROI numbers to expand. If None, all ROIs are expanded.
+    :returns: boolean array of shape (len(rois), x, y, z)
+    """
+    mask_shape = tuple(int(s) for s in mask_shape)
+    if rois is None:
+        rois = np.arange(len(index))
+    starts, stops = sparse_roi_bounds(index, rois)
+    out = np.zeros((len(starts), int(np.prod(mask_shape))), dtype=bool)
+    if len(starts) == 0:
+        return out.reshape((0,) + mask_shape)
+    if not isinstance(indices, np.ndarray) and np.array_equal(starts[1:], stops[:-1]):
+        # a contiguous block of ROIs is read with a single hyperslab
+        offset = starts[0]
+        indices = np.asarray(indices[offset:stops[-1]])
+        starts, stops = starts - offset, stops - offset
+    if isinstance(indices, np.ndarray):
+        # gather all requested ROIs with a single fancy-indexing pass
+        lengths = stops - starts
+        rows = np.repeat(np.arange(len(starts)), lengths)
+        source = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        out[rows, indices[source]] = True
+    else:
+        # read one contiguous hyperslab per ROI instead of the whole dataset
+        for row, (start, stop) in enumerate(zip(starts, stops)):
+            if stop > start:
+                out[row, indices[start:stop]] = True
+    return out.reshape((len(starts),) + mask_shape)
+
+
+def decode_sparse_window(indices, index, mask_shape, rois, plane, x_range, y_range):
+    """Expand the pixels of sparse masks that fall in a window of one plane into dense boolean images.
+
+    Only the parts of ``indices`` belonging to the requested ROIs are read and only the window is allocated, so the
+    masks of a large field of view can be rendered one tile at a time.
+
+    :param indices: flat pixel indices of all ROIs, as stored in ``image_mask_roi_indices``
+    :param index: end offsets of each ROI, as stored in ``image_mask_roi_index``
+    :param mask_shape: [x, y, z] shape of one mask, as stored in ``image_mask_shape``
+    :param rois: ROI numbers to expand
+    :param plane: the plane number, i.e. the index along z
+    :param x_range: [start, stop) range of the window along x
+    :param y_range: [start, stop) range of the window along y
+    :returns: boolean array of shape (len(rois), x_range[1] - x_range[0], y_range[1] - y_range[0])
+    """
+    mask_shape = tuple(int(s) for s in mask_shape)
+    (x0, x1), (y0, y1) = x_range, y_range
+    starts, stops = sparse_roi_bounds(index, rois)
+    out = np.zeros((len(starts), x1 - x0, y1 - y0), dtype=bool)
+    lengths = stops - starts
+    if not lengths.sum():
+        return out
+    if isinstance(indices, np.ndarray):
+        source = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        pixels = indices[source]
+    else:
+        # read one contiguous hyperslab per ROI instead of the whole dataset
+        pixels = np.concatenate([np.asarray(indices[start:stop]) for start, stop in zip(starts, stops)])
+    rows = np.repeat(np.arange(len(starts)), lengths)
+    x, y, z = np.unravel_index(pixels.astype(np.int64), mask_shape)
+    inside = (z == plane) & (x >= x0) & (x < x1) & (y >= y0) & (y < y1)
+    out[rows[inside], x[inside] - x0, y[inside] - y0] = True
+    return out
+
+
+def downsample_masks(masks, factor, axes=(1, 2)):
+    """Downsample masks by max-pooling blocks of ``factor`` pixels along the given axes, x and y by default.
+
+    A pixel of the result is set if any pixel of its block is set; for label images, it takes the largest label of
+    its block. Axes whose length is not a multiple of ``factor`` are padded, so they have ceil(length / factor)
+    pixels in the result.
+
+    :param masks: array of shape (number_rois, x, y[, z]), or any array with ``axes`` set accordingly
+    :param factor: downsampling factor, a positive integer
+    :param axes: axes to downsample
+    """
+    masks = np.asarray(masks)
+    factor = int(factor)
+    if factor < 1:
+        raise ValueError("factor must be a positive integer, got %d" % factor)
+    if factor == 1:
+        return masks
+    axes = sorted(axis % masks.ndim for axis in axes)
+    pad = [(0, -length % factor if axis in axes else 0) for axis, length in enumerate(masks.shape)]
+    if masks.dtype == bool:
+        fill = False
+    elif masks.dtype.kind in 'iu':
+        fill = np.iinfo(masks.dtype).min
+    else:
+        fill = -np.inf
+    masks = np.pad(masks, pad, constant_values=fill)
+    shape, blocks = [], []
+    for axis, length in enumerate(masks.shape):
+        if axis in axes:
+            shape.extend((length // factor, factor))
+            blocks.append(len(shape) - 1)
+        else:
+            shape.append(length)
+    return masks.reshape(shape).max(axis=tuple(blocks))
+
+
+def mask_bounding_boxes(masks):
+    """Compute the bounding box of each mask of a stack of shape (number_rois, x, y, z).
+
+    :returns: int64 array of shape (number_rois, 3, 2) holding the [start, stop) range of each mask along x, y and z.
+        Empty masks have an empty [0, 0) range.
+    """
+    masks = np.asarray(masks)
+    boxes = np.zeros((len(masks), 3, 2), dtype=np.int64)
+    for axis in range(3):
+        other = tuple(a + 1 for a in range(3) if a != axis)
+        profile = masks.any(axis=other)
+        nonempty = profile.any(axis=1)
+        profile = profile[nonempty]
+        boxes[nonempty, axis, 0] = profile.argmax(axis=1)
+        boxes[nonempty, axis, 1] = profile.shape[1] - profile[:, ::-1].argmax(axis=1)
+    return boxes
+
+
+def pack_masks(masks):
+    """Pack a stack of ROI masks of shape (number_rois, x, y[, z]) into bytes of 8 pixels along x.
+
+    Any non-zero value is considered as belonging to the ROI.
+
+    :param masks: array-like of shape (number_rois, x, y) or (number_rois, x, y, z)
+    :returns: tuple ``(packed, mask_shape)`` with the uint8 array of shape (number_rois, ceil(x / 8), y, z) and the
+        [x, y, z] shape of one mask
+    """
+    masks = np.asarray(masks)
+    if masks.ndim == 3:
+        masks = masks[..., np.newaxis]
+    if masks.ndim != 4:
+        raise ValueError("masks must have shape (number_rois, x, y) or (number_rois, x, y, z), got %s"
+                         % str(masks.shape))
+    return np.packbits(masks != 0, axis=1), np.asarray(masks.shape[1:], dtype=np.uint32)
+
+
+def unpack_masks(packed, mask_shape):
+    """Expand bit-packed masks of shape (number_rois, ceil(x / 8), y, z) into boolean masks.
+
+    :param packed: uint8 array as returned by :py:func:`pack_masks`
+    :param mask_shape: [x, y, z] shape of one mask
+    :returns: boolean array of shape (number_rois, x, y, z)
+    """
+    return np.unpackbits(np.asarray(packed, dtype=np.uint8), axis=1, count=int(mask_shape[0])).view(bool)
+
+
+class PackedMaskArray:
+    """Read-only, array-like view of bit-packed masks of shape (number_rois, x, y, z).
+
+    Indexing reads only the packed rows of the selected ROIs, e.g. from an ``h5py.Dataset``, and unpacks them, so the
+    masks can be sliced as if they were stored as a dense boolean array.
+
+    :param packed: uint8 array or dataset of shape (number_rois, ceil(x / 8), y, z)
+    :param mask_shape: [x, y, z] shape of one mask
+    """
+
+    dtype = np.dtype(bool)
+    ndim = 4
+
+    def __init__(self, packed, mask_shape):
+        self.packed = np.asarray(packed, dtype=np.uint8) if isinstance(packed, (list, tuple)) else packed
+        self.mask_shape = tuple(int(s) for s in mask_shape)
+
+    @property
+    def shape(self):
+        return (len(self.packed),) + self.mask_shape
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __array__(self, dtype=None, copy=None):
+        masks = self[:]
+        return masks if dtype is None else masks.astype(dtype)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if not key or key[0] is Ellipsis:
+            return unpack_masks(self.packed[:], self.mask_shape)[key]
+        rows, rest = key[0], key[1:]
+        if isinstance(rows, (int, np.integer)):
+            row = int(rows) + len(self) if rows < 0 else int(rows)
+            if not 0 <= row < len(self):
+                raise IndexError("ROI %d is out of range for %d ROIs" % (rows, len(self)))
+            return unpack_masks(self.packed[row:row + 1], self.mask_shape)[(0,) + rest]
+        if isinstance(rows, slice):
+            return unpack_masks(self.packed[rows], self.mask_shape)[(slice(None),) + rest]
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        rows = np.where(rows < 0, rows + len(self), rows).astype(np.int64)
+        if isinstance(self.packed, np.ndarray):
+            packed = self.packed[rows]
+        else:
+            # read each requested row once, in increasing order as required by h5py
+            unique, inverse = np.unique(rows, return_inverse=True)
+            packed = np.asarray(self.packed[unique.tolist()])[inverse]
+        return unpack_masks(packed, self.mask_shape)[(slice(None),) + rest]
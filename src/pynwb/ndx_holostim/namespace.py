@@ -0,0 +1,91 @@
+"""Loading of the ndx-holostim namespace with a cache of the parsed YAML spec.
+
+Parsing the YAML files of the spec takes a part of the import time of the package. The parsed specs are cached as
+JSON, which is much faster to read, in the directory given by the ``NDX_HOLOSTIM_CACHE_DIR`` environment variable
+or in ``~/.cache/ndx-holostim``. Cache files are named after a hash of the content of the YAML file, so editing the
+spec never reads a stale cache. Set ``NDX_HOLOSTIM_CACHE_DIR`` to an empty string to disable the cache.
+
+The cache is an optimization only: if the cache directory cannot be created or written, e.g. on a read-only home
+directory or in a sandbox, the spec is read from the YAML files as without the cache.
+"""
+import hashlib
+import json
+import os
+
+from hdmf.spec.namespace import YAMLSpecReader
+from pynwb import get_type_map, load_namespaces
+
+
+def get_cache_dir():
+    """Return the directory of the spec cache, or None if the cache is disabled."""
+    cache_dir = os.environ.get('NDX_HOLOSTIM_CACHE_DIR')
+    if cache_dir is None:
+        home = os.path.expanduser('~')
+        if home.startswith('~'):  # no home directory to hold the cache
+            return None
+        cache_dir = os.path.join(home, '.cache', 'ndx-holostim')
+    return cache_dir or None
+
+
+class CachedSpecReader(YAMLSpecReader):
+    """A YAMLSpecReader that caches the parsed namespace and spec files as JSON."""
+
+    def __init__(self, indir='.', cache_dir=None):
+        super().__init__(indir=indir)
+        self.cache_dir = cache_dir
+
+    def read_namespace(self, namespace_path):
+        return self.__read_cached(namespace_path, super().read_namespace)
+
+    def read_spec(self, spec_path):
+        if not os.path.isabs(spec_path):
+            spec_path = os.path.join(self.source, spec_path)
+        return self.__read_cached(spec_path, super().read_spec)
+
+    def __read_cached(self, path, read):
+        if self.cache_dir is None:
+            return read(path)
+        with open(path, 'rb') as stream:
+            digest = hashlib.sha1(stream.read()).hexdigest()
+        cache_path = os.path.join(self.cache_dir, '%s-%s.json' % (os.path.basename(path), digest))
+        try:
+            with open(cache_path, 'r') as stream:
+                return json.load(stream)
+        except (OSError, ValueError):
+            pass
+        parsed = read(path)
+        # write to a temporary file first so that concurrent processes never read a partial cache
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'w') as stream:
+                json.dump(parsed, stream)
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError):
+            # the cache directory is not writable, so the remaining files are read without the cache
+            self.cache_dir = None
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return parsed
+
+
+def load_cached_namespace(namespace_path, cache_dir=None):
+    """Load a namespace into the global PyNWB type map, reading the spec through :py:class:`CachedSpecReader`.
+
+    The spec is loaded without the cache if the cache is disabled or with PyNWB < 3.0, which has no public access to
+    the global type map.
+
+    :param namespace_path: path to the namespace YAML file
+    :param cache_dir: directory of the cache. Defaults to :py:func:`get_cache_dir`.
+    """
+    cache_dir = get_cache_dir() if cache_dir is None else cache_dir
+    if not cache_dir:
+        return load_namespaces(namespace_path)
+    try:
+        type_map = get_type_map(copy=False)
+    except TypeError:  # PyNWB < 3.0 always returns a copy of the global type map
+        return load_namespaces(namespace_path)
+    reader = CachedSpecReader(indir=os.path.dirname(namespace_path), cache_dir=cache_dir)
+    return type_map.load_namespaces(namespace_path, reader=reader)
@@ -0,0 +1,223 @@
+import numpy as np
+from hdmf.utils import docval, get_docval, popargs_to_dict
+from pynwb import register_class
+from pynwb.file import LabMetaData
+
+from .containers import _build_containers, _check_columns, containers_from_arrays, fields_only_init
+from .excitation import gaussian_psf, parse_point_spread_function
+from .spiral import DEFAULT_SPIRAL_SAMPLES, spiral_illumination, spiral_trajectories
+
+_FLOAT = (float, np.float32, np.float64)
+_INT = (int, np.int8, np.int16, np.int32, np.int64)
+
+
+@register_class('OptogeneticStimulusPattern', 'ndx-holostim')
+@fields_only_init
+class OptogeneticStimulusPattern(LabMetaData):
+    """Holographic excitation single ROI"""
+
+    __nwbfields__ = ('description', 'duration', 'number_of_stimulus_presentation', 'inter_stimulus_interval')
+
+    @docval(
+        {'name': 'name', 'type': str, 'doc': 'name of the stimulus pattern'},
+        {'name': 'description', 'type': str, 'doc': 'description of the stimulus pattern'},
+        {'name': 'duration', 'type': _FLOAT, 'doc': 'the time duration for a single stimulus, in sec'},
+        {'name': 'number_of_stimulus_presentation', 'type': _INT,
+         'doc': 'number of times the patterned stimulus is presented in one time interval'},
+        {'name': 'inter_stimulus_interval', 'type': _FLOAT,
+         'doc': 'duration of the interval between each individual stimulus, in sec'},
+    )
+    def __init__(self, **kwargs):
+        fields = popargs_to_dict(
+            ('description', 'duration', 'number_of_stimulus_presentation', 'inter_stimulus_interval'), kwargs)
+        super().__init__(**kwargs)
+        for key, val in fields.items():
+            setattr(self, key, val)
+
+    @classmethod
+    def from_arrays(cls, names, **kwargs):
+        """Create one stimulus pattern per name, validating the arguments once for all patterns.
+
+        Takes the same arguments as the constructor, each either a single value shared by all patterns or a sequence
+        with one value per pattern. This is much faster than calling the constructor in a loop when creating
+        thousands of patterns.
+
+        :param names: name of each pattern
+        :returns: list of patterns
+        """
+        return containers_from_arrays(cls, names, **kwargs)
+
+
+@register_class('SpiralScanning', 'ndx-holostim')
+@fields_only_init
+class SpiralScanning(OptogeneticStimulusPattern):
+    """table of parameters defining the spiral scanning beam pattern"""
+
+    __nwbfields__ = ('diameter', 'height', 'number_of_revolutions')
+
+    @docval(
+        *get_docval(OptogeneticStimulusPattern.__init__),
+        {'name': 'diameter', 'type': _FLOAT, 'doc': 'spiral diameter of each spot, in m'},
+        {'name': 'height', 'type': _FLOAT, 'doc': 'spiral height of each spot, in m'},
+        {'name': 'number_of_revolutions', 'type': _INT, 'doc': 'number of turns within a spiral'},
+    )
+    def __init__(self, **kwargs):
+        fields = popargs_to_dict(('diameter', 'height', 'number_of_revolutions'), kwargs)
+        super().__init__(**kwargs)
+        for key, val in fields.items():
+            setattr(self, key, val)
+
+    def get_trajectories(self, center_rois, pixel_size, plane_spacing=None, number_of_samples=DEFAULT_SPIRAL_SAMPLES):
+        """Return the position of the beam at each sample of the spiral around each ROI center, in pixels.
+
+        See :py:func:`ndx_holostim.spiral.spiral_trajectories`.
+
+        :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI, or (number_rois, 3)
+        :param pixel_size: size of a pixel along x and y, in m
+        :param plane_spacing: distance between planes, in m. If None, the height is ignored.
+        :param number_of_samples: number of samples of each trajectory over the duration of the stimulus
+        :returns: float64 array of shape (number_rois, number_of_samples, 3) holding [x, y, z]
+        """
+        height = 0.0 if plane_spacing is None else self.height / plane_spacing
+        return spiral_trajectories(center_rois, self.number_of_revolutions, diameter=self.diameter / pixel_size,
+                                   height=height, number_of_samples=number_of_samples)
+
+    def get_illumination(self, center_rois, pixel_size, beam_radius=0.0, mask_shape=None,
+                         number_of_samples=DEFAULT_SPIRAL_SAMPLES):
+        """Return the pixels illuminated by the spiral around each ROI center and their dwell time.
+
+        The spiral of the pattern is computed once and placed at every center, see
+        :py:func:`ndx_holostim.spiral.spiral_illumination`. Use :py:func:`ndx_holostim.conversion.pixels_to_masks`
+        to get the illumination masks and :py:func:`ndx_holostim.spiral.dwell_maps` to get the dwell-time maps.
+
+        :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI, or (number_rois, 3)
+        :param pixel_size: size of a pixel along x and y, in m
+        :param beam_radius: radius of the beam, in m
+        :param mask_shape: [x, y, z] shape of the field of view. If given, pixels outside of it are dropped.
+        :param number_of_samples: number of samples of each trajectory over the duration of the stimulus
+        :returns: tuple ``(pixels, dwell, index)`` with the [x, y, z] pixels, their dwell time in seconds and the
+            end offset of the pixels of each ROI
+        """
+        return spiral_illumination(center_rois, self.number_of_revolutions, self.duration,
+                                   diameter=self.diameter / pixel_size, number_of_samples=number_of_samples,
+                                   beam_radius=beam_radius / pixel_size, mask_shape=mask_shape)
+
+
+@register_class('TemporalFocusing', 'ndx-holostim')
+class TemporalFocusing(OptogeneticStimulusPattern):
+    """table of parameters defining the temporal focusing beam-shaping"""
+
+    __nwbfields__ = (
+        'lateral_point_spread_function',
+        'axial_point_spread_function',
+        'lateral_psf',
+        'axial_psf',
+        'psf_voxel_size',
+        'point_spread_function',
+    )
+
+    @docval(
+        *get_docval(OptogeneticStimulusPattern.__init__),
+        {'name': 'lateral_point_spread_function', 'type': str,
+         'doc': ('estimated lateral spatial profile or point spread function, expressed as mean [um] +/- s.d '
+                 '[um]')},
+        {'name': 'axial_point_spread_function', 'type': str,
+         'doc': 'estimated axial spatial profile or point spread function, expressed as mean [um] +/- s.d [um]'},
+        {'name': 'lateral_psf', 'type': ('array_data', 'data'), 'shape': (2,), 'default': None,
+         'doc': ('lateral full width at half maximum of the PSF, as [mean, s.d.] in um. Parsed from '
+                 'lateral_point_spread_function if not given')},
+        {'name': 'axial_psf', 'type': ('array_data', 'data'), 'shape': (2,), 'default': None,
+         'doc': ('axial full width at half maximum of the PSF, as [mean, s.d.] in um. Parsed from '
+                 'axial_point_spread_function if not given')},
+        {'name': 'psf_voxel_size', 'type': ('array_data', 'data'), 'shape': (3,), 'default': None,
+         'doc': 'size [x, y, z] of a voxel of point_spread_function, in um'},
+        {'name': 'point_spread_function', 'type': ('array_data', 'data'), 'shape': (None, None, None),
+         'default': None, 'doc': 'measured 3-D PSF, centered on its middle voxel. Requires psf_voxel_size'},
+    )
+    def __init__(self, **kwargs):
+        if kwargs['point_spread_function'] is not None and kwargs['psf_voxel_size'] is None:
+            raise ValueError("'psf_voxel_size' is required to use 'point_spread_function'")
+        for width in ('lateral', 'axial'):
+            if kwargs[width + '_psf'] is None:
+                kwargs[width + '_psf'] = parse_point_spread_function(kwargs[width + '_point_spread_function'])
+        fields = popargs_to_dict(('lateral_point_spread_function', 'axial_point_spread_function', 'lateral_psf',
+                                  'axial_psf', 'psf_voxel_size', 'point_spread_function'), kwargs)
+        super().__init__(**kwargs)
+        for key, val in fields.items():
+            setattr(self, key, val)
+
+    @classmethod
+    def from_arrays(cls, names, **kwargs):
+        """Create one temporal focusing pattern per name, validating the arguments once for all patterns.
+
+        Takes the same arguments as the constructor and does the same checks and parsing: psf_voxel_size is required
+        with point_spread_function, and lateral_psf and axial_psf are parsed from the text widths when they are not
+        given. Each argument is either a single value shared by all patterns or a sequence with one value per
+        pattern. The array arguments lateral_psf, axial_psf, psf_voxel_size and point_spread_function are either a
+        single array or a sequence with one array, or None, per pattern.
+
+        :param names: name of each pattern
+        :returns: list of patterns
+        """
+        names = [str(name) for name in names]
+        number = len(names)
+        columns = _check_columns(cls, number, kwargs)
+        missing = [None] * number
+        for psf, voxel_size in zip(columns.get('point_spread_function', missing),
+                                   columns.get('psf_voxel_size', missing)):
+            if psf is not None and voxel_size is None:
+                raise ValueError("'psf_voxel_size' is required to use 'point_spread_function'")
+        for width in ('lateral', 'axial'):
+            values = list(columns.get(width + '_psf', missing))
+            # protocols share a few descriptions, so each distinct text is parsed once
+            parsed = dict()
+            for row, text in enumerate(columns[width + '_point_spread_function']):
+                if values[row] is None:
+                    if text not in parsed:
+                        parsed[text] = parse_point_spread_function(text)
+                    values[row] = None if parsed[text] is None else parsed[text].copy()
+            columns[width + '_psf'] = values
+        return _build_containers(cls, names, columns)
+
+    def get_psf_widths(self):
+        """Return the lateral and axial full widths at half maximum of the PSF, as [mean, s.d.] in um.
+
+        The widths are read from lateral_psf and axial_psf, or parsed from the text attributes for patterns that
+        do not store them, e.g. in files written before they were added. A width that cannot be parsed is None.
+        """
+        widths = []
+        for width in ('lateral', 'axial'):
+            value = getattr(self, width + '_psf')
+            if value is None:
+                value = parse_point_spread_function(getattr(self, width + '_point_spread_function'))
+            widths.append(None if value is None else np.asarray(value, dtype=np.float64))
+        return tuple(widths)
+
+    def get_psf(self, voxel_size=None, truncate=3.0):
+        """Return the PSF sampled on voxels, normalized to a unit sum.
+
+        The measured point_spread_function is returned if the pattern has one. Otherwise the PSF is a Gaussian whose
+        full widths at half maximum are the mean lateral and axial widths, see
+        :py:func:`ndx_holostim.excitation.gaussian_psf`. It is the default PSF of
+        :py:meth:`ndx_holostim.PatternedOptogeneticSeries.estimate_excitation`.
+
+        :param voxel_size: size [x, y, z] of a voxel, in um. Defaults to psf_voxel_size. The measured PSF is not
+            resampled, so it must match psf_voxel_size.
+        :param truncate: half-size of the Gaussian PSF, in standard deviations
+        :returns: float32 array of shape (kx, ky, kz)
+        """
+        if voxel_size is None:
+            if self.psf_voxel_size is None:
+                raise ValueError("'voxel_size' is required because '%s' has no psf_voxel_size" % self.name)
+            voxel_size = self.psf_voxel_size
+        voxel_size = np.broadcast_to(np.asarray(voxel_size, dtype=np.float64), (3,))
+        if self.point_spread_function is not None:
+            if not np.allclose(voxel_size, np.asarray(self.psf_voxel_size, dtype=np.float64)):
+                raise ValueError("the point_spread_function of '%s' is sampled on voxels of %s um, not %s um"
+                                 % (self.name, list(self.psf_voxel_size), voxel_size.tolist()))
+            psf = np.asarray(self.point_spread_function[:], dtype=np.float32)
+            return psf / psf.sum()
+        lateral, axial = self.get_psf_widths()
+        if lateral is None or axial is None:
+            raise ValueError("the PSF widths of '%s' are unknown" % self.name)
+        return gaussian_psf(lateral[0], axial[0], voxel_size, truncate=truncate)
@@ -0,0 +1,136 @@
+"""Precomputed multi-resolution copies of the ROI masks of a PatternedOptogeneticSeries.
+
+A :py:class:`RoiMaskPyramid` stores the masks max-pooled by 2, 4 and 8 along x and y, so that a pixel of a level is
+set if any pixel of its block belongs to the ROI, together with the union of all masks at full resolution. The levels
+are computed in a single pass over the masks, each from the previous one, with
+:py:func:`ndx_holostim.masks.downsample_masks`. Overview displays and quality control read the coarsest level that
+meets their resolution instead of downsampling the full-resolution masks every time.
+"""
+import numpy as np
+from hdmf.utils import docval, popargs, popargs_to_dict
+from pynwb import register_class
+from pynwb.core import NWBDataInterface
+
+from .io import _read_rows, _unwrap, wrap_roi_data
+from .masks import downsample_masks
+
+# downsampling factors of the levels of a pyramid, each stored in the dataset 'masks_<factor>x'
+PYRAMID_FACTORS = (2, 4, 8)
+
+
+def _level_name(factor):
+    return 'masks_%dx' % factor
+
+
+def build_mask_pyramid(batches, mask_shape, factors=PYRAMID_FACTORS):
+    """Compute the levels and the footprint of a mask pyramid in one pass over batches of masks.
+
+    :param batches: iterable of boolean arrays of shape (batch, x, y, z), e.g. the masks of
+        :py:meth:`ndx_holostim.PatternedOptogeneticSeries.iter_rois`
+    :param mask_shape: [x, y, z] shape of one mask
+    :param factors: downsampling factors, a subset of :py:data:`PYRAMID_FACTORS`
+    :returns: dict with the masks of each level, keyed by dataset name, and the ``footprint``
+    """
+    factors = sorted(int(factor) for factor in factors)
+    if not set(factors) <= set(PYRAMID_FACTORS):
+        raise ValueError("factors must be among %s, got %s" % (PYRAMID_FACTORS, factors))
+    mask_shape = tuple(int(s) for s in mask_shape)
+    levels = {factor: [] for factor in factors}
+    footprint = np.zeros(mask_shape, dtype=bool)
+    for masks in batches:
+        masks = np.asarray(masks, dtype=bool)
+        footprint |= masks.any(axis=0)
+        previous, level = 1, masks
+        for factor in factors:
+            # the factors divide each other, so pooling the previous level is equivalent to pooling the masks
+            level = downsample_masks(level, factor // previous)
+            levels[factor].append(level)
+            previous = factor
+    result = dict(footprint=footprint)
+    for factor in factors:
+        shape = (0, -(-mask_shape[0] // factor), -(-mask_shape[1] // factor), mask_shape[2])
+        result[_level_name(factor)] = np.concatenate(levels[factor]) if levels[factor] else np.zeros(shape, bool)
+    return result
+
+
+@register_class('RoiMaskPyramid', 'ndx-holostim')
+class RoiMaskPyramid(NWBDataInterface):
+    """Downsampled copies of the ROI masks of a PatternedOptogeneticSeries, for overview displays."""
+
+    __nwbfields__ = ('mask_shape', 'masks_2x', 'masks_4x', 'masks_8x', 'footprint')
+
+    @docval(
+        {'name': 'mask_shape', 'type': ('array_data', 'data'), 'shape': (3,),
+         'doc': 'shape [x, y, z] of a single ROI mask at full resolution'},
+        {'name': 'name', 'type': str, 'doc': 'name of the pyramid', 'default': 'mask_pyramid'},
+        {'name': 'masks_2x', 'type': ('array_data', 'data'), 'shape': (None, None, None, None), 'default': None,
+         'doc': 'ROI masks max-pooled over blocks of 2 x 2 pixels along x and y'},
+        {'name': 'masks_4x', 'type': ('array_data', 'data'), 'shape': (None, None, None, None), 'default': None,
+         'doc': 'ROI masks max-pooled over blocks of 4 x 4 pixels along x and y'},
+        {'name': 'masks_8x', 'type': ('array_data', 'data'), 'shape': (None, None, None, None), 'default': None,
+         'doc': 'ROI masks max-pooled over blocks of 8 x 8 pixels along x and y'},
+        {'name': 'footprint', 'type': ('array_data', 'data'), 'shape': (None, None, None), 'default': None,
+         'doc': 'union of the masks of all ROIs at full resolution'},
+        {'name': 'roi_dataio', 'type': (bool, dict), 'default': True,
+         'doc': ('how to wrap the in-memory levels for writing, see the roi_dataio argument of '
+                 'PatternedOptogeneticSeries')},
+    )
+    def __init__(self, **kwargs):
+        roi_dataio = popargs('roi_dataio', kwargs)
+        if roi_dataio is not False:
+            settings = roi_dataio if isinstance(roi_dataio, dict) else dict()
+            for factor in PYRAMID_FACTORS:
+                kwargs[_level_name(factor)] = wrap_roi_data(kwargs[_level_name(factor)], **settings)
+        fields = popargs_to_dict(('mask_shape', 'masks_2x', 'masks_4x', 'masks_8x', 'footprint'), kwargs)
+        super().__init__(**kwargs)
+        for key, val in fields.items():
+            setattr(self, key, val)
+
+    @classmethod
+    def from_masks(cls, masks, factors=PYRAMID_FACTORS, name='mask_pyramid', roi_dataio=True):
+        """Build the pyramid of a stack of masks of shape (number_rois, x, y[, z]).
+
+        :param masks: array-like of shape (number_rois, x, y) or (number_rois, x, y, z)
+        :param factors: downsampling factors to store, a subset of :py:data:`PYRAMID_FACTORS`
+        :param name: name of the pyramid
+        :param roi_dataio: how to wrap the levels for writing
+        """
+        masks = np.asarray(masks)
+        if masks.ndim == 3:
+            masks = masks[..., np.newaxis]
+        if masks.ndim != 4:
+            raise ValueError("masks must have shape (number_rois, x, y) or (number_rois, x, y, z), got %s"
+                             % str(masks.shape))
+        fields = build_mask_pyramid([masks], masks.shape[1:], factors=factors)
+        return cls(name=name, mask_shape=np.asarray(masks.shape[1:], dtype=np.uint32), roi_dataio=roi_dataio,
+                   **fields)
+
+    @property
+    def factors(self):
+        """Downsampling factors of the stored levels, in increasing order"""
+        return tuple(factor for factor in PYRAMID_FACTORS if getattr(self, _level_name(factor)) is not None)
+
+    def choose_factor(self, factor):
+        """Return the coarsest stored factor that is at most ``factor``, or 1 if no level is fine enough.
+
+        :param factor: the coarsest downsampling factor that meets the requested resolution
+        """
+        fine_enough = [stored for stored in self.factors if stored <= factor]
+        return fine_enough[-1] if fine_enough else 1
+
+    def get_level(self, factor):
+        """Return the dataset of the masks downsampled by ``factor``, one of :py:attr:`factors`."""
+        if factor not in self.factors:
+            raise ValueError("'%s' has no level %d, stored levels are %s" % (self.name, factor, self.factors))
+        return _unwrap(getattr(self, _level_name(factor)))
+
+    def get_masks(self, factor, rois=None):
+        """Return the masks of a level as a boolean array of shape (number_rois, ceil(x / factor), ceil(y / factor), z).
+
+        :param factor: downsampling factor, one of :py:attr:`factors`
+        :param rois: ROI numbers to return. If None, all ROIs are returned.
+        """
+        level = self.get_level(factor)
+        if rois is None:
+            return np.asarray(level[:]).astype(bool)
+        return _read_rows(level, rois).astype(bool)
@@ -0,0 +1,261 @@
+"""Parallel extraction of photostimulation metadata from many NWB files.
+
+Reading a file with ``NWBHDF5IO`` builds the whole object graph, which dominates the cost of collecting a few
+parameters from thousands of files. :py:func:`scan_files` instead opens each file with h5py in a pool of processes,
+finds the ndx-holostim groups from their ``neurodata_type`` attribute and reads only their scalar attributes, the
+targets of their links, the shape of their ROI datasets and the ``center_rois`` dataset. The results of all files
+are gathered into columnar tables of numpy arrays, one row per object, which can be converted to Arrow tables.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import h5py
+import numpy as np
+
+NAMESPACE = 'ndx-holostim'
+
+# neurodata types gathered in each table of a scan
+SCANNED_TYPES = {
+    'series': ('PatternedOptogeneticSeries',),
+    'patterns': ('OptogeneticStimulusPattern', 'SpiralScanning', 'TemporalFocusing'),
+    'devices': ('LightSource', 'SpatialLightModulator'),
+}
+
+# datasets of PatternedOptogeneticSeries whose length is the number of ROIs, in order of precedence
+_ROI_COUNT_DATASETS = (
+    'library_roi_index',
+    'image_mask_roi_index',
+    'pixel_rois_index',
+    'image_mask_roi_packed',
+    'image_mask_roi',
+    'center_rois',
+    'pixel_rois',
+)
+
+# attributes written by HDMF for every typed group, which are already implied by the scan
+_SKIPPED_ATTRIBUTES = ('namespace', 'object_id')
+
+
+def _value(value):
+    """Convert an h5py attribute or scalar dataset value to a Python scalar, or None if it is not a scalar."""
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, np.ndarray):
+        if value.ndim != 0:
+            return None
+        value = value[()]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _link_target(group, name):
+    """Return the path of the object that a link of a group points to, or None if there is no link."""
+    link = group.get(name, getlink=True)
+    if link is None:
+        return None
+    if isinstance(link, h5py.SoftLink):
+        return link.path
+    if isinstance(link, h5py.ExternalLink):
+        return '%s:%s' % (link.filename, link.path)
+    return group[name].name
+
+
+def _read_group(group):
+    """Return the scalar attributes of a typed group as a row."""
+    row = dict(path=group.name, name=group.name.rsplit('/', 1)[-1])
+    for key, value in group.attrs.items():
+        if key in _SKIPPED_ATTRIBUTES:
+            continue
+        value = _value(value)
+        if value is not None:
+            row[key] = value
+    return row
+
+
+def _read_series(group, rois):
+    """Return the row of a PatternedOptogeneticSeries and append its ROI centers to ``rois``."""
+    row = _read_group(group)
+    for name in ('site', 'stimulus_pattern', 'device', 'spatial_light_modulator', 'light_source', 'pattern_library'):
+        row[name] = _link_target(group, name)
+    row['number_rois'] = 0
+    for name in _ROI_COUNT_DATASETS:
+        if name in group:
+            row['number_rois'] = group[name].shape[0]
+            break
+    if 'center_rois' in group:
+        centers = np.asarray(group['center_rois'][()], dtype=np.float64).reshape(len(group['center_rois']), -1)
+        if centers.shape[1] == 3:  # [x, y, r] in plane 0
+            centers = np.insert(centers, 2, 0, axis=1)
+        rois.append((group.name, centers))
+    return row
+
+
+def scan_file(path):
+    """Extract the photostimulation metadata of one NWB file with h5py, without building the object graph.
+
+    :param path: path to the NWB file
+    :returns: dict with, for each table of :py:data:`SCANNED_TYPES` and for ``'rois'``, a list of rows. The rows of
+        ``'rois'`` are tuples ``(series_path, centers)`` with the centers [x, y, z, r] of the ROIs of a series.
+    """
+    types = {data_type: table for table, data_types in SCANNED_TYPES.items() for data_type in data_types}
+    rows = {table: [] for table in SCANNED_TYPES}
+    rows['rois'] = []
+
+    def visit(group):
+        for name in group:
+            if not isinstance(group.get(name, getlink=True), h5py.HardLink):
+                continue  # links are read from the linking group, and their targets are visited where they live
+            if group.get(name, getclass=True) is not h5py.Group:
+                continue
+            child = group[name]
+            table = None
+            if _value(child.attrs.get('namespace')) == NAMESPACE:
+                table = types.get(_value(child.attrs.get('neurodata_type')))
+            if table == 'series':
+                rows[table].append(_read_series(child, rows['rois']))
+            elif table is not None:
+                rows[table].append(_read_group(child))
+            visit(child)
+
+    with h5py.File(path, 'r') as file:
+        for name in file:
+            # the cached specification is large and never holds data objects
+            if name != 'specifications' and file.get(name, getclass=True) is h5py.Group:
+                visit(file[name])
+    return rows
+
+
+def _scan_file_or_error(path):
+    try:
+        return scan_file(path), None
+    except Exception as error:  # reported per file so that one broken file does not abort the whole scan
+        return None, '%s: %s' % (type(error).__name__, error)
+
+
+def _to_column(values):
+    """Convert the values of one column to a numpy array: float64 with NaN for missing numbers, else objects."""
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        if len(present) == len(values) and all(isinstance(value, int) for value in present):
+            return np.asarray(values, dtype=np.int64)
+        return np.asarray([np.nan if value is None else value for value in values], dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _to_columns(rows, files):
+    """Gather rows of dicts into a dict of columns, with the union of the keys of all rows."""
+    keys = {'file': None}
+    for row in rows:
+        keys.update(dict.fromkeys(row))
+    columns = {key: _to_column([row.get(key) for row in rows]) for key in keys if key != 'file'}
+    file_column = np.empty(len(rows), dtype=object)
+    file_column[:] = files
+    return dict(file=file_column, **columns)
+
+
+class ScanResult:
+    """Metadata extracted from many NWB files by :py:func:`scan_files`, as columnar tables.
+
+    Each table is a dict of numpy arrays of the same length, with one row per object and a ``file`` column. Numeric
+    columns are float64 with NaN where an object does not have the field, and other columns hold Python objects.
+
+    - ``series``: one row per PatternedOptogeneticSeries, with its scalar attributes, the path of the targets of its
+      links and its ``number_rois``
+    - ``patterns``: one row per OptogeneticStimulusPattern, SpiralScanning or TemporalFocusing
+    - ``devices``: one row per LightSource or SpatialLightModulator
+    - ``rois``: one row per ROI center, with the ``series`` path, the ``roi`` number and ``x``, ``y``, ``z``, ``r``
+
+    :ivar files: the scanned files, in order
+    :ivar errors: dict from the path of each file that could not be read to the error message
+    """
+
+    def __init__(self, tables, files, errors):
+        self.tables = tables
+        self.files = files
+        self.errors = errors
+
+    def __getitem__(self, table):
+        return self.tables[table]
+
+    def __repr__(self):
+        sizes = ", ".join("%s=%d" % (name, len(table['file'])) for name, table in self.tables.items())
+        return "%s(files=%d, %s)" % (type(self).__name__, len(self.files), sizes)
+
+    def to_arrow(self, table):
+        """Return a table as a ``pyarrow.Table``. Requires the ``arrow`` extra.
+
+        :param table: name of the table, e.g. ``'series'``
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as error:
+            raise ImportError("to_arrow requires pyarrow, install it with 'pip install ndx-holostim[arrow]'") from error
+        return pa.table({key: pa.array(column) for key, column in self.tables[table].items()})
+
+
+def scan_files(paths, max_workers=None, chunksize=8, skip_errors=False, cache=None):
+    """Extract the photostimulation metadata of many NWB files in parallel into columnar tables.
+
+    Files are read with :py:func:`scan_file` in a pool of ``max_workers`` processes. Only the attributes and
+    datasets needed for the tables of :py:class:`ScanResult` are read.
+
+    :param paths: paths to the NWB files
+    :param max_workers: number of processes. Defaults to the number of CPUs. With 1, files are read in this process.
+    :param chunksize: number of files sent to a process at a time
+    :param skip_errors: if True, files that cannot be read are listed in ``ScanResult.errors`` instead of raising an
+        error
+    :param cache: a :py:class:`ndx_holostim.cache.ScanCache`. Unchanged files are read from the cache and the
+        scans of the other files are stored in it.
+    :returns: a :py:class:`ScanResult`
+    """
+    paths = [os.fspath(path) for path in paths]
+    results = [None] * len(paths)
+    if cache is not None:
+        results = [None if rows is None else (rows, None) for rows in cache.get_many(paths)]
+    missing = [number for number, result in enumerate(results) if result is None]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers == 1 or len(missing) <= 1:
+        scanned = [_scan_file_or_error(paths[number]) for number in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            scanned = list(executor.map(_scan_file_or_error, [paths[number] for number in missing],
+                                        chunksize=chunksize))
+    for number, result in zip(missing, scanned):
+        results[number] = result
+    if cache is not None:
+        stored = [(paths[number], result[0]) for number, result in zip(missing, scanned) if result[1] is None]
+        cache.put_many([path for path, _ in stored], [rows for _, rows in stored])
+    errors = {path: error for path, (_, error) in zip(paths, results) if error is not None}
+    if errors and not skip_errors:
+        path, error = next(iter(errors.items()))
+        raise OSError("could not scan '%s' (%s), and %d other files" % (path, error, len(errors) - 1))
+    tables = dict()
+    for table in SCANNED_TYPES:
+        rows, files = [], []
+        for path, (file_rows, _) in zip(paths, results):
+            if file_rows is not None:
+                rows.extend(file_rows[table])
+                files.extend([path] * len(file_rows[table]))
+        tables[table] = _to_columns(rows, files)
+    centers, numbers, series, files = [], [], [], []
+    for path, (file_rows, _) in zip(paths, results):
+        for series_path, series_centers in (file_rows['rois'] if file_rows is not None else ()):
+            centers.append(series_centers)
+            numbers.append(np.arange(len(series_centers), dtype=np.int64))
+            series.extend([series_path] * len(series_centers))
+            files.extend([path] * len(series_centers))
+    centers = np.concatenate(centers) if centers else np.zeros((0, 4))
+    tables['rois'] = dict(
+        file=_to_column(files),
+        series=_to_column(series),
+        roi=np.concatenate(numbers) if numbers else np.zeros(0, dtype=np.int64),
+        x=centers[:, 0],
+        y=centers[:, 1],
+        z=centers[:, 2],
+        r=centers[:, 3],
+    )
+    return ScanResult(tables, paths, errors)
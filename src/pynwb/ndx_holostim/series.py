@@ -0,0 +1,767 @@
+import bisect
+
+import numpy as np
+from hdmf.utils import docval, popargs, popargs_to_dict
+from pynwb import register_class
+from pynwb.core import NWBDataInterface
+from pynwb.device import Device
+
+from .devices import LightSource, SpatialLightModulator
+from .conversion import centers_to_plane_index, group_rois_by_plane
+from .events import PatternedOptogeneticStimulusTable
+from .excitation import estimate_excitation
+from .holography import DEFAULT_ITERATIONS, compute_phase_masks
+from .io import (
+    HOLOGRAM_DATASETS,
+    ROI_DATASETS,
+    TIME_DATASETS,
+    _read_rows,
+    _unwrap,
+    append_to_dataset,
+    memmap_dataset,
+    wrap_roi_data,
+    wrap_time_data,
+)
+from .library import StimulusPatternLibrary
+from .masks import (
+    PackedMaskArray,
+    decode_sparse_masks,
+    decode_sparse_window,
+    downsample_masks,
+    encode_sparse_masks,
+    mask_bounding_boxes,
+    pack_masks,
+    sparse_roi_bounds,
+)
+from .patterns import OptogeneticStimulusPattern, TemporalFocusing
+from .pyramid import PYRAMID_FACTORS, RoiMaskPyramid, build_mask_pyramid
+from .site import PatternedOptogeneticStimulusSite
+from .spatial import RoiSpatialIndex
+
+
+@register_class('PatternedOptogeneticSeries', 'ndx-holostim')
+class PatternedOptogeneticSeries(NWBDataInterface):
+    """An extension of OptogeneticSeries to include the spatial patterns for the photostimulation."""
+
+    __nwbfields__ = (
+        'description',
+        'rate',
+        'starting_time',
+        'unit',
+        'image_mask_shape',
+        {'name': 'stimulus_events', 'child': True},
+        {'name': 'mask_pyramid', 'child': True},
+        'image_mask_roi',
+        'image_mask_roi_indices',
+        'image_mask_roi_index',
+        'image_mask_roi_packed',
+        'center_rois',
+        'pixel_rois',
+        'pixel_rois_index',
+        'library_roi_index',
+        'plane_rois',
+        'plane_rois_index',
+        'phase_masks',
+        'phase_mask_rois',
+        'phase_mask_rois_index',
+        'data',
+        'timestamps',
+        'site',
+        'stimulus_pattern',
+        'device',
+        'spatial_light_modulator',
+        'light_source',
+        'pattern_library',
+    )
+
+    @docval(
+        {'name': 'name', 'type': str, 'doc': 'name of the series'},
+        {'name': 'site', 'type': PatternedOptogeneticStimulusSite, 'doc': 'link to the patterned stimulus site'},
+        {'name': 'stimulus_pattern', 'type': OptogeneticStimulusPattern, 'doc': 'link to the stimulus pattern'},
+        {'name': 'device', 'type': Device, 'doc': 'link to the device used to generate the photostimulation'},
+        {'name': 'spatial_light_modulator', 'type': SpatialLightModulator,
+         'doc': 'link to the spatial modulator device'},
+        {'name': 'light_source', 'type': LightSource, 'doc': 'link to the light source'},
+        {'name': 'description', 'type': str, 'doc': 'description of the series', 'default': None},
+        {'name': 'rate', 'type': (float, np.float32, np.float64), 'doc': 'series framerate', 'default': None},
+        {'name': 'starting_time', 'type': (float, np.float64), 'default': None,
+         'doc': ('time of the first sample of data, in seconds, when the samples are regularly spaced at rate '
+                 'instead of given by timestamps. Defaults to 0')},
+        {'name': 'unit', 'type': str, 'doc': 'SI unit of data', 'default': 'watts'},
+        {'name': 'image_mask_shape', 'type': ('array_data', 'data'), 'shape': (3,), 'default': None,
+         'doc': ('shape [x, y, z] of a single ROI mask. Required when the masks are stored sparsely in '
+                 'image_mask_roi_indices and image_mask_roi_index or bit-packed in image_mask_roi_packed')},
+        {'name': 'stimulus_events', 'type': PatternedOptogeneticStimulusTable, 'default': None,
+         'doc': 'the individual photostimulation pulses delivered to the ROIs of this series'},
+        {'name': 'mask_pyramid', 'type': RoiMaskPyramid, 'default': None,
+         'doc': 'downsampled copies of the ROI masks, see PatternedOptogeneticSeries.create_mask_pyramid'},
+        {'name': 'image_mask_roi', 'type': ('array_data', 'data'), 'shape': (None, None, None, None),
+         'default': None,
+         'doc': ('ROIs designated using a mask of size [width, height] (2D recording) or [width, height, depth] (3D '
+                 'recording), where for a given pixel a value of 1 indicates belonging to the ROI')},
+        {'name': 'image_mask_roi_indices', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'sparse encoding of image_mask_roi, see ndx_holostim.masks.encode_sparse_masks'},
+        {'name': 'image_mask_roi_index', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'end offset of the pixels of each ROI in image_mask_roi_indices'},
+        {'name': 'image_mask_roi_packed', 'type': ('array_data', 'data'), 'shape': (None, None, None, None),
+         'default': None,
+         'doc': ('ROI masks packed 8 pixels per byte along x, see ndx_holostim.masks.pack_masks. Requires '
+                 'image_mask_shape')},
+        {'name': 'center_rois', 'type': ('array_data', 'data'), 'shape': (None, None), 'default': None,
+         'doc': 'center [x, y, z] and radius r of each ROI'},
+        {'name': 'pixel_rois', 'type': ('array_data', 'data'), 'shape': ((None, None), (None, None, None)),
+         'default': None,
+         'doc': ('pixels [x, y, z] of each ROI, either padded to the largest ROI or ragged and indexed by '
+                 'pixel_rois_index')},
+        {'name': 'pixel_rois_index', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'end offset of the pixels of each ROI in a ragged pixel_rois'},
+        {'name': 'library_roi_index', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': ('index of the mask of each ROI in pattern_library, see '
+                 'ndx_holostim.library.StimulusPatternLibrary.add_masks')},
+        {'name': 'plane_rois', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': ('numbers of the ROIs in each imaging plane, grouped by plane, see '
+                 'PatternedOptogeneticSeries.compute_plane_index')},
+        {'name': 'plane_rois_index', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'end offset of the ROIs of each plane in plane_rois'},
+        {'name': 'phase_masks', 'type': ('array_data', 'data'), 'shape': (None, None, None), 'default': None,
+         'doc': ('phase, in radians, displayed on spatial_light_modulator for each hologram, see '
+                 'PatternedOptogeneticSeries.create_phase_masks')},
+        {'name': 'phase_mask_rois', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'numbers of the ROIs targeted by each hologram, concatenated over holograms'},
+        {'name': 'phase_mask_rois_index', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'end offset of the ROIs of each hologram in phase_mask_rois'},
+        {'name': 'pattern_library', 'type': StimulusPatternLibrary, 'default': None,
+         'doc': 'link to the library holding the masks referred to by library_roi_index'},
+        {'name': 'data', 'type': ('array_data', 'data'), 'shape': (None, None), 'default': None,
+         'doc': 'power delivered to each ROI over time, of shape (num_times, number_rois)'},
+        {'name': 'timestamps', 'type': ('array_data', 'data'), 'shape': (None,), 'default': None,
+         'doc': 'sorted time of each sample of data, in seconds'},
+        {
+            'name': 'roi_dataio',
+            'type': (bool, dict),
+            'doc': ('how to wrap in-memory ROI and time-resolved datasets for writing. True uses the chunking and '
+                    'compression settings in ndx_holostim.io.DEFAULT_ROI_DATAIO, a dict overrides some of these '
+                    'settings and False leaves the data unwrapped. Data already wrapped in a DataIO is never '
+                    'modified.'),
+            'default': True,
+        },
+    )
+    def __init__(self, **kwargs):
+        roi_dataio = popargs('roi_dataio', kwargs)
+        if kwargs['library_roi_index'] is not None and kwargs['pattern_library'] is None:
+            raise ValueError("'pattern_library' is required to resolve 'library_roi_index'")
+        if kwargs['image_mask_roi_packed'] is not None and kwargs['image_mask_shape'] is None:
+            raise ValueError("'image_mask_shape' is required to unpack 'image_mask_roi_packed'")
+        if (kwargs['plane_rois'] is None) != (kwargs['plane_rois_index'] is None):
+            raise ValueError("'plane_rois' and 'plane_rois_index' must be given together")
+        if (kwargs['phase_mask_rois'] is None) != (kwargs['phase_mask_rois_index'] is None):
+            raise ValueError("'phase_mask_rois' and 'phase_mask_rois_index' must be given together")
+        if roi_dataio is not False:
+            settings = roi_dataio if isinstance(roi_dataio, dict) else dict()
+            for name in ROI_DATASETS + HOLOGRAM_DATASETS:
+                kwargs[name] = wrap_roi_data(kwargs[name], **settings)
+            for name in TIME_DATASETS:
+                kwargs[name] = wrap_time_data(kwargs[name], **settings)
+        fields = popargs_to_dict([field if isinstance(field, str) else field['name']
+                                  for field in PatternedOptogeneticSeries.__nwbfields__], kwargs)
+        super().__init__(**kwargs)
+        for key, val in fields.items():
+            setattr(self, key, val)
+
+    @property
+    def number_rois(self):
+        """Number of ROIs in the series, taken from whichever ROI dataset is present"""
+        if self.has_library_masks:
+            return len(_unwrap(self.library_roi_index))
+        if self.has_sparse_masks:
+            return len(_unwrap(self.image_mask_roi_index))
+        if self.has_packed_masks:
+            return len(_unwrap(self.image_mask_roi_packed))
+        if self.has_ragged_pixels:
+            return len(_unwrap(self.pixel_rois_index))
+        for data in (self.image_mask_roi, self.center_rois, self.pixel_rois):
+            if data is not None:
+                return len(_unwrap(data))
+        return 0
+
+    @property
+    def has_sparse_masks(self):
+        """Whether the ROI masks are stored in the sparse encoding"""
+        return self.image_mask_roi_indices is not None and self.image_mask_roi_index is not None
+
+    @property
+    def has_packed_masks(self):
+        """Whether the ROI masks are stored bit-packed in image_mask_roi_packed"""
+        return self.image_mask_roi_packed is not None
+
+    @property
+    def has_library_masks(self):
+        """Whether the ROI masks are stored in pattern_library and referred to by library_roi_index"""
+        return self.library_roi_index is not None and self.pattern_library is not None
+
+    @property
+    def has_image_masks(self):
+        """Whether the series stores ROI masks, in any encoding"""
+        return (self.image_mask_roi is not None or self.has_sparse_masks or self.has_packed_masks
+                or self.has_library_masks)
+
+    @property
+    def roi_mask_shape(self):
+        """Shape [x, y, z] of a single ROI mask, or None if the series has no masks"""
+        if self.image_mask_shape is not None:
+            return tuple(int(s) for s in self.image_mask_shape)
+        if self.has_library_masks:
+            return tuple(int(s) for s in self.pattern_library.mask_shape)
+        if self.image_mask_roi is not None:
+            return tuple(int(s) for s in self.image_mask_roi.shape[1:])
+        return None
+
+    @property
+    def has_ragged_pixels(self):
+        """Whether pixel_rois is stored as a ragged array indexed by pixel_rois_index"""
+        return self.pixel_rois is not None and self.pixel_rois_index is not None
+
+    def get_image_masks(self, rois=None):
+        """Return the ROI masks as a dense boolean array of shape (number_rois, x, y, z).
+
+        Masks stored in the sparse encoding or bit-packed are expanded on demand and only the requested ROIs are
+        read. Masks stored in a pattern library are resolved through the mask cache of the library.
+
+        :param rois: ROI numbers to return. If None, all ROIs are returned.
+        """
+        if self.has_library_masks:
+            entries = _unwrap(self.library_roi_index)
+            entries = np.asarray(entries[:]) if rois is None else _read_rows(entries, rois)
+            return self.pattern_library.get_masks(entries)
+        if self.has_sparse_masks:
+            if self.image_mask_shape is None:
+                raise ValueError("'image_mask_shape' is required to expand the sparse masks of '%s'" % self.name)
+            return decode_sparse_masks(_unwrap(self.image_mask_roi_indices), _unwrap(self.image_mask_roi_index),
+                                       self.image_mask_shape, rois=rois)
+        if self.has_packed_masks:
+            masks = self.get_packed_masks()
+            return masks[:] if rois is None else masks[np.asarray(rois, dtype=np.int64)]
+        if self.image_mask_roi is None:
+            raise ValueError("'%s' has no image masks" % self.name)
+        if rois is None:
+            return np.asarray(_unwrap(self.image_mask_roi)[:]).astype(bool)
+        return _read_rows(self.image_mask_roi, rois).astype(bool)
+
+    def get_downsampled_masks(self, factor, rois=None):
+        """Return the ROI masks max-pooled along x and y, from mask_pyramid when it holds a suitable level.
+
+        :param factor: the coarsest downsampling factor that meets the requested resolution
+        :param rois: ROI numbers to return. If None, all ROIs are returned.
+        :returns: tuple ``(masks, factor)`` with the boolean masks of shape (number_rois, ceil(x / factor),
+            ceil(y / factor), z) and the factor of the masks: the coarsest level of mask_pyramid that is at most the
+            requested factor, or, without a pyramid, the requested factor applied to the full-resolution masks
+        """
+        if self.mask_pyramid is not None:
+            factor = self.mask_pyramid.choose_factor(factor)
+            if factor > 1:
+                return self.mask_pyramid.get_masks(factor, rois=rois), factor
+        return downsample_masks(self.get_image_masks(rois=rois), factor), factor
+
+    def create_mask_pyramid(self, factors=PYRAMID_FACTORS, batch_size=64, roi_dataio=True):
+        """Compute downsampled copies of the ROI masks and their footprint and store them in mask_pyramid.
+
+        All levels are computed in a single pass over the masks, read in batches of ``batch_size`` ROIs. Call this
+        method before writing the series.
+
+        :param factors: downsampling factors to store, a subset of :py:data:`ndx_holostim.pyramid.PYRAMID_FACTORS`
+        :param batch_size: maximum number of ROI masks read at a time
+        :param roi_dataio: how to wrap the levels for writing, see the ``roi_dataio`` argument
+        :returns: the :py:class:`ndx_holostim.pyramid.RoiMaskPyramid`
+        """
+        if self.mask_pyramid is not None:
+            raise ValueError("'%s' already has a mask_pyramid" % self.name)
+        if not self.has_image_masks:
+            raise ValueError("'%s' has no image masks" % self.name)
+        mask_shape = self.roi_mask_shape
+        fields = build_mask_pyramid((masks for _, masks in self.iter_rois(batch_size=batch_size)), mask_shape,
+                                    factors=factors)
+        self.mask_pyramid = RoiMaskPyramid(mask_shape=np.asarray(mask_shape, dtype=np.uint32), roi_dataio=roi_dataio,
+                                           **fields)
+        return self.mask_pyramid
+
+    def estimate_excitation(self, psf=None, voxel_size=None, threshold=0.5, min_crosstalk=0.01, batch_size=16,
+                            workers=None):
+        """Estimate the volume excited by each ROI and its crosstalk on the other ROIs.
+
+        The masks are convolved with the PSF in batches of ``batch_size`` ROIs, see
+        :py:func:`ndx_holostim.excitation.estimate_excitation`, so the excitation volumes are never all in memory.
+
+        :param psf: PSF of shape (kx, ky, kz) on the voxels of the masks. Defaults to the PSF of stimulus_pattern,
+            which must then be a :py:class:`ndx_holostim.TemporalFocusing`, see
+            :py:meth:`ndx_holostim.TemporalFocusing.get_psf`.
+        :param voxel_size: size [x, y, z] of a voxel of the masks, in um. Defaults to the psf_voxel_size of
+            stimulus_pattern. Volumes are in voxels if it is unknown.
+        :param threshold: fraction of the peak excitation of a ROI above which a voxel counts in its excited volume
+        :param min_crosstalk: smallest crosstalk returned
+        :param batch_size: maximum number of ROI masks convolved at once
+        :param workers: number of threads of each FFT, if scipy is installed
+        :returns: tuple ``(volumes, (rois, values, index))`` with the excited volume of each ROI, in um^3 or voxels,
+            and the ragged crosstalk of each stimulated ROI on the other ROIs
+        """
+        if not self.has_image_masks:
+            raise ValueError("'%s' has no image masks" % self.name)
+        pattern = self.stimulus_pattern if isinstance(self.stimulus_pattern, TemporalFocusing) else None
+        if voxel_size is None and pattern is not None:
+            voxel_size = pattern.psf_voxel_size
+        if psf is None:
+            if pattern is None:
+                raise ValueError("'psf' is required because the stimulus_pattern of '%s' is not TemporalFocusing"
+                                 % self.name)
+            psf = pattern.get_psf(voxel_size)
+        voxel_volume = 1.0 if voxel_size is None else float(np.prod(np.broadcast_to(voxel_size, (3,))))
+        return estimate_excitation(lambda: (masks for _, masks in self.iter_rois(batch_size=batch_size)), psf,
+                                   threshold=threshold, voxel_volume=voxel_volume, min_crosstalk=min_crosstalk,
+                                   workers=workers)
+
+    def get_roi(self, roi):
+        """Return the boolean mask of shape (x, y, z) of a single ROI.
+
+        Only the hyperslab holding this ROI is read from the file.
+
+        :param roi: the ROI number
+        """
+        roi = self._check_roi(roi)
+        if self.has_packed_masks:
+            return self.get_packed_masks()[roi]
+        if self.has_sparse_masks or self.has_library_masks or self.image_mask_roi is None:
+            return self.get_image_masks(rois=[roi])[0]
+        return np.asarray(_unwrap(self.image_mask_roi)[roi]).astype(bool)
+
+    def iter_rois(self, batch_size=64):
+        """Iterate over the ROI masks in batches, reading one contiguous block of ROIs at a time.
+
+        :param batch_size: maximum number of ROIs per batch
+        :returns: iterator of ``(start, masks)`` tuples, where ``masks`` is a boolean array of shape
+            (batch, x, y, z) holding ROIs ``start`` to ``start + len(masks)``
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
+        for start in range(0, self.number_rois, batch_size):
+            stop = min(start + batch_size, self.number_rois)
+            if self.has_packed_masks:
+                yield start, self.get_packed_masks()[start:stop]
+            elif self.has_sparse_masks or self.has_library_masks or self.image_mask_roi is None:
+                yield start, self.get_image_masks(rois=np.arange(start, stop))
+            else:
+                yield start, np.asarray(_unwrap(self.image_mask_roi)[start:stop]).astype(bool)
+
+    def roi_bounding_boxes(self, batch_size=64):
+        """Compute the bounding box of every ROI mask.
+
+        Sparse masks are processed directly from their pixel indices; dense masks are read in batches of
+        ``batch_size`` ROIs, so the full mask stack is never loaded.
+
+        :param batch_size: maximum number of ROIs read at a time from dense masks
+        :returns: int64 array of shape (number_rois, 3, 2) holding the [start, stop) range of each ROI along
+            x, y and z. Empty ROIs have an empty [0, 0) range.
+        """
+        boxes = np.zeros((self.number_rois, 3, 2), dtype=np.int64)
+        if self.has_sparse_masks:
+            mask_shape = tuple(int(s) for s in self.image_mask_shape)
+            indices, index = _unwrap(self.image_mask_roi_indices), _unwrap(self.image_mask_roi_index)
+            starts, stops = sparse_roi_bounds(index)
+            for first in range(0, len(starts), batch_size):
+                last = min(first + batch_size, len(starts))
+                lengths = stops[first:last] - starts[first:last]
+                nonempty = lengths > 0
+                if not nonempty.any():
+                    continue
+                coords = np.stack(np.unravel_index(np.asarray(indices[starts[first]:stops[last - 1]]), mask_shape))
+                offsets = (np.cumsum(lengths) - lengths)[nonempty]
+                rows = np.arange(first, last)[nonempty]
+                boxes[rows, :, 0] = np.minimum.reduceat(coords, offsets, axis=1).T
+                boxes[rows, :, 1] = np.maximum.reduceat(coords, offsets, axis=1).T + 1
+            return boxes
+        for start, masks in self.iter_rois(batch_size=batch_size):
+            boxes[start:start + len(masks)] = mask_bounding_boxes(masks)
+        return boxes
+
+    def get_packed_masks(self):
+        """Return the bit-packed ROI masks as a read-only array of booleans of shape (number_rois, x, y, z).
+
+        The returned :py:class:`ndx_holostim.masks.PackedMaskArray` can be sliced like a dense mask dataset: only the
+        packed bytes of the selected ROIs are read and unpacked.
+        """
+        if not self.has_packed_masks:
+            raise ValueError("'%s' has no image_mask_roi_packed" % self.name)
+        return PackedMaskArray(_unwrap(self.image_mask_roi_packed), self.image_mask_shape)
+
+    @property
+    def number_planes(self):
+        """Number of imaging planes in the plane index, or None if the series has no plane index"""
+        return None if self.plane_rois_index is None else len(_unwrap(self.plane_rois_index))
+
+    def compute_plane_index(self, batch_size=64):
+        """Group the ROIs of the series by imaging plane, e.g. to store them in plane_rois and plane_rois_index.
+
+        ROIs are assigned to every plane in which their mask has pixels, reading the masks in batches of
+        ``batch_size`` ROIs, or to the plane of their center, i.e. the rounded z of center_rois, if the series has
+        no masks.
+
+        :param batch_size: maximum number of ROI masks read at a time
+        :returns: tuple ``(plane_rois, plane_rois_index)``, see
+            :py:func:`ndx_holostim.conversion.group_rois_by_plane`
+        """
+        if not self.has_image_masks:
+            if self.center_rois is None:
+                raise ValueError("'%s' has no ROI masks or center_rois to find the plane of its ROIs" % self.name)
+            return centers_to_plane_index(np.asarray(_unwrap(self.center_rois)[:]))
+        rois, planes, number_planes = [], [], None
+        for start, masks in self.iter_rois(batch_size=batch_size):
+            batch_rois, batch_planes = np.nonzero(masks.any(axis=(1, 2)))
+            rois.append(batch_rois + start)
+            planes.append(batch_planes)
+            number_planes = masks.shape[3]
+        if not rois:
+            return group_rois_by_plane([], [])
+        return group_rois_by_plane(np.concatenate(rois), np.concatenate(planes), number_planes)
+
+    def get_plane_rois(self, plane):
+        """Return the numbers of the ROIs in one imaging plane.
+
+        With a stored plane index, only the two offsets of the plane and its ROI numbers are read. Otherwise the
+        index is computed with :py:meth:`compute_plane_index` on first use and cached until ROIs are appended.
+
+        :param plane: the plane number, i.e. the index along z
+        :returns: sorted int64 array of ROI numbers
+        """
+        if self.plane_rois_index is not None:
+            plane_rois, index = _unwrap(self.plane_rois), _unwrap(self.plane_rois_index)
+        else:
+            cached = getattr(self, '_plane_index', None)
+            if cached is None or cached[0] != self.number_rois:
+                cached = (self.number_rois, self.compute_plane_index())
+                self._plane_index = cached
+            plane_rois, index = cached[1]
+        plane = int(plane)
+        if not 0 <= plane < len(index):
+            raise IndexError("plane %d is out of range for '%s' with %d planes" % (plane, self.name, len(index)))
+        start = int(index[plane - 1]) if plane > 0 else 0
+        return np.asarray(plane_rois[start:int(index[plane])], dtype=np.int64)
+
+    def get_plane(self, plane, rois=None):
+        """Return the ROIs of one imaging plane and their masks in that plane.
+
+        Only the masks of the ROIs of the plane are read, see :py:meth:`get_plane_rois`. For dense masks, only the
+        plane itself is read from each of them.
+
+        :param plane: the plane number, i.e. the index along z
+        :param rois: ROI numbers to restrict the result to, e.g. the ROIs in view. If None, all ROIs of the plane.
+        :returns: tuple ``(rois, masks)`` with the sorted ROI numbers and the boolean masks of shape (len(rois), x, y)
+        """
+        plane_rois = self.get_plane_rois(plane)
+        rois = plane_rois if rois is None else np.intersect1d(plane_rois, np.asarray(rois, dtype=np.int64))
+        return rois, self.get_plane_window(plane, rois)
+
+    def get_plane_window(self, plane, rois, x_range=None, y_range=None):
+        """Return the masks of the given ROIs in a window of one imaging plane.
+
+        Only the window is read: a hyperslab of each dense or bit-packed mask, or the pixel indices of each sparse
+        mask. Masks stored in a pattern library are sliced from the mask cache of the library. Unlike
+        :py:meth:`get_plane`, the ROIs are not checked against the plane index, so ROIs without pixels in the window
+        give empty masks.
+
+        :param plane: the plane number, i.e. the index along z
+        :param rois: ROI numbers to read
+        :param x_range: [start, stop) range of the window along x. Defaults to the whole mask.
+        :param y_range: [start, stop) range of the window along y
+        :returns: boolean array of shape (len(rois), x_range[1] - x_range[0], y_range[1] - y_range[0])
+        """
+        if not self.has_image_masks:
+            raise ValueError("'%s' has no image masks" % self.name)
+        rois = np.asarray(rois, dtype=np.int64)
+        x, y, _ = self.roi_mask_shape
+        x0, x1 = (0, x) if x_range is None else (int(x_range[0]), int(x_range[1]))
+        y0, y1 = (0, y) if y_range is None else (int(y_range[0]), int(y_range[1]))
+        plane = int(plane)
+        if self.has_sparse_masks:
+            return decode_sparse_window(_unwrap(self.image_mask_roi_indices), _unwrap(self.image_mask_roi_index),
+                                        self.image_mask_shape, rois, plane, (x0, x1), (y0, y1))
+        if self.has_packed_masks:
+            # whole bytes are read along x and the bits outside the window dropped after unpacking
+            bx0 = x0 // 8
+            packed = _read_rows(self.image_mask_roi_packed, rois, (slice(bx0, -(-x1 // 8)), slice(y0, y1), plane))
+            return np.unpackbits(packed.astype(np.uint8), axis=1)[:, x0 - 8 * bx0:x1 - 8 * bx0].view(bool)
+        if self.has_library_masks:
+            return self.get_image_masks(rois=rois)[:, x0:x1, y0:y1, plane]
+        return _read_rows(self.image_mask_roi, rois, (slice(x0, x1), slice(y0, y1), plane)).astype(bool)
+
+    def create_phase_masks(self, rois=None, rois_index=None, fov_shape=None, slm_shape=None,
+                           iterations=DEFAULT_ITERATIONS, batch_size=16, workers=None, seed=0, roi_dataio=True):
+        """Compute the SLM phase mask of each hologram from center_rois and store them in phase_masks.
+
+        Each hologram projects a spot at the center of each of its ROIs, see :py:mod:`ndx_holostim.holography`. The
+        holograms of a batch are computed together with a batched FFT Gerchberg–Saxton solver. Call this method
+        before writing the series.
+
+        :param rois: ROI numbers targeted by each hologram, concatenated over holograms. Defaults to one hologram
+            per plane, targeting all the ROIs of the plane, see :py:meth:`get_plane_rois`.
+        :param rois_index: end offset of the ROIs of each hologram in ``rois``. Required if rois is given.
+        :param fov_shape: [x, y] shape of the field of view of center_rois. Defaults to the shape of the ROI masks.
+        :param slm_shape: [x, y] number of pixels of the SLM. Defaults to the dimensions of spatial_light_modulator.
+        :param iterations: number of Gerchberg–Saxton iterations
+        :param batch_size: maximum number of holograms computed at once
+        :param workers: number of threads of each FFT, if scipy is installed. -1 uses all CPUs.
+        :param seed: seed of the random initial phase
+        :param roi_dataio: how to wrap the phase masks for writing, see the ``roi_dataio`` argument
+        :returns: the phase masks, of shape (number_holograms, slm_x, slm_y)
+        """
+        if self.phase_masks is not None:
+            raise ValueError("'%s' already has phase_masks" % self.name)
+        if self.center_rois is None:
+            raise ValueError("'%s' has no center_rois to target" % self.name)
+        if (rois is None) != (rois_index is None):
+            raise ValueError("'rois' and 'rois_index' must be given together")
+        if fov_shape is None:
+            if self.roi_mask_shape is None:
+                raise ValueError("'fov_shape' is required for '%s', which has no ROI masks" % self.name)
+            fov_shape = self.roi_mask_shape[:2]
+        if slm_shape is None:
+            if self.spatial_light_modulator.dimensions is None:
+                raise ValueError("'slm_shape' is required because '%s' has no dimensions"
+                                 % self.spatial_light_modulator.name)
+            slm_shape = self.spatial_light_modulator.dimensions
+        if rois is None:
+            if self.plane_rois_index is not None:
+                rois = np.asarray(_unwrap(self.plane_rois)[:])
+                rois_index = np.asarray(_unwrap(self.plane_rois_index)[:])
+            else:
+                rois, rois_index = self.compute_plane_index()
+        phase_masks = compute_phase_masks(np.asarray(_unwrap(self.center_rois)[:]), rois, rois_index, fov_shape,
+                                          slm_shape, iterations=iterations, batch_size=batch_size, workers=workers,
+                                          seed=seed)
+        settings = roi_dataio if isinstance(roi_dataio, dict) else dict()
+        fields = dict(
+            phase_masks=phase_masks,
+            phase_mask_rois=np.asarray(rois, dtype=np.uint32),
+            phase_mask_rois_index=np.asarray(rois_index, dtype=np.uint32),
+        )
+        for key, val in fields.items():
+            setattr(self, key, val if roi_dataio is False else wrap_roi_data(val, **settings))
+        return phase_masks
+
+    def get_phase_masks(self, holograms=None):
+        """Return the phase masks of shape (number_holograms, slm_x, slm_y), in radians.
+
+        :param holograms: hologram numbers to return. If None, all holograms are returned.
+        """
+        if self.phase_masks is None:
+            raise ValueError("'%s' has no phase_masks" % self.name)
+        if holograms is None:
+            return np.asarray(_unwrap(self.phase_masks)[:])
+        return _read_rows(self.phase_masks, holograms)
+
+    def get_hologram_rois(self, hologram):
+        """Return the numbers of the ROIs targeted by a hologram."""
+        if self.phase_mask_rois is None:
+            raise ValueError("'%s' has no phase_mask_rois" % self.name)
+        index = _unwrap(self.phase_mask_rois_index)
+        hologram = int(hologram)
+        if not 0 <= hologram < len(index):
+            raise IndexError("hologram %d is out of range for '%s' with %d holograms"
+                             % (hologram, self.name, len(index)))
+        start = int(index[hologram - 1]) if hologram > 0 else 0
+        return np.asarray(_unwrap(self.phase_mask_rois)[start:int(index[hologram])], dtype=np.int64)
+
+    def get_roi_pixels(self, roi):
+        """Return the pixels of shape (number_pixels, 3) of a single ROI.
+
+        For ragged pixel_rois held in memory the result is a view into the flat pixel array. For data read from a
+        file, only the pixels of this ROI are read. Padded pixel_rois are returned with their padding.
+
+        :param roi: the ROI number
+        """
+        roi = self._check_roi(roi)
+        if not self.has_ragged_pixels:
+            if self.pixel_rois is None:
+                raise ValueError("'%s' has no pixel_rois" % self.name)
+            return _unwrap(self.pixel_rois)[roi]
+        index = _unwrap(self.pixel_rois_index)
+        start = int(index[roi - 1]) if roi > 0 else 0
+        stop = int(index[roi])
+        return _unwrap(self.pixel_rois)[start:stop]
+
+    def memmap_rois(self, dataset='image_mask_roi'):
+        """Map a contiguous, uncompressed ROI dataset of a file to a read-only :py:class:`numpy.memmap`.
+
+        This is an opt-in alternative to :py:meth:`get_roi` and :py:meth:`iter_rois` for tools that page through the
+        same ROIs many times: reads go through the page cache without copies, so repeated reads are fast and memory
+        can be reclaimed by the operating system. Values are returned as stored, e.g. masks are not cast to bool.
+        See :py:func:`ndx_holostim.io.memmap_dataset`.
+
+        :param dataset: name of the ROI dataset, e.g. 'image_mask_roi' or 'pixel_rois'
+        :raises ValueError: if the dataset is absent, in memory, chunked or compressed
+        """
+        if dataset not in ROI_DATASETS:
+            raise ValueError("'%s' is not a ROI dataset, expected one of %s" % (dataset, ", ".join(ROI_DATASETS)))
+        data = getattr(self, dataset)
+        if data is None:
+            raise ValueError("'%s' has no %s" % (self.name, dataset))
+        return memmap_dataset(data)
+
+    def append_rois(self, image_mask_roi=None, center_rois=None, pixel_rois=None, pixel_rois_index=None):
+        """Append ROIs to a series that has already been written with resizable ROI datasets.
+
+        Create the datasets with :py:func:`ndx_holostim.io.appendable_roi_dataio`, write the file and then call
+        this method as new ROIs are generated, e.g., trial by trial. Each call writes the new ROIs to disk and
+        flushes the file, so the session never has to be held in memory.
+
+        :param image_mask_roi: masks of shape (number_rois, x, y, z). Appended to the sparse encoding if the series
+            stores its masks sparsely, packed if it stores them bit-packed, or added to the pattern library if the
+            series refers to library masks.
+        :param center_rois: centers of shape (number_rois, 4)
+        :param pixel_rois: pixels of the new ROIs, either padded with shape (number_rois, number_pixels, 3) or
+            ragged with shape (number_pixels, 3)
+        :param pixel_rois_index: end offset of each new ROI in ``pixel_rois``, relative to the pixels of this call.
+            Required if pixel_rois is ragged.
+        :returns: the number of the first appended ROI
+        """
+        for name in ('plane_rois', 'mask_pyramid'):
+            if getattr(self, name) is not None:
+                raise ValueError("ROIs cannot be appended to '%s' because its %s would become stale"
+                                 % (self.name, name))
+        counts = dict()
+        if image_mask_roi is not None:
+            counts['image_mask_roi'] = len(image_mask_roi)
+        if center_rois is not None:
+            counts['center_rois'] = len(center_rois)
+        if pixel_rois is not None:
+            counts['pixel_rois'] = len(pixel_rois) if pixel_rois_index is None else len(pixel_rois_index)
+        if len(set(counts.values())) > 1:
+            raise ValueError("the number of appended ROIs differs between %s" % ", ".join(sorted(counts)))
+        first_roi = self.number_rois
+        if image_mask_roi is not None:
+            if self.library_roi_index is not None:
+                append_to_dataset(self.library_roi_index, self.pattern_library.add_masks(image_mask_roi))
+            elif self.image_mask_roi_indices is not None:
+                indices, index, _ = encode_sparse_masks(image_mask_roi)
+                offset = append_to_dataset(self.image_mask_roi_indices, indices)
+                append_to_dataset(self.image_mask_roi_index, index + offset)
+            elif self.image_mask_roi_packed is not None:
+                append_to_dataset(self.image_mask_roi_packed, pack_masks(image_mask_roi)[0])
+            else:
+                append_to_dataset(self.image_mask_roi, image_mask_roi)
+        if center_rois is not None:
+            append_to_dataset(self.center_rois, center_rois)
+        if pixel_rois is not None:
+            if (pixel_rois_index is None) != (self.pixel_rois_index is None):
+                raise ValueError("pixel_rois_index must be given if and only if '%s' stores ragged pixel_rois"
+                                 % self.name)
+            offset = append_to_dataset(self.pixel_rois, pixel_rois)
+            if pixel_rois_index is not None:
+                append_to_dataset(self.pixel_rois_index, np.asarray(pixel_rois_index) + offset)
+        return first_roi
+
+    @property
+    def num_samples(self):
+        """Number of samples of time-resolved data"""
+        return 0 if self.data is None else len(_unwrap(self.data))
+
+    def get_power(self, start=None, stop=None, rois=None):
+        """Return the power delivered to the ROIs during the time window [start, stop).
+
+        The window is located by binary search on timestamps (reading one timestamp per step from a file) or
+        computed from starting_time and rate, and only the samples in the window are read.
+
+        :param start: start of the window, in seconds. If None, the window starts at the first sample.
+        :param stop: end of the window, in seconds. If None, the window ends after the last sample.
+        :param rois: ROI numbers to return. If None, all ROIs are returned.
+        :returns: tuple ``(timestamps, data)`` with the sample times of shape (num_times,) and the power of shape
+            (num_times, number_rois)
+        """
+        if self.data is None:
+            raise ValueError("'%s' has no data" % self.name)
+        first = 0 if start is None else self._time_to_index(start)
+        last = self.num_samples if stop is None else self._time_to_index(stop)
+        last = max(first, last)
+        data = _unwrap(self.data)
+        if rois is None:
+            values = np.asarray(data[first:last])
+        else:
+            rois = np.asarray(rois, dtype=np.int64)
+            unique, inverse = np.unique(rois, return_inverse=True)
+            values = np.asarray(data[first:last, unique.tolist()])[:, inverse]
+        if self.timestamps is not None:
+            times = np.asarray(_unwrap(self.timestamps)[first:last])
+        else:
+            times = (self.starting_time or 0.0) + np.arange(first, last) / self.rate
+        return times, values
+
+    def _time_to_index(self, time):
+        """Return the index of the first sample at or after the given time."""
+        if self.timestamps is not None:
+            timestamps = _unwrap(self.timestamps)
+            if isinstance(timestamps, np.ndarray):
+                return int(np.searchsorted(timestamps, time, side='left'))
+            # bisect reads a single timestamp per step instead of loading the whole dataset
+            return bisect.bisect_left(timestamps, time)
+        if self.rate is None:
+            raise ValueError("'%s' needs timestamps or a rate to locate samples in time" % self.name)
+        starting_time = self.starting_time or 0.0
+        index = int(np.ceil((time - starting_time) * self.rate))
+        # correct for rounding so that the result matches the sample times starting_time + index / rate
+        if index > 0 and starting_time + (index - 1) / self.rate >= time:
+            index -= 1
+        return min(max(index, 0), self.num_samples)
+
+    def append_power(self, data, timestamps=None):
+        """Append samples to a series that has already been written with resizable data and timestamps.
+
+        Create the datasets with :py:func:`ndx_holostim.io.appendable_time_dataio`, write the file and then call
+        this method as samples are acquired. Each call writes the samples to disk and flushes the file.
+
+        :param data: power of shape (num_times, number_rois)
+        :param timestamps: times of shape (num_times,). Required if the series stores timestamps.
+        :returns: the index of the first appended sample
+        """
+        if (timestamps is None) != (self.timestamps is None):
+            raise ValueError("timestamps must be given if and only if '%s' stores timestamps" % self.name)
+        if timestamps is not None and len(timestamps) != len(data):
+            raise ValueError("data and timestamps must have the same number of samples")
+        first = append_to_dataset(self.data, data)
+        if timestamps is not None:
+            append_to_dataset(self.timestamps, timestamps)
+        return first
+
+    def get_active_rois(self, times, stop=None):
+        """Find the ROIs stimulated at each of the given times, e.g. the times of all imaging frames.
+
+        See :py:meth:`ndx_holostim.PatternedOptogeneticStimulusTable.get_active_rois`.
+
+        :param times: query times, in seconds. Start of the ranges if ``stop`` is given.
+        :param stop: end of the query ranges, in seconds
+        :returns: tuple ``(rois, index)`` with the ROIs of all queries concatenated and the end offset of the ROIs of
+            each query
+        """
+        if self.stimulus_events is None:
+            raise ValueError("'%s' has no stimulus_events" % self.name)
+        return self.stimulus_events.get_active_rois(times, stop)
+
+    def get_spatial_index(self, scale=None):
+        """Return a spatial index over center_rois for nearest-target, radius and bounding-box queries.
+
+        The index is built on first use and cached on the series until ROIs are appended or a different scale is
+        requested. See :py:class:`ndx_holostim.spatial.RoiSpatialIndex`.
+
+        :param scale: size of a pixel along x, y and z, e.g. in um, to query in physical units
+        """
+        if self.center_rois is None:
+            raise ValueError("'%s' has no center_rois to index" % self.name)
+        center_rois = _unwrap(self.center_rois)
+        key = (len(center_rois), None if scale is None else tuple(np.broadcast_to(scale, (3,)).tolist()))
+        cached = getattr(self, '_spatial_index', None)
+        if cached is None or cached[0] != key:
+            cached = (key, RoiSpatialIndex(np.asarray(center_rois[:]), scale=scale))
+            self._spatial_index = cached
+        return cached[1]
+
+    def _check_roi(self, roi):
+        roi = int(roi)
+        if not -self.number_rois <= roi < self.number_rois:
+            raise IndexError("ROI %d is out of range for '%s' with %d ROIs" % (roi, self.name, self.number_rois))
+        return roi % self.number_rois
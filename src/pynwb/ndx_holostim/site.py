@@ -0,0 +1,35 @@
+from hdmf.utils import docval, get_docval
+from pynwb import register_class
+from pynwb.ogen import OptogeneticStimulusSite
+
+from .containers import containers_from_arrays, fields_only_init
+
+
+@register_class('PatternedOptogeneticStimulusSite', 'ndx-holostim')
+@fields_only_init
+class PatternedOptogeneticStimulusSite(OptogeneticStimulusSite):
+    """An extension of OptogeneticStimulusSite to include the geometrical representation for the stimulus."""
+
+    __nwbfields__ = ('effector',)
+
+    @docval(
+        *get_docval(OptogeneticStimulusSite.__init__),
+        {'name': 'effector', 'type': str, 'default': None,
+         'doc': 'Light-activated effector protein expressed by the targeted cell (eg. ChR2)'},
+    )
+    def __init__(self, **kwargs):
+        effector = kwargs.pop('effector')
+        super().__init__(**kwargs)
+        self.effector = effector
+
+    @classmethod
+    def from_arrays(cls, names, **kwargs):
+        """Create one stimulus site per name, validating the arguments once for all sites.
+
+        Takes the same arguments as the constructor, each either a single value shared by all sites (e.g. the
+        device) or a sequence with one value per site.
+
+        :param names: name of each site
+        :returns: list of sites
+        """
+        return containers_from_arrays(cls, names, **kwargs)
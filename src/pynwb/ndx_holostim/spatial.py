@@ -0,0 +1,229 @@
+"""Spatial index over the ROI centers of PatternedOptogeneticSeries.
+
+:py:class:`RoiSpatialIndex` answers nearest-neighbor, radius and bounding-box queries for many points at once. It
+uses :py:class:`scipy.spatial.cKDTree` when scipy is installed and otherwise falls back to a uniform grid of cubic
+cells holding a few centers each, so that every query only looks at the centers of the cells around it.
+
+Query results that have a variable number of ROIs per query are returned as ragged arrays ``(rois, index)``, where
+``index`` holds the end offset of the ROIs of each query in ``rois``.
+"""
+import numpy as np
+
+# average number of ROI centers per cell of the grid used without scipy
+_POINTS_PER_CELL = 4
+
+
+def _has_scipy():
+    try:
+        import scipy.spatial  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _as_points(points):
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim == 1:
+        points = points[np.newaxis]
+    if points.ndim != 2 or points.shape[1] not in (2, 3):
+        raise ValueError("points must have shape (number_points, 3) or (number_points, 2), got %s"
+                         % str(points.shape))
+    if points.shape[1] == 2:
+        points = np.column_stack((points, np.zeros(len(points))))
+    return points
+
+
+def _expand(starts, counts):
+    """Return the owner and the row of every element of the ranges [start, start + count)."""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    rows = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return owner, rows
+
+
+class _UniformGrid:
+    """Uniform grid of cubic cells over points, the index of :py:class:`RoiSpatialIndex` without scipy.
+
+    The cell size is chosen so that cells hold ``_POINTS_PER_CELL`` points on average over the bounding box of the
+    points. Points are sorted by cell, so the points of a cell are a contiguous range of :py:attr:`order`.
+    """
+
+    def __init__(self, points):
+        self.origin = points.min(axis=0) if len(points) else np.zeros(3)
+        extent = points.max(axis=0) - self.origin if len(points) else np.zeros(3)
+        cell_size = extent.max()
+        if cell_size > 0:
+            # axes shorter than a cell count as one cell, which makes the cell size a fixed point of this update
+            for _ in range(16):
+                cell_size = (np.prod(np.maximum(extent, cell_size)) * _POINTS_PER_CELL / len(points)) ** (1 / 3)
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        self.shape = np.floor(extent / self.cell_size).astype(np.int64) + 1
+        cells = np.ravel_multi_index(self._cells(points).T, self.shape)
+        self.order = np.argsort(cells, kind='stable')
+        self.starts = np.searchsorted(cells[self.order], np.arange(np.prod(self.shape) + 1))
+
+    def _cells(self, points):
+        """Return the [x, y, z] cell of each point, clipped to one cell beyond the grid on each side."""
+        cells = np.floor((points - self.origin) / self.cell_size)
+        return np.clip(cells, -1, self.shape).astype(np.int64)
+
+    def covers(self, points, reach):
+        """Return whether the cube of half-width ``reach`` around each point covers every cell of the grid."""
+        lower = self._cells(points - reach[:, np.newaxis])
+        upper = self._cells(points + reach[:, np.newaxis])
+        return ((lower <= 0) & (upper >= self.shape - 1)).all(axis=1)
+
+    def candidates(self, points, reach):
+        """Return the pairs (query, row) of the points in the cells that intersect the cube of half-width ``reach``
+        around each query point."""
+        lower = np.maximum(self._cells(points - reach[:, np.newaxis]), 0)
+        upper = np.minimum(self._cells(points + reach[:, np.newaxis]), self.shape - 1)
+        spans = np.maximum(upper - lower + 1, 0)
+        query, offsets = _expand(np.zeros(len(points), dtype=np.int64), spans.prod(axis=1))
+        span, first = spans[query], lower[query]
+        cell_z = offsets % span[:, 2]
+        cell_y = offsets // span[:, 2] % span[:, 1]
+        cell_x = offsets // (span[:, 2] * span[:, 1])
+        cells = np.ravel_multi_index((first[:, 0] + cell_x, first[:, 1] + cell_y, first[:, 2] + cell_z), self.shape)
+        starts = self.starts[cells]
+        owner, rows = _expand(starts, self.starts[cells + 1] - starts)
+        return query[owner], self.order[rows]
+
+
+def _ragged(query, rois, number_queries):
+    """Sort matches by query and ROI and return them as a ragged array."""
+    order = np.lexsort((rois, query))
+    return rois[order], np.cumsum(np.bincount(query[order], minlength=number_queries))
+
+
+class RoiSpatialIndex:
+    """Spatial index over ROI centers for vectorized nearest-neighbor, radius and bounding-box queries.
+
+    ROIs with a NaN center, e.g. empty ROIs fitted with :py:func:`ndx_holostim.conversion.masks_to_centers`, are
+    never returned.
+
+    :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI, or (number_rois, 3)
+        holding [x, y, r] in plane 0
+    :param scale: size of a pixel along x, y and z, e.g. in um, so that queries are expressed in physical units.
+        Radii are scaled like x. Defaults to 1, i.e. pixel units.
+    :param use_scipy: whether to use scipy's cKDTree. Defaults to True if scipy is installed.
+    """
+
+    def __init__(self, center_rois, scale=None, use_scipy=None):
+        center_rois = np.asarray(center_rois, dtype=np.float64)
+        if center_rois.ndim != 2 or center_rois.shape[1] not in (3, 4):
+            raise ValueError("center_rois must have shape (number_rois, 4) or (number_rois, 3), got %s"
+                             % str(center_rois.shape))
+        if center_rois.shape[1] == 3:
+            center_rois = np.insert(center_rois, 2, 0, axis=1)
+        self.scale = np.ones(3) if scale is None else np.broadcast_to(np.asarray(scale, dtype=np.float64), (3,))
+        self.number_rois = len(center_rois)
+        valid = np.isfinite(center_rois[:, :3]).all(axis=1)
+        self._rois = np.flatnonzero(valid)
+        self.points = center_rois[valid, :3] * self.scale
+        self.radii = np.nan_to_num(center_rois[valid, 3]) * self.scale[0]
+        self._max_radius = self.radii.max() if len(self.radii) else 0.0
+        if use_scipy is None:
+            use_scipy = _has_scipy()
+        self._tree = None
+        if use_scipy:
+            from scipy.spatial import cKDTree
+
+            self._tree = cKDTree(self.points)
+        else:
+            self._grid = _UniformGrid(self.points)
+
+    def __len__(self):
+        return self.number_rois
+
+    def nearest(self, points, k=1):
+        """Find the k ROIs whose centers are nearest to each point.
+
+        :param points: array of shape (number_points, 3) or (number_points, 2)
+        :param k: number of neighbors
+        :returns: tuple ``(distances, rois)`` of arrays of shape (number_points, k), sorted by distance. Missing
+            neighbors, when there are fewer than k ROIs, have an infinite distance and ROI -1.
+        """
+        points = _as_points(points) * self.scale
+        k = int(k)
+        if self._tree is not None:
+            distances, neighbors = self._tree.query(points, k=[*range(1, k + 1)])
+        else:
+            distances, neighbors = self._grid_nearest(points, k)
+        rois = np.full(neighbors.shape, -1, dtype=np.int64)
+        found = neighbors < len(self.points)
+        rois[found] = self._rois[neighbors[found]]
+        return distances, rois
+
+    def _grid_nearest(self, points, k):
+        """Find the k nearest centers with the grid, growing a search cube around each point until it holds them."""
+        distances = np.full((len(points), k), np.inf)
+        neighbors = np.full((len(points), k), len(self.points), dtype=np.int64)
+        found = min(k, len(self.points))
+        pending = np.arange(len(points) if found else 0)
+        reach = np.full(len(points), self._grid.cell_size)
+        while len(pending):
+            batch, batch_reach = points[pending], reach[pending]
+            query, candidates = self._grid.candidates(batch, batch_reach)
+            squared = ((self.points[candidates] - batch[query]) ** 2).sum(axis=-1)
+            order = np.lexsort((candidates, squared, query))
+            query, candidates, squared = query[order], candidates[order], squared[order]
+            # centers outside the cube are farther than reach, so the nearest centers within reach are final
+            within = np.bincount(query[squared <= batch_reach[query] ** 2], minlength=len(batch))
+            done = (within >= found) | self._grid.covers(batch, batch_reach)
+            counts = np.bincount(query, minlength=len(batch))
+            rank = np.arange(len(query)) - np.repeat(np.cumsum(counts) - counts, counts)
+            keep = done[query] & (rank < found)
+            rows = pending[query[keep]]
+            neighbors[rows, rank[keep]] = candidates[keep]
+            distances[rows, rank[keep]] = np.sqrt(squared[keep])
+            pending = pending[~done]
+            reach[pending] *= 2
+        return distances, neighbors
+
+    def within_radius(self, points, radius, include_roi_radius=False):
+        """Find the ROIs whose centers lie within a distance of each point.
+
+        :param points: array of shape (number_points, 3) or (number_points, 2)
+        :param radius: distance, a scalar or one value per point
+        :param include_roi_radius: if True, also return ROIs whose disk reaches the point, i.e. with a center within
+            ``radius`` plus the ROI radius
+        :returns: tuple ``(rois, index)`` with the ROIs of each point in increasing order
+        """
+        points = _as_points(points) * self.scale
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(points),))
+        reach = radius + (self._max_radius if include_roi_radius else 0.0)
+        query, candidates = self._candidates(points, reach, p=2)
+        limit = radius[query] + (self.radii[candidates] if include_roi_radius else 0.0)
+        keep = ((self.points[candidates] - points[query]) ** 2).sum(axis=-1) <= limit ** 2
+        return _ragged(query[keep], self._rois[candidates[keep]], len(points))
+
+    def within_box(self, lower, upper, include_roi_radius=False):
+        """Find the ROIs whose centers lie within each box, e.g. imaging fields of view.
+
+        :param lower: lower corner [x, y, z] of each box, of shape (number_boxes, 3) or (number_boxes, 2)
+        :param upper: upper corner [x, y, z] of each box
+        :param include_roi_radius: if True, grow the box by the radius of each ROI, so that ROIs whose disk
+            overlaps the box are also returned
+        :returns: tuple ``(rois, index)`` with the ROIs of each box in increasing order
+        """
+        lower = _as_points(lower) * self.scale
+        upper = _as_points(upper) * self.scale
+        if lower.shape != upper.shape:
+            raise ValueError("lower and upper must have the same shape")
+        center = (lower + upper) / 2
+        reach = (upper - lower).max(axis=1) / 2 + (self._max_radius if include_roi_radius else 0.0)
+        query, candidates = self._candidates(center, reach, p=np.inf)
+        margin = self.radii[candidates, np.newaxis] if include_roi_radius else 0.0
+        found = self.points[candidates]
+        keep = ((found >= lower[query] - margin) & (found <= upper[query] + margin)).all(axis=1)
+        return _ragged(query[keep], self._rois[candidates[keep]], len(lower))
+
+    def _candidates(self, points, reach, p):
+        """Return the pairs (query, candidate) of points within ``reach`` of each query point in the p-norm."""
+        if self._tree is not None:
+            matches = self._tree.query_ball_point(points, reach, p=p)
+            counts = np.fromiter((len(m) for m in matches), dtype=np.int64, count=len(matches))
+            query = np.repeat(np.arange(len(points)), counts)
+            candidates = np.concatenate([np.asarray(m, dtype=np.int64) for m in matches] + [np.zeros(0, np.int64)])
+            return query, candidates
+        return self._grid.candidates(points, reach)
@@ -0,0 +1,183 @@
+"""Spiral trajectories, dwell times and illuminated pixels of SpiralScanning stimulation, for all ROIs at once.
+
+During a spiral stimulus the beam moves along an Archimedean spiral at constant angular velocity, from the center of
+the ROI out to ``diameter / 2`` in ``number_of_revolutions`` turns, while moving along z over ``height`` centered on
+the ROI. The trajectory is sampled at ``number_of_samples`` regularly spaced times over the stimulus ``duration``.
+
+The functions below work in pixel units. The trajectory and the illumination kernel of a spiral, i.e. the pixels
+reached by the beam around the pixel nearest the center with their dwell time, only depend on the parameters of the
+spiral, so they are computed once per parameter tuple and kept in least-recently-used caches shared by all targets
+and trials. The kernels are placed at every ROI center at once. Cached arrays are read-only.
+
+Illuminated pixels are returned as ragged arrays ``(pixels, dwell, index)``, where ``index`` holds the end offset of
+the pixels of each ROI, like :py:func:`ndx_holostim.conversion.centers_to_pixels`, so they can be turned into masks
+with :py:func:`ndx_holostim.conversion.pixels_to_masks` and into dwell-time maps with :py:func:`dwell_maps`.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+# default number of samples of a spiral trajectory
+DEFAULT_SPIRAL_SAMPLES = 1000
+
+# number of distinct spirals whose trajectory and illumination kernel are cached
+SPIRAL_CACHE_SIZE = 256
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+@lru_cache(maxsize=SPIRAL_CACHE_SIZE)
+def spiral_trajectory(diameter, height, number_of_revolutions, number_of_samples=DEFAULT_SPIRAL_SAMPLES):
+    """Return the [x, y, z] offsets of the beam from the center of the spiral at each sample.
+
+    :param diameter: diameter of the spiral
+    :param height: extent of the spiral along z, centered on the ROI
+    :param number_of_revolutions: number of turns of the spiral
+    :param number_of_samples: number of samples of the trajectory
+    :returns: read-only float64 array of shape (number_of_samples, 3)
+    """
+    t = np.linspace(0, 1, int(number_of_samples))
+    radius, angle = diameter / 2 * t, 2 * np.pi * number_of_revolutions * t
+    return _read_only(np.column_stack((radius * np.cos(angle), radius * np.sin(angle), height * (t - 0.5))))
+
+
+@lru_cache(maxsize=SPIRAL_CACHE_SIZE)
+def spiral_kernel(diameter, number_of_revolutions, duration, number_of_samples=DEFAULT_SPIRAL_SAMPLES,
+                  beam_radius=0.0):
+    """Return the pixels illuminated by a spiral around the pixel nearest its center, with their dwell time.
+
+    A sample dwells ``duration / number_of_samples`` on the pixel nearest the beam. With a ``beam_radius``, the
+    pixels within that distance of a visited pixel are illuminated too, with a dwell time of 0 if the beam center
+    never visits them.
+
+    :param diameter: diameter of the spiral, in pixels
+    :param number_of_revolutions: number of turns of the spiral
+    :param duration: duration of the spiral, in seconds
+    :param number_of_samples: number of samples of the trajectory
+    :param beam_radius: radius of the beam, in pixels
+    :returns: tuple ``(offsets, dwell)`` with read-only int64 [x, y] offsets of shape (number_pixels, 2) and float64
+        dwell times in seconds, sorted by offset
+    """
+    xy = spiral_trajectory(diameter, 0.0, number_of_revolutions, number_of_samples)[:, :2]
+    visited, counts = np.unique(np.rint(xy).astype(np.int64), axis=0, return_counts=True)
+    dwell = counts * (duration / int(number_of_samples))
+    if beam_radius > 0:
+        reach = int(np.ceil(beam_radius))
+        grid = np.arange(-reach, reach + 1)
+        disk = np.stack(np.meshgrid(grid, grid, indexing='ij'), axis=-1).reshape(-1, 2)
+        disk = disk[(disk ** 2).sum(axis=1) <= beam_radius ** 2]
+        candidates = np.concatenate((visited, (visited[:, np.newaxis, :] + disk).reshape(-1, 2)))
+        offsets, inverse = np.unique(candidates, axis=0, return_inverse=True)
+        illuminated = np.zeros(len(offsets))
+        illuminated[inverse.reshape(-1)[:len(visited)]] = dwell
+        visited, dwell = offsets, illuminated
+    return _read_only(visited), _read_only(dwell)
+
+
+def _as_centers(center_rois):
+    center_rois = np.asarray(center_rois, dtype=np.float64)
+    if center_rois.ndim != 2 or center_rois.shape[1] not in (3, 4):
+        raise ValueError("center_rois must have shape (number_rois, 4) or (number_rois, 3), got %s"
+                         % str(center_rois.shape))
+    if center_rois.shape[1] == 3:  # [x, y, r] in plane 0
+        center_rois = np.insert(center_rois, 2, 0, axis=1)
+    return center_rois
+
+
+def _diameters(center_rois, diameter):
+    """Return the diameter of the spiral of each ROI, twice its radius if ``diameter`` is None."""
+    if diameter is None:
+        return 2 * center_rois[:, 3]
+    return np.broadcast_to(np.asarray(diameter, dtype=np.float64), (len(center_rois),))
+
+
+def spiral_trajectories(center_rois, number_of_revolutions, diameter=None, height=0.0,
+                        number_of_samples=DEFAULT_SPIRAL_SAMPLES):
+    """Return the position of the beam at each sample of the spiral of each ROI.
+
+    :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI, or (number_rois, 3)
+        holding [x, y, r] in plane 0
+    :param number_of_revolutions: number of turns of the spirals
+    :param diameter: diameter of the spirals, in pixels, either shared by all ROIs or one per ROI. Defaults to the
+        diameter of each ROI.
+    :param height: extent of the spirals along z, in planes
+    :param number_of_samples: number of samples of each trajectory
+    :returns: float64 array of shape (number_rois, number_of_samples, 3) holding [x, y, z], NaN for ROIs with a NaN
+        center
+    """
+    center_rois = _as_centers(center_rois)
+    # the trajectory scales linearly with the diameter and the height
+    unit = spiral_trajectory(1.0, 1.0, number_of_revolutions, number_of_samples)
+    scale = np.column_stack((np.repeat(_diameters(center_rois, diameter)[:, np.newaxis], 2, axis=1),
+                             np.full(len(center_rois), height)))
+    return center_rois[:, np.newaxis, :3] + unit * scale[:, np.newaxis, :]
+
+
+def spiral_illumination(center_rois, number_of_revolutions, duration, diameter=None,
+                        number_of_samples=DEFAULT_SPIRAL_SAMPLES, beam_radius=0.0, mask_shape=None, diameter_step=1.0):
+    """Return the pixels illuminated by the spiral of each ROI and their dwell time, in the plane of the ROI.
+
+    The diameters are rounded to multiples of ``diameter_step`` pixels, so that ROIs of similar size, e.g. with the
+    fitted radii of :py:func:`ndx_holostim.conversion.masks_to_centers`, share a kernel. The kernel of each distinct
+    rounded diameter is computed once, see :py:func:`spiral_kernel`, and placed at the pixel nearest each center of
+    its group of ROIs, so identical spirals are never recomputed.
+
+    :param center_rois: array of shape (number_rois, 4) holding [x, y, z, r] for each ROI, or (number_rois, 3)
+        holding [x, y, r] in plane 0
+    :param number_of_revolutions: number of turns of the spirals
+    :param duration: duration of a spiral, in seconds
+    :param diameter: diameter of the spirals, in pixels, either shared by all ROIs or one per ROI. Defaults to the
+        diameter of each ROI.
+    :param number_of_samples: number of samples of each trajectory
+    :param beam_radius: radius of the beam, in pixels
+    :param mask_shape: [x, y, z] shape of the field of view. If given, pixels outside of it are dropped.
+    :param diameter_step: step of the diameters of the kernels, in pixels. Set it to 0 to use the exact diameters.
+    :returns: tuple ``(pixels, dwell, index)`` with int64 [x, y, z] pixels of shape (number_pixels, 3), float64 dwell
+        times in seconds and the end offset of the pixels of each ROI. ROIs with a NaN center have no pixels.
+    """
+    center_rois = _as_centers(center_rois)
+    diameters = _diameters(center_rois, diameter)
+    if diameter_step:
+        diameters = np.rint(diameters / diameter_step) * diameter_step
+    valid = np.flatnonzero(~np.isnan(center_rois).any(axis=1) & ~np.isnan(diameters))
+    pixels, dwell, rois = [np.zeros((0, 3), dtype=np.int64)], [np.zeros(0)], [np.zeros(0, dtype=np.int64)]
+    unique, inverse = np.unique(diameters[valid], return_inverse=True)
+    for number, value in enumerate(unique.tolist()):
+        group = valid[inverse.reshape(-1) == number]
+        offsets, times = spiral_kernel(value, number_of_revolutions, duration, number_of_samples, beam_radius)
+        centers = np.rint(center_rois[group, :3]).astype(np.int64)
+        group_pixels = np.empty((len(group), len(offsets), 3), dtype=np.int64)
+        group_pixels[..., :2] = centers[:, np.newaxis, :2] + offsets
+        group_pixels[..., 2] = centers[:, np.newaxis, 2]
+        pixels.append(group_pixels.reshape(-1, 3))
+        dwell.append(np.tile(times, len(group)))
+        rois.append(np.repeat(group, len(offsets)))
+    pixels, dwell, rois = np.concatenate(pixels), np.concatenate(dwell), np.concatenate(rois)
+    if mask_shape is not None:
+        inside = ((pixels >= 0) & (pixels < np.asarray(mask_shape[:3]))).all(axis=1)
+        pixels, dwell, rois = pixels[inside], dwell[inside], rois[inside]
+    if len(unique) > 1:
+        # group the pixels by ROI, keeping the order of each kernel
+        order = np.argsort(rois, kind='stable')
+        pixels, dwell, rois = pixels[order], dwell[order], rois[order]
+    return pixels, dwell, np.cumsum(np.bincount(rois, minlength=len(center_rois)))
+
+
+def dwell_maps(pixels, dwell, index, mask_shape):
+    """Expand the dwell times of ragged pixels into dense dwell-time maps.
+
+    :param pixels: int [x, y, z] pixels of shape (number_pixels, 3), see :py:func:`spiral_illumination`
+    :param dwell: dwell time of each pixel, in seconds
+    :param index: end offset of the pixels of each ROI
+    :param mask_shape: [x, y, z] shape of a map
+    :returns: float32 array of shape (number_rois, x, y, z)
+    """
+    index = np.asarray(index, dtype=np.int64)
+    pixels = np.asarray(pixels, dtype=np.int64)
+    rois = np.repeat(np.arange(len(index)), np.diff(np.concatenate(([0], index))))
+    maps = np.zeros((len(index),) + tuple(int(s) for s in mask_shape), dtype=np.float32)
+    np.add.at(maps, (rois, pixels[:, 0], pixels[:, 1], pixels[:, 2]), dwell)
+    return maps
@@ -0,0 +1,273 @@
+"""Tiled, downsampled rendering of the ROIs of a PatternedOptogeneticSeries, e.g. for interactive viewers.
+
+:py:class:`RoiTileRenderer` renders the ROIs of one imaging plane as a label image, where each pixel holds the
+number of the ROI that covers it, or -1. The field of view is split in square tiles of ``tile_size`` pixels and a
+tile is rendered by reading only the ROIs of the plane whose bounding box intersects it. Each tile is max-pooled into
+a pyramid of downsampling levels and the rendered tiles are kept in a least-recently-used cache, so panning, zooming
+and switching planes only read the ROIs that come into view for the first time.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from .conversion import centers_to_pixels
+from .io import _read_rows
+from .masks import downsample_masks, mask_bounding_boxes
+
+# downsampling factors of the levels of the pyramid, which must all divide the tile size
+DEFAULT_LEVELS = (1, 2, 4, 8)
+
+# default number of rendered tiles kept in memory
+DEFAULT_TILE_CACHE_SIZE = 256
+
+
+def _center_rois(series):
+    """Read center_rois as [x, y, z, r]."""
+    centers = np.asarray(series.center_rois[:], dtype=np.float64)
+    if centers.shape[1] == 3:  # [x, y, r] in plane 0
+        centers = np.insert(centers, 2, 0, axis=1)
+    return centers
+
+
+class RoiTileRenderer:
+    """Render the ROIs of a series as downsampled label images, one tile at a time.
+
+    ROIs are rendered from their masks, in any encoding, or rasterized from center_rois if the series has no masks.
+    The bounding boxes used to find the ROIs of a tile are computed once, see :py:meth:`roi_boxes`, and a tile
+    reads only its own window of the masks of these ROIs.
+
+    :param series: a :py:class:`ndx_holostim.PatternedOptogeneticSeries`
+    :param tile_size: size of the tiles, in pixels of the full-resolution field of view
+    :param levels: downsampling factors of the pyramid
+    :param cache_size: maximum number of rendered tiles kept in memory
+    :param batch_size: maximum number of ROI masks read at a time
+    """
+
+    def __init__(self, series, tile_size=256, levels=DEFAULT_LEVELS, cache_size=DEFAULT_TILE_CACHE_SIZE,
+                 batch_size=64):
+        levels = tuple(sorted(int(level) for level in levels))
+        if levels[0] != 1 or any(tile_size % level for level in levels):
+            raise ValueError("levels must start at 1 and divide tile_size %d, got %s" % (tile_size, levels))
+        if not series.has_image_masks and series.center_rois is None:
+            raise ValueError("'%s' has no ROI masks or center_rois to render" % series.name)
+        self.series = series
+        self.tile_size = int(tile_size)
+        self.levels = levels
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self._centers = None
+        self._boxes = None
+        self._tiles = OrderedDict()
+        self.field_of_view = self._get_field_of_view()
+
+    def _get_field_of_view(self):
+        """Return the [x, y, z] shape of the field of view."""
+        if self.series.roi_mask_shape is not None:
+            return self.series.roi_mask_shape
+        centers = self.centers
+        valid = centers[~np.isnan(centers).any(axis=1)]
+        if not len(valid):
+            return (1, 1, 1)
+        reach = np.ceil(valid[:, :2] + valid[:, 3:]).max(axis=0).astype(np.int64) + 1
+        return int(reach[0]), int(reach[1]), int(np.rint(valid[:, 2]).max()) + 1
+
+    @property
+    def centers(self):
+        """The [x, y, z, r] center of each ROI, read once from center_rois"""
+        if self._centers is None:
+            self._centers = _center_rois(self.series)
+        return self._centers
+
+    @property
+    def number_planes(self):
+        """Number of planes of the field of view"""
+        return self.field_of_view[2]
+
+    def roi_boxes(self):
+        """Return the [start, stop) range of each ROI along x, y and z, as an int64 array of shape (number_rois, 3, 2).
+
+        The boxes are computed once, without reading every mask when possible: from the pixel indices of sparse
+        masks, from the coarsest level of the mask pyramid, or from the disks of center_rois. Only dense masks
+        without a pyramid or center_rois are read, in batches. Boxes from center_rois span all planes if the series
+        has masks, since the masks may extend beyond the plane of their center.
+        """
+        if self._boxes is None:
+            pyramid = self.series.mask_pyramid
+            if self.series.has_sparse_masks:
+                self._boxes = self.series.roi_bounding_boxes(batch_size=self.batch_size)
+            elif pyramid is not None and pyramid.factors:
+                # boxes of the coarsest level, scaled back to full resolution, bound the boxes of the masks
+                factor = pyramid.factors[-1]
+                level = pyramid.get_level(factor)
+                boxes = np.concatenate([mask_bounding_boxes(level[start:start + self.batch_size])
+                                        for start in range(0, len(level), self.batch_size)] or
+                                       [np.zeros((0, 3, 2), dtype=np.int64)])
+                boxes[:, :2] *= factor
+                self._boxes = boxes
+            elif self.series.center_rois is not None:
+                self._boxes = self._center_boxes()
+            else:
+                self._boxes = self.series.roi_bounding_boxes(batch_size=self.batch_size)
+        return self._boxes
+
+    def _center_boxes(self):
+        """Return the boxes of the disks rasterized from center_rois."""
+        centers = self.centers
+        boxes = np.zeros((len(centers), 3, 2), dtype=np.int64)
+        valid = ~np.isnan(centers).any(axis=1)
+        # one pixel of margin on each side covers the rounding of the rasterized disks
+        boxes[valid, :2, 0] = np.floor(centers[valid, :2] - centers[valid, 3:]) - 1
+        boxes[valid, :2, 1] = np.ceil(centers[valid, :2] + centers[valid, 3:]) + 2
+        if self.series.has_image_masks:
+            boxes[valid, 2] = (0, self.number_planes)
+        else:
+            boxes[valid, 2, 0] = np.rint(centers[valid, 2])
+            boxes[valid, 2, 1] = boxes[valid, 2, 0] + 1
+        return boxes
+
+    def plane_rois(self, plane):
+        """Return the numbers of the ROIs that may have pixels in a plane.
+
+        The stored plane index of the series is used if there is one. Otherwise the ROIs are those whose box spans
+        the plane, see :py:meth:`roi_boxes`, so the masks are not read a second time to compute a plane index.
+
+        :param plane: the plane number
+        """
+        plane = int(plane)
+        if not 0 <= plane < self.number_planes:
+            raise IndexError("plane %d is out of range for '%s' with %d planes"
+                             % (plane, self.series.name, self.number_planes))
+        if self.series.plane_rois_index is not None:
+            return self.series.get_plane_rois(plane)
+        boxes = self.roi_boxes()
+        return np.flatnonzero((boxes[:, 2, 0] <= plane) & (boxes[:, 2, 1] > plane))
+
+    def visible_rois(self, plane, x_range=None, y_range=None):
+        """Return the sorted numbers of the ROIs of a plane whose bounding box intersects a window.
+
+        :param plane: the plane number
+        :param x_range: [start, stop) range of the window along x. Defaults to the whole field of view.
+        :param y_range: [start, stop) range of the window along y
+        """
+        (x0, x1), (y0, y1) = self._window(x_range, y_range)
+        rois = self.plane_rois(plane)
+        boxes = self.roi_boxes()[rois]
+        visible = (boxes[:, 0, 0] < x1) & (boxes[:, 0, 1] > x0) & (boxes[:, 1, 0] < y1) & (boxes[:, 1, 1] > y0)
+        return rois[visible]
+
+    def _window(self, x_range, y_range):
+        x, y, _ = self.field_of_view
+        x0, x1 = (0, x) if x_range is None else (max(int(x_range[0]), 0), min(int(x_range[1]), x))
+        y0, y1 = (0, y) if y_range is None else (max(int(y_range[0]), 0), min(int(y_range[1]), y))
+        if x0 >= x1 or y0 >= y1:
+            raise ValueError("the window x=%s, y=%s does not intersect the field of view of shape %s"
+                             % (x_range, y_range, self.field_of_view))
+        return (x0, x1), (y0, y1)
+
+    def choose_level(self, x_range=None, y_range=None, max_size=512):
+        """Return the finest level at which a window fits in ``max_size`` pixels, or the coarsest level."""
+        (x0, x1), (y0, y1) = self._window(x_range, y_range)
+        extent = max(x1 - x0, y1 - y0)
+        for level in self.levels:
+            if -(-extent // level) <= max_size:
+                return level
+        return self.levels[-1]
+
+    def get_tile(self, plane, level, tile_x, tile_y):
+        """Return a rendered tile as an int32 label image, with -1 where no ROI is.
+
+        :param plane: the plane number
+        :param level: downsampling factor, one of ``levels``
+        :param tile_x: index of the tile along x
+        :param tile_y: index of the tile along y
+        :returns: label image of shape (ceil(tile_width / level), ceil(tile_height / level))
+        """
+        if level not in self.levels:
+            raise ValueError("level %d is not one of %s" % (level, self.levels))
+        key = (int(plane), level, int(tile_x), int(tile_y))
+        tile = self._tiles.get(key)
+        if tile is None:
+            if level == 1:
+                tile = self._render_tile(key[0], key[2], key[3])
+            elif self.series.mask_pyramid is not None and level in self.series.mask_pyramid.factors:
+                tile = self._render_pyramid_tile(key[0], level, key[2], key[3])
+            else:
+                tile = downsample_masks(self.get_tile(plane, 1, tile_x, tile_y), level, axes=(0, 1))
+            self._tiles[key] = tile
+            while len(self._tiles) > self.cache_size:
+                self._tiles.popitem(last=False)
+        else:
+            self._tiles.move_to_end(key)
+        return tile
+
+    def _render_tile(self, plane, tile_x, tile_y):
+        """Render a full-resolution tile, reading only the ROIs that intersect it."""
+        x, y, _ = self.field_of_view
+        x0, y0 = tile_x * self.tile_size, tile_y * self.tile_size
+        x1, y1 = min(x0 + self.tile_size, x), min(y0 + self.tile_size, y)
+        labels = np.full((x1 - x0, y1 - y0), -1, dtype=np.int32)
+        rois = self.visible_rois(plane, (x0, x1), (y0, y1))
+        if not len(rois):
+            return labels
+        if self.series.has_image_masks:
+            for start in range(0, len(rois), self.batch_size):
+                batch = rois[start:start + self.batch_size]
+                masks = self.series.get_plane_window(plane, batch, (x0, x1), (y0, y1))
+                numbers, mask_x, mask_y = np.nonzero(masks)
+                labels[mask_x, mask_y] = batch[numbers]
+        else:
+            pixels, index = centers_to_pixels(self.centers[rois], mask_shape=self.field_of_view)
+            numbers = np.repeat(rois, np.diff(np.concatenate(([0], index))))
+            inside = (pixels[:, 0] >= x0) & (pixels[:, 0] < x1) & (pixels[:, 1] >= y0) & (pixels[:, 1] < y1)
+            labels[pixels[inside, 0] - x0, pixels[inside, 1] - y0] = numbers[inside]
+        return labels
+
+    def _render_pyramid_tile(self, plane, level, tile_x, tile_y):
+        """Render a downsampled tile from the level of the mask pyramid of the series."""
+        x, y, _ = self.field_of_view
+        step = self.tile_size // level
+        x0, y0 = tile_x * step, tile_y * step
+        x1, y1 = min(x0 + step, -(-x // level)), min(y0 + step, -(-y // level))
+        labels = np.full((x1 - x0, y1 - y0), -1, dtype=np.int32)
+        rois = self.visible_rois(plane, (x0 * level, x1 * level), (y0 * level, y1 * level))
+        for start in range(0, len(rois), self.batch_size):
+            batch = rois[start:start + self.batch_size]
+            masks = _read_rows(self.series.mask_pyramid.get_level(level), batch, (slice(x0, x1), slice(y0, y1), plane))
+            numbers, mask_x, mask_y = np.nonzero(masks)
+            labels[mask_x, mask_y] = batch[numbers]
+        return labels
+
+    def render(self, plane, x_range=None, y_range=None, level=None, max_size=512):
+        """Render a window of a plane as a label image, assembled from cached tiles.
+
+        :param plane: the plane number
+        :param x_range: [start, stop) range of the window along x. Defaults to the whole field of view.
+        :param y_range: [start, stop) range of the window along y
+        :param level: downsampling factor, one of ``levels``. Defaults to :py:meth:`choose_level`.
+        :param max_size: maximum size of the rendered image when choosing the level
+        :returns: tuple ``(labels, level, origin)`` with the int32 label image, holding the number of the ROI of
+            each pixel or -1, the downsampling factor and the [x, y] full-resolution coordinates of its first pixel.
+            Pixel (i, j) covers x in [origin[0] + i * level, origin[0] + (i + 1) * level), and likewise along y.
+        """
+        (x0, x1), (y0, y1) = self._window(x_range, y_range)
+        if level is None:
+            level = self.choose_level((x0, x1), (y0, y1), max_size=max_size)
+        # the window is extended to whole pixels of the level
+        px0, py0 = x0 // level, y0 // level
+        px1, py1 = -(-x1 // level), -(-y1 // level)
+        labels = np.full((px1 - px0, py1 - py0), -1, dtype=np.int32)
+        step = self.tile_size // level
+        for tile_x in range(px0 // step, -(-px1 // step)):
+            for tile_y in range(py0 // step, -(-py1 // step)):
+                tile = self.get_tile(plane, level, tile_x, tile_y)
+                tx0, ty0 = tile_x * step, tile_y * step
+                sx0, sy0 = max(px0, tx0), max(py0, ty0)
+                sx1, sy1 = min(px1, tx0 + tile.shape[0]), min(py1, ty0 + tile.shape[1])
+                labels[sx0 - px0:sx1 - px0, sy0 - py0:sy1 - py0] = tile[sx0 - tx0:sx1 - tx0, sy0 - ty0:sy1 - ty0]
+        return labels, level, (px0 * level, py0 * level)
+
+    def clear_cache(self):
+        """Forget the rendered tiles and bounding boxes, e.g. after ROIs were appended to the series."""
+        self._tiles.clear()
+        self._boxes = None
+        self._centers = None
@@ -2,9 +2,9 @@
 # nwbwidgets.load_extension_widgets_into_spec([ndx_holostim])
 # is called. Otherwise, the module is not imported unless explicitly imported.
 
-from .tetrode_series_widget import TetrodeSeriesWidget
-from .. import TetrodeSeries
+from .patterned_optogenetic_series_widget import PatternedOptogeneticSeriesWidget
+from .. import PatternedOptogeneticSeries
 
 vis_spec = {
-    TetrodeSeries: TetrodeSeriesWidget,
+    PatternedOptogeneticSeries: PatternedOptogeneticSeriesWidget,
 }
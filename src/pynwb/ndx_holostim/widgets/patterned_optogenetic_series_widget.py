@@ -0,0 +1,88 @@
+# Widget for the PatternedOptogeneticSeries neurodata type, registered in `vis_spec` in `__init__.py`.
+#
+# Example usage:
+#   from nwbwidgets import nwb2widget, load_extension_widgets_into_spec
+#   load_extension_widgets_into_spec([ndx_holostim])
+#   nwb2widget(nwbfile)
+
+import numpy as np
+
+try:
+    import matplotlib.pyplot as plt
+    from IPython.display import display
+    from ipywidgets import widgets
+    from matplotlib.collections import PatchCollection
+    from matplotlib.patches import Circle
+except ImportError:
+    raise ImportError("The ndx-holostim widgets require nwbwidgets. Run `pip install nwbwidgets` to install it.")
+
+from ..series import PatternedOptogeneticSeries
+from ..tiles import RoiTileRenderer
+
+
+class PatternedOptogeneticSeriesWidget(widgets.VBox):
+    """Show the ROIs of a PatternedOptogeneticSeries over the field of view, one plane at a time.
+
+    ROI masks, or disks rasterized from center_rois, are rendered from cached, downsampled tiles of the plane and the
+    window in view, see :py:class:`ndx_holostim.tiles.RoiTileRenderer`, so only the ROIs in view are read from the
+    file. The ROI centers can be overlaid as circles.
+    """
+
+    def __init__(self, series: PatternedOptogeneticSeries, neurodata_vis_spec=None, tile_size=256, max_size=512,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.series = series
+        self.max_size = max_size
+        self.renderer = RoiTileRenderer(series, tile_size=tile_size)
+        x, y, z = self.renderer.field_of_view
+        self.plane = widgets.IntSlider(value=0, min=0, max=max(z - 1, 0), description='plane', disabled=z == 1)
+        self.x_range = widgets.IntRangeSlider(value=(0, x), min=0, max=x, description='x')
+        self.y_range = widgets.IntRangeSlider(value=(0, y), min=0, max=y, description='y')
+        # without masks, the masks are rasterized from the centers
+        self.show_masks = widgets.Checkbox(value=True, description='masks')
+        self.show_centers = widgets.Checkbox(value=False, description='centers', disabled=series.center_rois is None)
+        self.info = widgets.Label()
+        self.output = widgets.Output()
+        for control in (self.plane, self.x_range, self.y_range, self.show_masks, self.show_centers):
+            control.observe(self.update, names='value')
+        self.children = [
+            widgets.HBox(children=[self.plane, self.show_masks, self.show_centers]),
+            widgets.HBox(children=[self.x_range, self.y_range]),
+            self.info,
+            self.output,
+        ]
+        self.update()
+
+    def update(self, change=None):
+        plane = self.plane.value
+        x_range, y_range = self.x_range.value, self.y_range.value
+        if x_range[0] == x_range[1] or y_range[0] == y_range[1]:
+            return
+        fig, ax = plt.subplots(figsize=(6, 6))
+        rois = self.renderer.visible_rois(plane, x_range, y_range)
+        status = "%d ROIs in view" % len(rois)
+        if self.show_masks.value:
+            labels, level, origin = self.renderer.render(plane, x_range, y_range, max_size=self.max_size)
+            # pixel centers are at integer coordinates, like the ROI centers
+            x0, y0 = origin[0] - 0.5, origin[1] - 0.5
+            extent = (x0, x0 + labels.shape[0] * level, y0, y0 + labels.shape[1] * level)
+            # x is shown horizontally, and consecutive ROIs get different colors
+            ax.imshow(np.ma.masked_less(labels, 0).T % 20, cmap='tab20', vmin=0, vmax=19, origin='lower',
+                      extent=extent, interpolation='nearest')
+            if level > 1:
+                status += ", downsampled %dx" % level
+        if self.show_centers.value and len(rois):
+            centers = self.renderer.centers[rois]
+            circles = [Circle((cx, cy), r) for cx, cy, r in centers[:, [0, 1, 3]].tolist()]
+            ax.add_collection(PatchCollection(circles, facecolor='none', edgecolor='k', linewidth=0.8))
+        ax.set_xlim(*x_range)
+        ax.set_ylim(*y_range)
+        ax.set_aspect('equal')
+        ax.set_xlabel('x (pixels)')
+        ax.set_ylabel('y (pixels)')
+        ax.set_title("%s, plane %d" % (self.series.name, plane))
+        self.info.value = status
+        self.output.clear_output(wait=True)
+        with self.output:
+            display(fig)
+        plt.close(fig)
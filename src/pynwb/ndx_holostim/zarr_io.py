@@ -0,0 +1,100 @@
+"""Zarr storage settings for the ROI and time-resolved datasets of PatternedOptogeneticSeries.
+
+With ``backend='zarr'`` in :py:data:`ndx_holostim.io.DEFAULT_ROI_DATAIO` (or in the ``roi_dataio`` argument of a
+series), in-memory datasets are wrapped with :py:class:`hdmf_zarr.ZarrDataIO` instead of ``H5DataIO``, using the same
+per-ROI chunk layout and the equivalent numcodecs compressor. Arrays larger than a few chunks are additionally wrapped
+in an :py:class:`ArrayChunkIterator`, so that ``NWBZarrIO.write(nwbfile, number_of_jobs=n)`` compresses and writes
+their chunks in parallel: unlike HDF5, a Zarr store holds every chunk in its own file or object, so several writers
+never contend for the same file. Requires the ``zarr`` extra.
+"""
+import numpy as np
+from hdmf.data_utils import GenericDataChunkIterator
+
+# arrays with more chunks than this are written through an ArrayChunkIterator, one buffer of chunks at a time
+PARALLEL_MIN_CHUNKS = 16
+
+
+def _import_hdmf_zarr():
+    try:
+        import hdmf_zarr
+    except ImportError:
+        raise ImportError("The Zarr backend requires the 'hdmf-zarr' package. "
+                          "Run `pip install ndx-holostim[zarr]` to install it.")
+    return hdmf_zarr
+
+
+def zarr_codecs(compression, compression_opts, shuffle, itemsize):
+    """Return the numcodecs compressor and filters equivalent to the HDF5 compression settings.
+
+    :param compression: 'gzip', 'blosc' or None. LZF has no numcodecs equivalent.
+    :param compression_opts: compression level
+    :param shuffle: whether to shuffle the bytes of the elements before compression
+    :param itemsize: size in bytes of one element
+    :returns: tuple ``(compressor, filters)``
+    """
+    import numcodecs
+
+    if not compression:
+        return None, None
+    if compression == 'blosc':
+        return numcodecs.Blosc(cname='zstd', clevel=compression_opts or 5,
+                               shuffle=numcodecs.Blosc.BITSHUFFLE if shuffle else numcodecs.Blosc.NOSHUFFLE), None
+    if compression == 'gzip':
+        filters = [numcodecs.Shuffle(elementsize=itemsize)] if shuffle and itemsize > 1 else None
+        return numcodecs.GZip(level=4 if compression_opts is None else compression_opts), filters
+    raise ValueError("compression '%s' is not available with the Zarr backend, use 'gzip' or 'blosc'" % compression)
+
+
+class ArrayChunkIterator(GenericDataChunkIterator):
+    """Iterate over an in-memory array in buffers of whole chunks along the first dimension.
+
+    Buffers align with the chunks of the dataset, so hdmf-zarr can write them from parallel jobs. The iterator can be
+    pickled to be sent to the jobs.
+
+    :param data: the array
+    :param chunk_shape: the chunk shape of the dataset
+    :param buffer_chunks: number of chunks along the first dimension in each buffer
+    :ivar array: the array
+    """
+
+    def __init__(self, data, chunk_shape, buffer_chunks=PARALLEL_MIN_CHUNKS):
+        self.array = np.asarray(data)
+        chunk_shape = tuple(int(s) for s in chunk_shape)
+        buffer_shape = (min(chunk_shape[0] * int(buffer_chunks), self.array.shape[0]),) + self.array.shape[1:]
+        self._buffer_chunks = int(buffer_chunks)
+        super().__init__(chunk_shape=chunk_shape, buffer_shape=buffer_shape, display_progress=False)
+
+    def _get_data(self, selection):
+        return self.array[selection]
+
+    def _get_maxshape(self):
+        return self.array.shape
+
+    def _get_dtype(self):
+        return self.array.dtype
+
+    def _to_dict(self):
+        return dict(data=self.array, chunk_shape=self.chunk_shape, buffer_chunks=self._buffer_chunks)
+
+    @staticmethod
+    def _from_dict(dictionary):
+        return ArrayChunkIterator(**dictionary)
+
+
+def wrap_zarr_data(data, chunks, settings):
+    """Wrap an in-memory array with :py:class:`hdmf_zarr.ZarrDataIO`.
+
+    :param data: the array
+    :param chunks: the chunk shape
+    :param settings: the settings of :py:data:`ndx_holostim.io.DEFAULT_ROI_DATAIO`
+    """
+    hdmf_zarr = _import_hdmf_zarr()
+    data = np.asarray(data)
+    chunks = tuple(int(min(c, s)) if s > 0 else int(c) for c, s in zip(chunks, data.shape))
+    compressor, filters = zarr_codecs(settings['compression'], settings['compression_opts'], settings['shuffle'],
+                                      data.dtype.itemsize)
+    number_chunks = -(-data.shape[0] // chunks[0]) if len(data) else 0
+    if number_chunks > PARALLEL_MIN_CHUNKS and data.dtype.kind in 'biuf':
+        data = ArrayChunkIterator(data, chunks)
+    return hdmf_zarr.ZarrDataIO(data=data, chunks=list(chunks), compressor=compressor if compressor else False,
+                                filters=filters)
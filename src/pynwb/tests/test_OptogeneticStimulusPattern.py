@@ -1,3 +1,5 @@
+import numpy as np
+from unittest.mock import patch
 from datetime import datetime
 from pynwb import NWBHDF5IO
 from pynwb.testing import TestCase, remove_test_file
@@ -31,6 +33,70 @@ class TestOptogeneticStimulusPatternConstructor(TestCase):
         self.assertEqual(pattern.number_of_stimulus_presentation, 10)
         self.assertEqual(pattern.inter_stimulus_interval, 0.1)
 
+    def test_from_arrays(self):
+        patterns = OptogeneticStimulusPattern.from_arrays(
+            names=['stim%d' % number for number in range(100)],
+            description='Single ROI pattern',
+            duration=np.linspace(0.01, 0.1, 100),
+            number_of_stimulus_presentation=np.arange(100, dtype=np.int8),
+            inter_stimulus_interval=0.1,
+        )
+        self.assertEqual(len(patterns), 100)
+        expected = OptogeneticStimulusPattern(
+            name='stim99',
+            description='Single ROI pattern',
+            duration=0.1,
+            number_of_stimulus_presentation=99,
+            inter_stimulus_interval=0.1
+        )
+        self.assertContainerEqual(patterns[-1], expected, ignore_hdmf_attrs=True)
+        self.assertEqual(len({pattern.object_id for pattern in patterns}), 100)
+
+    def test_from_arrays_errors(self):
+        kwargs = dict(description='Single ROI pattern', duration=0.05, inter_stimulus_interval=0.1)
+        with self.assertRaises(TypeError):
+            OptogeneticStimulusPattern.from_arrays(['stim1'], **kwargs)
+        with self.assertRaises(TypeError):
+            OptogeneticStimulusPattern.from_arrays(['stim1'], number_of_stimulus_presentation=[1.5], **kwargs)
+        with self.assertRaises(ValueError):
+            OptogeneticStimulusPattern.from_arrays(['stim1'], number_of_stimulus_presentation=[1, 2], **kwargs)
+        with self.assertRaises(TypeError):
+            OptogeneticStimulusPattern.from_arrays(['stim1'], number_of_stimulus_presentation=1, colour='red',
+                                                   **kwargs)
+
+    def test_from_arrays_constructor_fallback(self):
+        # an HDMF whose base initialisation does not set up the containers makes from_arrays use the constructor
+        base = type('AbstractContainer', (), {'__init__': lambda container, name: None})
+        with patch('ndx_holostim.containers.AbstractContainer', base):
+            patterns = OptogeneticStimulusPattern.from_arrays(
+                names=['stim1', 'stim2'],
+                description='Single ROI pattern',
+                duration=[0.05, 0.1],
+                number_of_stimulus_presentation=10,
+                inter_stimulus_interval=0.1,
+            )
+        expected = OptogeneticStimulusPattern(
+            name='stim2',
+            description='Single ROI pattern',
+            duration=0.1,
+            number_of_stimulus_presentation=10,
+            inter_stimulus_interval=0.1
+        )
+        self.assertContainerEqual(patterns[1], expected, ignore_hdmf_attrs=True)
+        self.assertEqual(len({pattern.object_id for pattern in patterns}), 2)
+
+    def test_from_arrays_subclass_not_allowed(self):
+        class CheckedPattern(OptogeneticStimulusPattern):
+            def __init__(self, **kwargs):
+                if kwargs['duration'] <= 0:
+                    raise ValueError('duration must be positive')
+                super().__init__(**kwargs)
+
+        msg = "CheckedPattern cannot be created from arrays, its constructor does more than setting fields"
+        with self.assertRaisesWith(TypeError, msg):
+            CheckedPattern.from_arrays(['stim1'], description='Single ROI pattern', duration=-1.0,
+                                       number_of_stimulus_presentation=1, inter_stimulus_interval=0.1)
+
 
 class TestOptogeneticStimulusPatternRoundtrip(TestCase):
     """Roundtrip test for OptogeneticStimulusPattern."""
@@ -66,3 +132,22 @@ class TestOptogeneticStimulusPatternRoundtrip(TestCase):
             read_nwbfile = io.read()
             read_pattern = read_nwbfile.lab_meta_data['stim1']
             self.assertContainerEqual(pattern, read_pattern)
+
+    def test_roundtrip_from_arrays(self):
+        patterns = OptogeneticStimulusPattern.from_arrays(
+            names=['stim1', 'stim2'],
+            description='Single ROI pattern for opsin activation',
+            duration=[0.05, 0.1],
+            number_of_stimulus_presentation=10,
+            inter_stimulus_interval=0.1
+        )
+        for pattern in patterns:
+            self.nwbfile.add_lab_meta_data(pattern)
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_nwbfile = io.read()
+            for pattern in patterns:
+                self.assertContainerEqual(pattern, read_nwbfile.lab_meta_data[pattern.name])
@@ -4,7 +4,12 @@ from pynwb import NWBHDF5IO, NWBFile
 from pynwb.testing import TestCase, remove_test_file
 
 from ndx_holostim import PatternedOptogeneticSeries, OptogeneticStimulusPattern, LightSource
-from ndx_holostim import SpatialLightModulator, PatternedOptogeneticStimulusSite
+from ndx_holostim import SpatialLightModulator, PatternedOptogeneticStimulusSite, PatternedOptogeneticStimulusTable
+from ndx_holostim import StimulusPatternLibrary
+from ndx_holostim.conversion import masks_to_centers, masks_to_pixels
+from ndx_holostim.excitation import estimate_excitation, gaussian_psf
+from ndx_holostim.io import appendable_roi_dataio, appendable_time_dataio
+from ndx_holostim.masks import encode_sparse_masks, pack_masks
 
 
 class TestPatternedOptogeneticSeriesConstructor(TestCase):
@@ -172,3 +177,486 @@ class TestPatternedOptogeneticSeriesRoundtrip(TestCase):
             read_nwbfile = io.read()
             read_pos = read_nwbfile.acquisition['photostim_series']
             self.assertContainerEqual(pos, read_pos)
+
+    def test_roundtrip_sparse_masks(self):
+        image_mask_roi = np.zeros((5, 512, 512, 1), dtype=bool)
+        image_mask_roi[:, 100:110, 200:210] = True
+        indices, index, mask_shape = encode_sparse_masks(image_mask_roi)
+
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            rate=10.0,
+            unit='watts',
+            description='Patterned photostimulation data',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            image_mask_roi_indices=indices,
+            image_mask_roi_index=index,
+            image_mask_shape=mask_shape,
+        )
+        self.assertTrue(pos.has_sparse_masks)
+
+        self.nwbfile.add_acquisition(pos)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_nwbfile = io.read()
+            read_pos = read_nwbfile.acquisition['photostim_series']
+            self.assertContainerEqual(pos, read_pos)
+            np.testing.assert_array_equal(read_pos.get_image_masks(), image_mask_roi)
+            np.testing.assert_array_equal(read_pos.get_image_masks(rois=[2]), image_mask_roi[[2]])
+
+    def test_roundtrip_chunked_masks(self):
+        image_mask_roi = np.zeros((5, 512, 512, 1), dtype=bool)
+        image_mask_roi[:, 100:110, 200:210] = True
+
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            image_mask_roi=image_mask_roi,
+            center_rois=np.ones((5, 4)),
+        )
+        self.nwbfile.add_acquisition(pos)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_pos = io.read().acquisition['photostim_series']
+            self.assertEqual(read_pos.image_mask_roi.chunks, (1, 512, 512, 1))
+            self.assertEqual(read_pos.image_mask_roi.compression, 'gzip')
+            self.assertEqual(read_pos.center_rois.chunks, (5, 4))
+            np.testing.assert_array_equal(read_pos.get_image_masks(rois=[3]), image_mask_roi[[3]])
+
+    def test_roundtrip_phase_masks(self):
+        slm = SpatialLightModulator(
+            name='SLM-B1',
+            model_name='Meadowlark XY-Phase',
+            resolution=1.2,
+            dimensions=[16, 12],
+        )
+        self.nwbfile.add_device(slm)
+        phase_masks = np.random.default_rng(0).uniform(0, 2 * np.pi, (2, 16, 12)).astype(np.float32)
+
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=slm,
+            stimulus_pattern=self.stimulus_pattern,
+            center_rois=np.ones((3, 4)),
+            phase_masks=phase_masks,
+            phase_mask_rois=np.array([0, 1, 2], dtype=np.uint32),
+            phase_mask_rois_index=np.array([1, 3], dtype=np.uint32),
+        )
+        self.nwbfile.add_acquisition(pos)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_pos = io.read().acquisition['photostim_series']
+            self.assertContainerEqual(pos, read_pos)
+            self.assertEqual(list(read_pos.spatial_light_modulator.dimensions), [16, 12])
+            np.testing.assert_array_equal(read_pos.get_phase_masks(), phase_masks)
+            np.testing.assert_array_equal(read_pos.get_hologram_rois(1), [1, 2])
+
+
+class TestPatternedOptogeneticSeriesDataAccess(TestCase):
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='ROI access POS test',
+            identifier='POS789',
+            session_start_time=datetime.now().astimezone(),
+        )
+        self.path = 'test_patterned_optogenetic_series_rois.nwb'
+        self.device = self.nwbfile.create_device(name='device1')
+        self.light_source = LightSource(
+            name='Testing LightSource',
+            stimulation_wavelength=12.0,
+            filter_description='test 450–490 nm',
+        )
+        self.nwbfile.add_device(self.light_source)
+        self.spatial_light_modulator = SpatialLightModulator(
+            name='SLM-A1',
+            model_name='Hamamatsu X13138',
+            resolution=0.65
+        )
+        self.nwbfile.add_device(self.spatial_light_modulator)
+        self.stimulus_pattern = OptogeneticStimulusPattern(
+            name='stim_pattern',
+            description='test stim pattern',
+            duration=0.5,
+            number_of_stimulus_presentation=5,
+            inter_stimulus_interval=0.2,
+        )
+        self.nwbfile.add_lab_meta_data(self.stimulus_pattern)
+        self.site = PatternedOptogeneticStimulusSite(
+            name='test site',
+            device=self.device,
+            description='test site for PatternedOptogeneticSeries testing',
+            excitation_lambda=840.0,
+            location='location of the test stimulus site',
+        )
+        self.nwbfile.add_ogen_site(self.site)
+
+        self.image_mask_roi = np.zeros((7, 64, 48, 2), dtype=bool)
+        for roi in range(7):
+            self.image_mask_roi[roi, 5 * roi:5 * roi + 4, 2 * roi:2 * roi + 3, roi % 2] = True
+        self.image_mask_roi[4] = False  # empty ROI
+        self.boxes = np.array([[[5 * roi, 5 * roi + 4], [2 * roi, 2 * roi + 3], [roi % 2, roi % 2 + 1]]
+                               for roi in range(7)])
+        self.boxes[4] = 0
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def _write_and_read(self, **kwargs):
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            **kwargs
+        )
+        self.nwbfile.add_acquisition(pos)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+        self.io = NWBHDF5IO(self.path, mode='r')
+        self.addCleanup(self.io.close)
+        return self.io.read().acquisition['photostim_series']
+
+    def _check_access(self, pos):
+        self.assertEqual(pos.number_rois, 7)
+        np.testing.assert_array_equal(pos.get_roi(2), self.image_mask_roi[2])
+        np.testing.assert_array_equal(pos.get_roi(-1), self.image_mask_roi[6])
+        with self.assertRaises(IndexError):
+            pos.get_roi(7)
+        batches = list(pos.iter_rois(batch_size=3))
+        self.assertEqual([start for start, _ in batches], [0, 3, 6])
+        np.testing.assert_array_equal(np.concatenate([masks for _, masks in batches]), self.image_mask_roi)
+        np.testing.assert_array_equal(pos.roi_bounding_boxes(batch_size=3), self.boxes)
+        self._check_planes(pos)
+
+    def _check_planes(self, pos):
+        plane_rois, plane_rois_index = pos.compute_plane_index(batch_size=3)
+        np.testing.assert_array_equal(plane_rois, [0, 2, 6, 1, 3, 5])
+        np.testing.assert_array_equal(plane_rois_index, [3, 6])
+        for plane, expected in enumerate(([0, 2, 6], [1, 3, 5])):
+            rois, masks = pos.get_plane(plane)
+            np.testing.assert_array_equal(rois, expected)
+            np.testing.assert_array_equal(masks, self.image_mask_roi[expected, :, :, plane])
+        with self.assertRaises(IndexError):
+            pos.get_plane_rois(2)
+        # only the window is read, for any ROIs, including ROIs without pixels in the plane
+        np.testing.assert_array_equal(pos.get_plane_window(1, [6, 0, 3, 0], (13, 29), (5, 40)),
+                                      self.image_mask_roi[[6, 0, 3, 0], 13:29, 5:40, 1])
+        np.testing.assert_array_equal(pos.get_plane_window(0, [2]), self.image_mask_roi[[2], :, :, 0])
+        self.assertEqual(pos.get_plane_window(0, [], (0, 8), (0, 4)).shape, (0, 8, 4))
+
+    def test_dense_masks(self):
+        self._check_access(self._write_and_read(image_mask_roi=self.image_mask_roi))
+
+    def test_sparse_masks(self):
+        indices, index, mask_shape = encode_sparse_masks(self.image_mask_roi)
+        self._check_access(self._write_and_read(
+            image_mask_roi_indices=indices, image_mask_roi_index=index, image_mask_shape=mask_shape
+        ))
+
+    def test_packed_masks(self):
+        packed, mask_shape = pack_masks(self.image_mask_roi)
+        pos = self._write_and_read(image_mask_roi_packed=packed, image_mask_shape=mask_shape)
+        self.assertTrue(pos.has_packed_masks)
+        self.assertEqual(pos.image_mask_roi_packed.shape, (7, 8, 48, 2))
+        self.assertEqual(pos.get_packed_masks().shape, (7, 64, 48, 2))
+        np.testing.assert_array_equal(pos.get_packed_masks()[[5, 1], 10:20], self.image_mask_roi[[5, 1], 10:20])
+        np.testing.assert_array_equal(pos.get_image_masks(rois=[3, 0, 3]), self.image_mask_roi[[3, 0, 3]])
+        self._check_access(pos)
+
+    def test_packed_masks_require_shape(self):
+        with self.assertRaises(ValueError):
+            self._write_and_read(image_mask_roi_packed=pack_masks(self.image_mask_roi)[0])
+
+    def test_library_masks(self):
+        library = StimulusPatternLibrary(name='pattern_library')
+        library.add_masks(self.image_mask_roi[::-1])
+        self.nwbfile.add_lab_meta_data(library)
+        pos = self._write_and_read(library_roi_index=library.add_masks(self.image_mask_roi), pattern_library=library)
+        self.assertTrue(pos.has_library_masks)
+        self.assertEqual(pos.pattern_library.number_masks, 7)
+        self._check_access(pos)
+
+    def test_plane_index(self):
+        pos = self._write_and_read(image_mask_roi=self.image_mask_roi, plane_rois=[0, 2, 6, 1, 3, 5],
+                                   plane_rois_index=[3, 6])
+        self.assertEqual(pos.number_planes, 2)
+        np.testing.assert_array_equal(pos.get_plane_rois(1), [1, 3, 5])
+        rois, masks = pos.get_plane(0)
+        np.testing.assert_array_equal(masks, self.image_mask_roi[[0, 2, 6], :, :, 0])
+        with self.assertRaises(ValueError):
+            pos.append_rois(image_mask_roi=self.image_mask_roi[:1])
+
+    def test_plane_index_from_centers(self):
+        center_rois = [[1, 1, 2, 1], [2, 2, 0, 1], [3, 3, 2.2, 1], [np.nan, np.nan, np.nan, 0]]
+        pos = self._write_and_read(center_rois=center_rois)
+        self.assertIsNone(pos.number_planes)
+        np.testing.assert_array_equal(pos.get_plane_rois(2), [0, 2])
+        np.testing.assert_array_equal(pos.get_plane_rois(1), [])
+        with self.assertRaises(ValueError):
+            pos.get_plane(0)
+
+    def test_plane_index_requires_offsets(self):
+        with self.assertRaises(ValueError):
+            self._write_and_read(image_mask_roi=self.image_mask_roi, plane_rois=[0, 1])
+
+    def test_library_masks_require_library(self):
+        with self.assertRaises(ValueError):
+            self._write_and_read(library_roi_index=np.arange(7))
+
+    def test_ragged_pixels(self):
+        pixels, index = masks_to_pixels(self.image_mask_roi)
+        pos = PatternedOptogeneticSeries(
+            name='in_memory_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            pixel_rois=pixels,
+            pixel_rois_index=index,
+        )
+        self.assertTrue(pos.has_ragged_pixels)
+        self.assertEqual(pos.number_rois, 7)
+        self.assertTrue(np.shares_memory(pos.get_roi_pixels(3), pixels))
+        self.assertEqual(len(pos.get_roi_pixels(4)), 0)
+
+        read_pos = self._write_and_read(pixel_rois=pixels, pixel_rois_index=index)
+        self.assertEqual(read_pos.pixel_rois.shape, (self.image_mask_roi.sum(), 3))
+        for roi in range(7):
+            np.testing.assert_array_equal(read_pos.get_roi_pixels(roi), np.argwhere(self.image_mask_roi[roi]))
+
+    def test_memmap_rois(self):
+        pixel_rois, pixel_rois_index = masks_to_pixels(self.image_mask_roi)
+        pos = self._write_and_read(image_mask_roi=self.image_mask_roi, pixel_rois=pixel_rois,
+                                   pixel_rois_index=pixel_rois_index, roi_dataio=False)
+        masks = pos.memmap_rois()
+        self.assertIsInstance(masks, np.memmap)
+        self.assertFalse(masks.flags.writeable)
+        np.testing.assert_array_equal(masks, self.image_mask_roi)
+        np.testing.assert_array_equal(pos.memmap_rois('pixel_rois'), pixel_rois)
+        with self.assertRaises(ValueError):
+            pos.memmap_rois('data')
+        with self.assertRaises(ValueError):
+            pos.memmap_rois('image_mask_roi_indices')
+
+    def test_memmap_requires_contiguous(self):
+        pos = self._write_and_read(image_mask_roi=self.image_mask_roi)
+        with self.assertRaises(ValueError):
+            pos.memmap_rois()
+
+    def test_append_rois(self):
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            image_mask_roi_indices=appendable_roi_dataio((), 'uint32'),
+            image_mask_roi_index=appendable_roi_dataio((), 'uint32'),
+            image_mask_shape=[64, 48, 2],
+            center_rois=appendable_roi_dataio((4,), 'float64'),
+            pixel_rois=appendable_roi_dataio((3,), 'uint16'),
+            pixel_rois_index=appendable_roi_dataio((), 'uint32'),
+        )
+        self.nwbfile.add_acquisition(pos)
+        centers = masks_to_centers(self.image_mask_roi)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+            self.assertEqual(pos.number_rois, 0)
+            for start, stop in ((0, 3), (3, 4), (4, 7)):
+                pixels, index = masks_to_pixels(self.image_mask_roi[start:stop])
+                first = pos.append_rois(
+                    image_mask_roi=self.image_mask_roi[start:stop],
+                    center_rois=centers[start:stop],
+                    pixel_rois=pixels,
+                    pixel_rois_index=index,
+                )
+                self.assertEqual(first, start)
+            self.assertEqual(pos.number_rois, 7)
+            with self.assertRaises(ValueError):
+                pos.append_rois(center_rois=centers[:2], image_mask_roi=self.image_mask_roi[:1])
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_pos = io.read().acquisition['photostim_series']
+            self.assertEqual(read_pos.number_rois, 7)
+            self.assertIsNone(read_pos.center_rois.maxshape[0])
+            np.testing.assert_array_equal(read_pos.get_image_masks(), self.image_mask_roi)
+            np.testing.assert_array_equal(read_pos.center_rois[:], centers)
+            np.testing.assert_array_equal(read_pos.get_roi_pixels(5), np.argwhere(self.image_mask_roi[5]))
+
+    def test_append_packed_masks(self):
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            image_mask_roi_packed=appendable_roi_dataio((8, 48, 2), 'uint8'),
+            image_mask_shape=[64, 48, 2],
+        )
+        self.nwbfile.add_acquisition(pos)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+            self.assertEqual(pos.append_rois(image_mask_roi=self.image_mask_roi[:4]), 0)
+            self.assertEqual(pos.append_rois(image_mask_roi=self.image_mask_roi[4:]), 4)
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_pos = io.read().acquisition['photostim_series']
+            self.assertEqual(read_pos.number_rois, 7)
+            np.testing.assert_array_equal(read_pos.get_image_masks(), self.image_mask_roi)
+
+    def test_append_requires_written_dataset(self):
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            center_rois=np.ones((2, 4)),
+        )
+        with self.assertRaises(ValueError):
+            pos.append_rois(center_rois=np.ones((1, 4)))
+
+    def test_get_power_timestamps(self):
+        timestamps = np.sort(np.random.default_rng(0).uniform(0, 100, 1000))
+        data = np.arange(7000, dtype='float32').reshape(1000, 7)
+        read_pos = self._write_and_read(center_rois=np.ones((7, 4)), data=data, timestamps=timestamps)
+        self.assertEqual(read_pos.data.chunks[1], 7)
+        self.assertEqual(read_pos.num_samples, 1000)
+
+        expected = (timestamps >= 20) & (timestamps < 30.5)
+        times, values = read_pos.get_power(20, 30.5, rois=[5, 1])
+        np.testing.assert_array_equal(times, timestamps[expected])
+        np.testing.assert_array_equal(values, data[expected][:, [5, 1]])
+        times, values = read_pos.get_power(stop=timestamps[10])
+        np.testing.assert_array_equal(values, data[:10])
+        self.assertEqual(len(read_pos.get_power(200, 300)[0]), 0)
+
+    def test_get_power_rate(self):
+        data = np.arange(70, dtype='float32').reshape(10, 7)
+        read_pos = self._write_and_read(data=data, rate=10.0, starting_time=1.0)
+        times, values = read_pos.get_power(1.3, 1.6)
+        np.testing.assert_allclose(times, [1.3, 1.4, 1.5])
+        np.testing.assert_array_equal(values, data[3:6])
+        times, values = read_pos.get_power(0, 1.05, rois=[0])
+        np.testing.assert_array_equal(values, data[:1, :1])
+
+    def test_append_power(self):
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            data=appendable_time_dataio((7,), 'float32'),
+            timestamps=appendable_time_dataio((), 'float64'),
+        )
+        self.nwbfile.add_acquisition(pos)
+        data = np.random.default_rng(0).random((30, 7), dtype='float32')
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+            for trial in range(3):
+                first = pos.append_power(data[10 * trial:10 * trial + 10], timestamps=np.arange(10) + 10.0 * trial)
+                self.assertEqual(first, 10 * trial)
+            with self.assertRaises(ValueError):
+                pos.append_power(data[:2])
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_pos = io.read().acquisition['photostim_series']
+            times, values = read_pos.get_power(5, 25)
+            np.testing.assert_array_equal(times, np.arange(5, 25))
+            np.testing.assert_array_equal(values, data[5:25])
+
+    def test_get_active_rois(self):
+        stimulus_events = PatternedOptogeneticStimulusTable.from_patterns(
+            name='stimulus_events',
+            patterns=[self.stimulus_pattern],
+            train_start_times=[[0.0, 10.0]],
+            rois=[[1, 3]],
+        )
+        read_pos = self._write_and_read(image_mask_roi=self.image_mask_roi, stimulus_events=stimulus_events)
+        self.assertIsInstance(read_pos.stimulus_events, PatternedOptogeneticStimulusTable)
+        rois, index = read_pos.get_active_rois([0.25, 0.6, 10.7, 20.0])
+        np.testing.assert_array_equal(index, [2, 2, 4, 4])
+        np.testing.assert_array_equal(rois, [1, 3, 1, 3])
+
+    def test_get_spatial_index(self):
+        center_rois = masks_to_centers(self.image_mask_roi)
+        read_pos = self._write_and_read(center_rois=center_rois)
+        spatial_index = read_pos.get_spatial_index()
+        self.assertIs(read_pos.get_spatial_index(), spatial_index)
+        self.assertIsNot(read_pos.get_spatial_index(scale=2.0), spatial_index)
+        distances, rois = spatial_index.nearest(center_rois[[2, 5], :3], k=1)
+        np.testing.assert_array_equal(rois[:, 0], [2, 5])
+        rois, index = spatial_index.within_radius(center_rois[[0], :3], 12.0)
+        np.testing.assert_array_equal(rois, [0, 1, 2])
+
+    def test_create_phase_masks(self):
+        center_rois = masks_to_centers(self.image_mask_roi)
+        pos = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            image_mask_roi=self.image_mask_roi,
+            center_rois=center_rois,
+        )
+        with self.assertRaisesWith(ValueError, "'slm_shape' is required because 'SLM-A1' has no dimensions"):
+            pos.create_phase_masks()
+        # one hologram per plane by default
+        phase_masks = pos.create_phase_masks(slm_shape=(32, 32), iterations=10)
+        self.assertEqual(phase_masks.shape, (2, 32, 32))
+        with self.assertRaises(ValueError):
+            pos.create_phase_masks(slm_shape=(32, 32))
+        self.nwbfile.add_acquisition(pos)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_pos = io.read().acquisition['photostim_series']
+            np.testing.assert_array_equal(read_pos.get_phase_masks(), phase_masks)
+            np.testing.assert_array_equal(read_pos.get_phase_masks([1]), phase_masks[[1]])
+            # the empty ROI 4 is in no plane
+            np.testing.assert_array_equal(read_pos.get_hologram_rois(0), [0, 2, 6])
+            np.testing.assert_array_equal(read_pos.get_hologram_rois(1), [1, 3, 5])
+            with self.assertRaises(IndexError):
+                read_pos.get_hologram_rois(2)
+
+    def test_estimate_excitation(self):
+        read_pos = self._write_and_read(image_mask_roi=self.image_mask_roi)
+        with self.assertRaisesWith(ValueError, "'psf' is required because the stimulus_pattern of "
+                                               "'photostim_series' is not TemporalFocusing"):
+            read_pos.estimate_excitation()
+        psf = gaussian_psf(2.0, 4.0, (1.0, 1.0, 2.0))
+        volumes, (rois, values, index) = read_pos.estimate_excitation(psf=psf, voxel_size=(1.0, 1.0, 2.0),
+                                                                      batch_size=3)
+        expected_volumes, expected_crosstalk = estimate_excitation([self.image_mask_roi], psf, voxel_volume=2.0)
+        np.testing.assert_array_equal(volumes, expected_volumes)
+        self.assertEqual(volumes[4], 0)  # empty ROI
+        np.testing.assert_array_equal(rois, expected_crosstalk[0])
+        np.testing.assert_allclose(values, expected_crosstalk[1], rtol=1e-5)
+        np.testing.assert_array_equal(index, expected_crosstalk[2])
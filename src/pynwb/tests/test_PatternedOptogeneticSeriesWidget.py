@@ -0,0 +1,56 @@
+import importlib.util
+from unittest import skipUnless
+
+import numpy as np
+from pynwb.device import Device
+from pynwb.testing import TestCase
+
+from ndx_holostim import PatternedOptogeneticSeries, PatternedOptogeneticStimulusSite, LightSource
+from ndx_holostim import OptogeneticStimulusPattern, SpatialLightModulator
+from ndx_holostim.conversion import centers_to_masks
+
+# nwbwidgets itself is not imported, since the widget only needs the ipywidgets and matplotlib it installs
+HAVE_NWBWIDGETS = importlib.util.find_spec('nwbwidgets') is not None
+
+
+@skipUnless(HAVE_NWBWIDGETS, "nwbwidgets is not installed")
+class TestPatternedOptogeneticSeriesWidget(TestCase):
+    def setUp(self):
+        import matplotlib
+
+        matplotlib.use('Agg')
+        device = Device(name='device')
+        self.center_rois = np.array([[10, 12, 0, 3], [40, 30, 1, 4], [20, 50, 0, 2.5]])
+        self.series = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=PatternedOptogeneticStimulusSite(
+                name='site', device=device, description='site', excitation_lambda=1035.0, location='V1'
+            ),
+            device=device,
+            light_source=LightSource(
+                name='light_source', stimulation_wavelength=1035.0, filter_description='none', peak_power=0.7
+            ),
+            spatial_light_modulator=SpatialLightModulator(name='slm', model_name='slm', resolution=0.65),
+            stimulus_pattern=OptogeneticStimulusPattern(
+                name='pattern',
+                description='pattern',
+                duration=0.01,
+                number_of_stimulus_presentation=1,
+                inter_stimulus_interval=0.1,
+            ),
+            image_mask_roi=centers_to_masks(self.center_rois, (64, 64, 2)),
+            center_rois=self.center_rois,
+            roi_dataio=False,
+        )
+
+    def test_widget(self):
+        from ndx_holostim.widgets import PatternedOptogeneticSeriesWidget, vis_spec
+
+        self.assertIs(vis_spec[PatternedOptogeneticSeries], PatternedOptogeneticSeriesWidget)
+        widget = PatternedOptogeneticSeriesWidget(self.series, tile_size=64)
+        self.assertTrue(widget.info.value.endswith("ROIs in view"))
+        tile = widget.renderer._tiles[(0, 1, 0, 0)]
+        np.testing.assert_array_equal(np.unique(tile), [-1, 0, 2])
+        widget.plane.value = 1
+        widget.show_centers.value = True
+        np.testing.assert_array_equal(np.unique(widget.renderer._tiles[(1, 1, 0, 0)]), [-1, 1])
@@ -0,0 +1,81 @@
+from datetime import datetime
+from pynwb import NWBHDF5IO, NWBFile
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_holostim import PatternedOptogeneticStimulusSite
+
+
+class TestPatternedOptogeneticStimulusSiteConstructor(TestCase):
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='test PatternedOptogeneticStimulusSite',
+            identifier='POSS123',
+            session_start_time=datetime.now().astimezone(),
+        )
+        self.device = self.nwbfile.create_device(name='device1')
+
+    def test_constructor(self):
+        site = PatternedOptogeneticStimulusSite(
+            name='site1',
+            device=self.device,
+            description='test site',
+            excitation_lambda=840.0,
+            location='V1',
+            effector='ChR2',
+        )
+        self.assertEqual(site.name, 'site1')
+        self.assertIs(site.device, self.device)
+        self.assertEqual(site.excitation_lambda, 840.0)
+        self.assertEqual(site.effector, 'ChR2')
+
+    def test_from_arrays(self):
+        sites = PatternedOptogeneticStimulusSite.from_arrays(
+            names=['site%d' % number for number in range(10)],
+            device=self.device,
+            description='test site',
+            excitation_lambda=[840.0 + number for number in range(10)],
+            location='V1',
+        )
+        self.assertEqual(len(sites), 10)
+        self.assertIs(sites[3].device, self.device)
+        self.assertEqual(sites[3].excitation_lambda, 843.0)
+        self.assertIsNone(sites[3].effector)
+        with self.assertRaises(TypeError):
+            PatternedOptogeneticStimulusSite.from_arrays(
+                names=['site1'], device='device1', description='test site', excitation_lambda=840.0, location='V1')
+
+
+class TestPatternedOptogeneticStimulusSiteRoundtrip(TestCase):
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='test PatternedOptogeneticStimulusSite roundtrip',
+            identifier='POSS456',
+            session_start_time=datetime.now().astimezone(),
+        )
+        self.device = self.nwbfile.create_device(name='device1')
+        self.path = 'test_patterned_optogenetic_stimulus_site.nwb'
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_roundtrip(self):
+        sites = PatternedOptogeneticStimulusSite.from_arrays(
+            names=['site1', 'site2'],
+            device=self.device,
+            description='test site',
+            excitation_lambda=840.0,
+            location=['V1', 'S1'],
+            effector='ChR2',
+        )
+        for site in sites:
+            self.nwbfile.add_ogen_site(site)
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_nwbfile = io.read()
+            for site in sites:
+                read_site = read_nwbfile.ogen_sites[site.name]
+                self.assertIsInstance(read_site, PatternedOptogeneticStimulusSite)
+                self.assertContainerEqual(site, read_site)
@@ -0,0 +1,171 @@
+import numpy as np
+from datetime import datetime
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb import NWBHDF5IO, NWBFile
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_holostim import OptogeneticStimulusPattern, PatternedOptogeneticStimulusTable
+from ndx_holostim.events import build_interval_index, expand_stimulus_pattern, query_interval_index
+
+
+class TestExpandStimulusPattern(TestCase):
+    def test_expand(self):
+        pattern = OptogeneticStimulusPattern(
+            name='stim_pattern',
+            description='test stim pattern',
+            duration=0.5,
+            number_of_stimulus_presentation=3,
+            inter_stimulus_interval=0.25,
+        )
+        start_time, stop_time, roi = expand_stimulus_pattern(pattern, [10.0, 0.0], [4, 2])
+        np.testing.assert_allclose(start_time, np.repeat([0, 0.75, 1.5, 10, 10.75, 11.5], 2))
+        np.testing.assert_allclose(stop_time - start_time, 0.5)
+        np.testing.assert_array_equal(roi, [4, 2] * 6)
+
+
+class TestIntervalIndex(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.start_time = np.sort(rng.uniform(0, 100, 2000))
+        # mostly short pulses with a few long ones, so that max_stop_time differs from stop_time
+        self.stop_time = self.start_time + np.where(rng.random(2000) < 0.01, 20.0, rng.uniform(0.01, 0.5, 2000))
+        self.max_stop_time = build_interval_index(self.start_time, self.stop_time)
+
+    def _brute_force(self, start, stop=None):
+        rows = []
+        for number, time in enumerate(start):
+            if stop is None:
+                match = (self.start_time <= time) & (self.stop_time > time)
+            else:
+                match = (self.start_time < stop[number]) & (self.stop_time > time)
+            rows.append(np.flatnonzero(match))
+        return np.concatenate(rows), np.cumsum([len(r) for r in rows])
+
+    def test_point_queries(self):
+        times = np.concatenate(([-1.0, 150.0], self.start_time[:20], self.stop_time[:20], np.linspace(0, 120, 500)))
+        rows, index = query_interval_index(self.start_time, self.max_stop_time, self.stop_time, times)
+        expected_rows, expected_index = self._brute_force(times)
+        np.testing.assert_array_equal(index, expected_index)
+        np.testing.assert_array_equal(rows, expected_rows)
+
+    def test_range_queries(self):
+        start = np.linspace(-5, 110, 300)
+        stop = start + np.linspace(0, 3, 300)
+        rows, index = query_interval_index(self.start_time, self.max_stop_time, self.stop_time, start, stop)
+        expected_rows, expected_index = self._brute_force(start, stop)
+        np.testing.assert_array_equal(index, expected_index)
+        np.testing.assert_array_equal(rows, expected_rows)
+
+    def test_unsorted(self):
+        with self.assertRaises(ValueError):
+            build_interval_index([1.0, 0.0], [2.0, 1.0])
+
+
+class TestPatternedOptogeneticStimulusTableConstructor(TestCase):
+    def setUp(self):
+        self.patterns = [
+            OptogeneticStimulusPattern(
+                name='pattern_%d' % number,
+                description='test stim pattern',
+                duration=0.01,
+                number_of_stimulus_presentation=10,
+                inter_stimulus_interval=0.04,
+            )
+            for number in range(2)
+        ]
+
+    def test_from_patterns(self):
+        table = PatternedOptogeneticStimulusTable.from_patterns(
+            name='stimulus_events',
+            patterns=self.patterns,
+            train_start_times=[np.arange(0, 100, 2.0), np.arange(1, 101, 2.0)],
+            rois=[np.arange(10), [3, 20]],
+        )
+        self.assertEqual(len(table), 50 * 10 * 10 + 50 * 10 * 2)
+        self.assertListEqual(table.pattern_names, ['pattern_0', 'pattern_1'])
+        self.assertIsInstance(table.start_time.data, H5DataIO)
+        start_time = np.asarray(table.start_time.data)
+        self.assertTrue(np.all(np.diff(start_time) >= 0))
+        self.assertEqual(set(np.asarray(table.pattern.data)[np.asarray(table.roi.data) == 20]), {1})
+
+    def test_from_columns_sorts(self):
+        table = PatternedOptogeneticStimulusTable.from_columns(
+            name='stimulus_events',
+            start_time=[2.0, 1.0],
+            stop_time=[2.5, 1.5],
+            roi=[0, 1],
+            pattern=[0, 0],
+            pattern_names=['pattern_0'],
+            dataio=False,
+        )
+        np.testing.assert_array_equal(table.start_time.data, [1.0, 2.0])
+        np.testing.assert_array_equal(table.roi.data, [1, 0])
+
+    def test_from_columns_out_of_range(self):
+        kwargs = dict(name='stimulus_events', start_time=[1.0, 2.0], stop_time=[1.5, 2.5], roi=[0, 1],
+                      pattern_names=['pattern_0'], dataio=False)
+        msg = "'pattern' must be between 0 and 65535, got values between 0 and 65536"
+        with self.assertRaisesWith(ValueError, msg):
+            PatternedOptogeneticStimulusTable.from_columns(pattern=[0, 65536], **kwargs)
+        with self.assertRaises(ValueError):
+            PatternedOptogeneticStimulusTable.from_columns(pattern=[0, -1], **kwargs)
+        with self.assertRaises(ValueError):
+            PatternedOptogeneticStimulusTable.from_columns(**dict(kwargs, roi=[0, 2**32]), pattern=[0, 0])
+        table = PatternedOptogeneticStimulusTable.from_columns(pattern=[0, 65535], **kwargs)
+        np.testing.assert_array_equal(table.pattern.data, [0, 65535])
+
+    def test_add_interval(self):
+        table = PatternedOptogeneticStimulusTable(name='stimulus_events', pattern_names=['pattern_0'])
+        table.add_interval(start_time=1.0, stop_time=1.5, roi=3, pattern=0)
+        self.assertEqual(table[0, 'roi'], 3)
+        table.add_interval(start_time=0.0, stop_time=2.0, roi=5, pattern=0)
+        rows, index = table.get_active_rows([0.5, 1.2, 1.7])
+        np.testing.assert_array_equal(index, [1, 3, 4])
+        np.testing.assert_array_equal(rows, [1, 1, 0, 1])
+        rois, index = table.get_active_rois([0.5, 1.2], stop=[0.6, 1.3])
+        np.testing.assert_array_equal(rois, [5, 5, 3])
+
+
+class TestPatternedOptogeneticStimulusTableRoundtrip(TestCase):
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='Stimulus events test',
+            identifier='PST123',
+            session_start_time=datetime.now().astimezone(),
+        )
+        self.path = 'test_patterned_optogenetic_stimulus_table.nwb'
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_roundtrip(self):
+        pattern = OptogeneticStimulusPattern(
+            name='stim_pattern',
+            description='test stim pattern',
+            duration=0.01,
+            number_of_stimulus_presentation=5,
+            inter_stimulus_interval=0.09,
+        )
+        self.nwbfile.add_lab_meta_data(pattern)
+        table = PatternedOptogeneticStimulusTable.from_patterns(
+            name='stimulus_events',
+            patterns=[pattern],
+            train_start_times=[np.arange(0, 100, 1.0)],
+            rois=[np.arange(20)],
+        )
+        self.nwbfile.add_time_intervals(table)
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_nwbfile = io.read()
+            read_table = read_nwbfile.intervals['stimulus_events']
+            self.assertIsInstance(read_table, PatternedOptogeneticStimulusTable)
+            self.assertEqual(read_table.start_time.data.compression, 'gzip')
+            for column in ('start_time', 'stop_time', 'roi', 'pattern', 'max_stop_time'):
+                np.testing.assert_array_equal(read_table[column].data[:], table[column].data.data)
+            rois, index = read_table.get_active_rois([0.005, 0.05, 50.2])
+            np.testing.assert_array_equal(index, [20, 20, 40])
+            np.testing.assert_array_equal(rois, np.tile(np.arange(20), 2))
+            self.assertIs(read_nwbfile.lab_meta_data[read_table.pattern_names[0]].__class__, pattern.__class__)
@@ -0,0 +1,118 @@
+import numpy as np
+from datetime import datetime
+from pynwb import NWBHDF5IO, NWBFile
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_holostim import PatternedOptogeneticSeries, PatternedOptogeneticStimulusSite, LightSource
+from ndx_holostim import RoiMaskPyramid, SpatialLightModulator, SpiralScanning
+from ndx_holostim.masks import downsample_masks, encode_sparse_masks
+from ndx_holostim.pyramid import build_mask_pyramid
+
+
+class TestRoiMaskPyramidConstructor(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.masks = rng.random((6, 21, 13, 2)) > 0.97
+
+    def test_from_masks(self):
+        pyramid = RoiMaskPyramid.from_masks(self.masks, roi_dataio=False)
+        self.assertEqual(pyramid.name, 'mask_pyramid')
+        self.assertEqual(pyramid.factors, (2, 4, 8))
+        np.testing.assert_array_equal(pyramid.mask_shape, [21, 13, 2])
+        for factor in (2, 4, 8):
+            np.testing.assert_array_equal(pyramid.get_masks(factor), downsample_masks(self.masks, factor))
+        self.assertEqual(pyramid.get_masks(8).shape, (6, 3, 2, 2))
+        np.testing.assert_array_equal(pyramid.footprint, self.masks.any(axis=0))
+        np.testing.assert_array_equal(pyramid.get_masks(4, rois=[5, 0]), downsample_masks(self.masks[[5, 0]], 4))
+
+    def test_batches(self):
+        levels = build_mask_pyramid([self.masks[:4], self.masks[4:]], (21, 13, 2), factors=(2, 8))
+        self.assertEqual(sorted(levels), ['footprint', 'masks_2x', 'masks_8x'])
+        np.testing.assert_array_equal(levels['masks_8x'], downsample_masks(self.masks, 8))
+        with self.assertRaises(ValueError):
+            build_mask_pyramid([self.masks], (21, 13, 2), factors=(3,))
+
+    def test_choose_factor(self):
+        pyramid = RoiMaskPyramid.from_masks(self.masks, factors=(2, 8))
+        self.assertEqual(pyramid.factors, (2, 8))
+        self.assertEqual([pyramid.choose_factor(f) for f in (1, 2, 5, 8, 16)], [1, 2, 2, 8, 8])
+        with self.assertRaises(ValueError):
+            pyramid.get_level(4)
+
+
+class TestRoiMaskPyramidRoundtrip(TestCase):
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='test RoiMaskPyramid',
+            identifier='RMP123',
+            session_start_time=datetime.now().astimezone(),
+        )
+        self.path = 'test_roi_mask_pyramid.nwb'
+        self.device = self.nwbfile.create_device(name='device1')
+        self.light_source = LightSource(
+            name='light_source', stimulation_wavelength=1035.0, filter_description='none')
+        self.nwbfile.add_device(self.light_source)
+        self.spatial_light_modulator = SpatialLightModulator(name='slm', model_name='Hamamatsu X13138', resolution=0.65)
+        self.nwbfile.add_device(self.spatial_light_modulator)
+        self.site = PatternedOptogeneticStimulusSite(
+            name='site', device=self.device, description='test site', excitation_lambda=1035.0, location='V1')
+        self.nwbfile.add_ogen_site(self.site)
+        self.stimulus_pattern = SpiralScanning(
+            name='spiral',
+            description='spiral scanning',
+            duration=0.01,
+            number_of_stimulus_presentation=5,
+            inter_stimulus_interval=0.02,
+            diameter=15e-6,
+            height=10e-6,
+            number_of_revolutions=5,
+        )
+        self.nwbfile.add_lab_meta_data(self.stimulus_pattern)
+        rng = np.random.default_rng(0)
+        self.masks = rng.random((9, 40, 30, 1)) > 0.95
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def _series(self, **kwargs):
+        return PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            **kwargs
+        )
+
+    def test_roundtrip(self):
+        indices, index, mask_shape = encode_sparse_masks(self.masks)
+        pos = self._series(image_mask_roi_indices=indices, image_mask_roi_index=index, image_mask_shape=mask_shape)
+        pyramid = pos.create_mask_pyramid(batch_size=4)
+        self.assertIs(pos.mask_pyramid, pyramid)
+        with self.assertRaises(ValueError):
+            pos.create_mask_pyramid()
+        self.nwbfile.add_acquisition(pos)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_pos = io.read().acquisition['photostim_series']
+            self.assertIsInstance(read_pos.mask_pyramid, RoiMaskPyramid)
+            self.assertContainerEqual(pyramid, read_pos.mask_pyramid)
+            masks, factor = read_pos.get_downsampled_masks(6, rois=[7, 2])
+            self.assertEqual(factor, 4)
+            np.testing.assert_array_equal(masks, downsample_masks(self.masks[[7, 2]], 4))
+            masks, factor = read_pos.get_downsampled_masks(1)
+            self.assertEqual(factor, 1)
+            np.testing.assert_array_equal(masks, self.masks)
+
+    def test_downsample_without_pyramid(self):
+        pos = self._series(image_mask_roi=self.masks)
+        masks, factor = pos.get_downsampled_masks(3)
+        self.assertEqual(factor, 3)
+        np.testing.assert_array_equal(masks, downsample_masks(self.masks, 3))
+
+    def test_requires_masks(self):
+        with self.assertRaises(ValueError):
+            self._series(center_rois=np.ones((2, 4))).create_mask_pyramid()
@@ -46,3 +46,22 @@ class TestSpatialLightModulatorRoundtrip(TestCase):
             read_nwbfile = io.read()
             read_slm = read_nwbfile.devices['SLM-B2']
             self.assertContainerEqual(slm, read_slm)
+
+    def test_roundtrip_dimensions(self):
+        slm = SpatialLightModulator(
+            name='SLM-B2',
+            model_name='Meadowlark XY-Phase',
+            resolution=1.2,
+            dimensions=[1920, 1152],
+        )
+
+        self.nwbfile.add_device(slm)
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_nwbfile = io.read()
+            read_slm = read_nwbfile.devices['SLM-B2']
+            self.assertContainerEqual(slm, read_slm)
+            self.assertEqual(list(read_slm.dimensions), [1920, 1152])
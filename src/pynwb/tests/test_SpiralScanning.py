@@ -1,8 +1,10 @@
+import numpy as np
 from pynwb import NWBHDF5IO, NWBFile
 from pynwb.testing import TestCase, remove_test_file
 from datetime import datetime
 
 from ndx_holostim import SpiralScanning
+from ndx_holostim.spiral import spiral_kernel, spiral_trajectory
 
 
 class TestSpiralScanningConstructor(TestCase):
@@ -34,6 +36,41 @@ class TestSpiralScanningConstructor(TestCase):
         self.assertEqual(spiral.height, 0.02)
         self.assertEqual(spiral.number_of_revolutions, 5)
 
+    def test_from_arrays(self):
+        spirals = SpiralScanning.from_arrays(
+            names=['spiral1', 'spiral2'],
+            description='Spiral stimulation pattern',
+            duration=0.5,
+            number_of_stimulus_presentation=3,
+            inter_stimulus_interval=0.1,
+            diameter=[0.01, 0.015],
+            height=0.02,
+            number_of_revolutions=5,
+        )
+        self.assertIsInstance(spirals[1], SpiralScanning)
+        self.assertEqual(spirals[1].diameter, 0.015)
+        self.assertEqual(spirals[1].number_of_revolutions, 5)
+
+    def test_spiral_illumination(self):
+        spiral = SpiralScanning(
+            name='spiral1',
+            description='Spiral stimulation pattern',
+            duration=0.01,
+            number_of_stimulus_presentation=3,
+            inter_stimulus_interval=0.1,
+            diameter=10e-6,
+            height=4e-6,
+            number_of_revolutions=5,
+        )
+        center_rois = np.array([[10.0, 20.0, 0.0, 3.0], [30.0, 12.0, 1.0, 3.0]])
+        trajectories = spiral.get_trajectories(center_rois, pixel_size=0.5e-6, plane_spacing=2e-6)
+        np.testing.assert_allclose(trajectories[1], center_rois[1, :3] + spiral_trajectory(20.0, 2.0, 5))
+        pixels, dwell, index = spiral.get_illumination(center_rois, pixel_size=0.5e-6, beam_radius=0.5e-6)
+        offsets, times = spiral_kernel(20.0, 5, 0.01, beam_radius=1.0)
+        np.testing.assert_array_equal(index, [len(offsets), 2 * len(offsets)])
+        np.testing.assert_array_equal(pixels[index[0]:, :2], offsets + [30, 12])
+        np.testing.assert_allclose(dwell[index[0]:], times)
+
 
 class TestSpiralScanningRoundtrip(TestCase):
     def setUp(self):
@@ -68,3 +105,25 @@ class TestSpiralScanningRoundtrip(TestCase):
             read_nwbfile = io.read()
             read_spiral = read_nwbfile.lab_meta_data['spiral1']
             self.assertContainerEqual(spiral, read_spiral)
+
+    def test_roundtrip_from_arrays(self):
+        spirals = SpiralScanning.from_arrays(
+            names=['spiral%d' % number for number in range(3)],
+            description='Spiral stimulation pattern',
+            duration=0.5,
+            number_of_stimulus_presentation=3,
+            inter_stimulus_interval=0.1,
+            diameter=[0.01, 0.015, 0.02],
+            height=0.02,
+            number_of_revolutions=[5, 6, 7],
+        )
+        for spiral in spirals:
+            self.nwbfile.add_lab_meta_data(spiral)
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_nwbfile = io.read()
+            for spiral in spirals:
+                self.assertContainerEqual(spiral, read_nwbfile.lab_meta_data[spiral.name])
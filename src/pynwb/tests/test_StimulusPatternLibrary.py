@@ -0,0 +1,211 @@
+import numpy as np
+from datetime import datetime
+from pynwb import NWBHDF5IO, NWBFile
+from pynwb.testing import TestCase, remove_test_file
+
+from ndx_holostim import PatternedOptogeneticSeries, PatternedOptogeneticStimulusSite, LightSource
+from ndx_holostim import SpatialLightModulator, SpiralScanning, StimulusPatternLibrary, TemporalFocusing
+from ndx_holostim.io import appendable_roi_dataio
+from ndx_holostim.library import hash_pattern, hash_sparse_masks
+from ndx_holostim.masks import encode_sparse_masks
+
+
+def _spiral(name, diameter=15e-6):
+    return SpiralScanning(
+        name=name,
+        description='spiral scanning',
+        duration=0.01,
+        number_of_stimulus_presentation=5,
+        inter_stimulus_interval=0.02,
+        diameter=diameter,
+        height=10e-6,
+        number_of_revolutions=5,
+    )
+
+
+class TestStimulusPatternLibraryConstructor(TestCase):
+    def setUp(self):
+        self.masks = np.zeros((4, 16, 12, 1), dtype=bool)
+        for mask in range(4):
+            self.masks[mask, 3 * mask:3 * mask + 2, mask:mask + 4] = True
+        self.masks[3] = False  # empty mask
+
+    def test_constructor(self):
+        library = StimulusPatternLibrary(name='pattern_library')
+        self.assertEqual(library.number_masks, 0)
+        self.assertEqual(len(library.optogenetic_stimulus_patterns), 0)
+
+    def test_add_masks_deduplicates(self):
+        library = StimulusPatternLibrary(name='pattern_library')
+        entries = library.add_masks(self.masks[[0, 1, 0, 3]])
+        np.testing.assert_array_equal(entries, [0, 1, 0, 2])
+        entries = library.add_masks(self.masks[[2, 1, 3, 2]])
+        np.testing.assert_array_equal(entries, [3, 1, 2, 3])
+        self.assertEqual(library.number_masks, 4)
+        self.assertEqual(len(set(library.mask_hashes)), 4)
+        np.testing.assert_array_equal(library.get_masks(entries), self.masks[[2, 1, 3, 2]])
+        np.testing.assert_array_equal(library.get_mask(0), self.masks[0])
+
+    def test_add_sparse_masks(self):
+        library = StimulusPatternLibrary(name='pattern_library')
+        indices, index, mask_shape = encode_sparse_masks(self.masks)
+        np.testing.assert_array_equal(library.add_sparse_masks(indices, index, mask_shape), np.arange(4))
+        np.testing.assert_array_equal(library.add_masks(self.masks[::-1]), np.arange(4)[::-1])
+        self.assertEqual(list(library.mask_hashes), hash_sparse_masks(indices, index, mask_shape))
+        with self.assertRaises(ValueError):
+            library.add_masks(np.zeros((1, 8, 8, 1), dtype=bool))
+
+    def test_add_no_masks(self):
+        library = StimulusPatternLibrary(name='pattern_library')
+        entries = library.add_masks(self.masks[:0])
+        self.assertEqual(entries.dtype, np.uint32)
+        self.assertEqual(len(entries), 0)
+        self.assertEqual(library.number_masks, 0)
+        np.testing.assert_array_equal(library.mask_shape, [16, 12, 1])
+
+    def test_mask_cache(self):
+        library = StimulusPatternLibrary(name='pattern_library', mask_cache_size=2)
+        library.add_masks(self.masks)
+        library.get_masks([1, 1])
+        self.assertEqual(list(library._mask_cache), [1])
+        library.get_masks([0, 1, 2, 3])
+        self.assertEqual(list(library._mask_cache), [2, 3])
+        with self.assertRaises(IndexError):
+            library.get_mask(4)
+
+    def test_add_pattern_deduplicates(self):
+        library = StimulusPatternLibrary(name='pattern_library')
+        first = _spiral('spiral1')
+        self.assertIs(library.add_pattern(first), first)
+        self.assertIs(library.add_pattern(_spiral('spiral2')), first)
+        second = _spiral('spiral3', diameter=20e-6)
+        self.assertIs(library.add_pattern(second), second)
+        self.assertEqual(sorted(library.optogenetic_stimulus_patterns), ['spiral1', 'spiral3'])
+
+    def test_hash_pattern_large_arrays(self):
+        def temporal_focusing(name, psf):
+            return TemporalFocusing(
+                name=name,
+                description='Temporal focusing pattern',
+                duration=0.8,
+                number_of_stimulus_presentation=2,
+                inter_stimulus_interval=0.3,
+                lateral_point_spread_function='1.2 ± 0.3 µm',
+                axial_point_spread_function='3.4 ± 0.5 µm',
+                point_spread_function=psf,
+                psf_voxel_size=[0.5, 0.5, 1.0],
+            )
+
+        first = np.zeros((11, 11, 11))
+        second = first.copy()
+        second[5, 5, 5] = 1.0  # numpy abbreviates the repr of both arrays to the same string
+        self.assertEqual(repr(first), repr(second))
+        self.assertNotEqual(hash_pattern(temporal_focusing('tf1', first)),
+                            hash_pattern(temporal_focusing('tf2', second)))
+        self.assertEqual(hash_pattern(temporal_focusing('tf1', second)),
+                         hash_pattern(temporal_focusing('tf2', second)))
+        library = StimulusPatternLibrary(name='pattern_library')
+        library.add_pattern(temporal_focusing('tf1', first))
+        library.add_pattern(temporal_focusing('tf2', second))
+        self.assertEqual(sorted(library.optogenetic_stimulus_patterns), ['tf1', 'tf2'])
+
+    def test_hash_pattern_normalizes_scalars(self):
+        self.assertEqual(hash_pattern(_spiral('spiral1', diameter=0.5)),
+                         hash_pattern(_spiral('spiral2', diameter=np.float32(0.5))))
+        self.assertNotEqual(hash_pattern(_spiral('spiral1', diameter=0.5)),
+                            hash_pattern(_spiral('spiral2', diameter=0.25)))
+
+
+class TestStimulusPatternLibraryRoundtrip(TestCase):
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='test StimulusPatternLibrary',
+            identifier='SPL123',
+            session_start_time=datetime.now().astimezone(),
+        )
+        self.path = 'test_stimulus_pattern_library.nwb'
+        self.device = self.nwbfile.create_device(name='device1')
+        self.light_source = LightSource(
+            name='light_source', stimulation_wavelength=1035.0, filter_description='none')
+        self.nwbfile.add_device(self.light_source)
+        self.spatial_light_modulator = SpatialLightModulator(name='slm', model_name='Hamamatsu X13138', resolution=0.65)
+        self.nwbfile.add_device(self.spatial_light_modulator)
+        self.site = PatternedOptogeneticStimulusSite(
+            name='site', device=self.device, description='test site', excitation_lambda=1035.0, location='V1')
+        self.nwbfile.add_ogen_site(self.site)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_roundtrip(self):
+        library = StimulusPatternLibrary(name='pattern_library')
+        self.nwbfile.add_lab_meta_data(library)
+        rng = np.random.default_rng(0)
+        masks = rng.random((5, 20, 20, 1)) > 0.9
+        for trial in range(3):
+            self.nwbfile.add_acquisition(PatternedOptogeneticSeries(
+                name='trial%d' % trial,
+                site=self.site,
+                device=self.device,
+                light_source=self.light_source,
+                spatial_light_modulator=self.spatial_light_modulator,
+                stimulus_pattern=library.add_pattern(_spiral('spiral%d' % trial)),
+                pattern_library=library,
+                library_roi_index=library.add_masks(masks[trial:trial + 3]),
+            ))
+        self.assertEqual(library.number_masks, 5)
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_nwbfile = io.read()
+            read_library = read_nwbfile.lab_meta_data['pattern_library']
+            self.assertIsInstance(read_library, StimulusPatternLibrary)
+            self.assertEqual(list(read_library.optogenetic_stimulus_patterns), ['spiral0'])
+            self.assertEqual(read_library.number_masks, 5)
+            for trial in range(3):
+                series = read_nwbfile.acquisition['trial%d' % trial]
+                self.assertIs(series.pattern_library, read_library)
+                self.assertIs(series.stimulus_pattern, read_library.optogenetic_stimulus_patterns['spiral0'])
+                np.testing.assert_array_equal(series.get_image_masks(), masks[trial:trial + 3])
+            # adding a mask already in the file resolves to the stored entry
+            np.testing.assert_array_equal(read_library.add_masks(masks[[4]]), [4])
+            # a pattern read from the file matches its in-memory copy
+            self.assertIs(read_library.add_pattern(_spiral('spiral3')),
+                          read_library.optogenetic_stimulus_patterns['spiral0'])
+
+    def test_append_rois(self):
+        library = StimulusPatternLibrary(name='pattern_library')
+        self.nwbfile.add_lab_meta_data(library)
+        rng = np.random.default_rng(1)
+        masks = rng.random((6, 20, 20, 1)) > 0.9
+        self.nwbfile.add_acquisition(PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=library.add_pattern(_spiral('spiral')),
+            pattern_library=library,
+            library_roi_index=appendable_roi_dataio((), np.uint32),
+        ))
+        library.add_masks(masks[:3])
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='a') as io:
+            series = io.read().acquisition['photostim_series']
+            # masks 1 and 2 are already in the library, masks 3 to 5 are added to it
+            self.assertEqual(series.append_rois(image_mask_roi=masks[1:]), 0)
+            self.assertEqual(series.append_rois(image_mask_roi=masks[[0]]), 5)
+
+        with NWBHDF5IO(self.path, mode='r') as io:
+            read_nwbfile = io.read()
+            read_library = read_nwbfile.lab_meta_data['pattern_library']
+            self.assertEqual(read_library.number_masks, 6)
+            self.assertEqual(len(set(read_library.mask_hashes[:])), 6)
+            series = read_nwbfile.acquisition['photostim_series']
+            np.testing.assert_array_equal(series.library_roi_index[:], [1, 2, 3, 4, 5, 0])
+            np.testing.assert_array_equal(series.get_image_masks(), masks[[1, 2, 3, 4, 5, 0]])
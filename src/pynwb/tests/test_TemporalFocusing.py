@@ -1,3 +1,4 @@
+import numpy as np
 from pynwb import NWBHDF5IO, NWBFile
 from pynwb.testing import TestCase, remove_test_file
 from datetime import datetime
@@ -32,6 +33,117 @@ class TestTemporalFocusingConstructor(TestCase):
         self.assertEqual(tfocus.lateral_point_spread_function, '1.2 ± 0.3 µm')
         self.assertEqual(tfocus.axial_point_spread_function, '3.4 ± 0.5 µm')
 
+    def test_parsed_psf_widths(self):
+        tfocus = TemporalFocusing(
+            name='tfocus1',
+            description='Temporal focusing pattern',
+            duration=0.8,
+            number_of_stimulus_presentation=2,
+            inter_stimulus_interval=0.3,
+            lateral_point_spread_function='1.2 ± 0.3 µm',
+            axial_point_spread_function='3.4 ± 0.5 µm'
+        )
+        np.testing.assert_allclose(tfocus.lateral_psf, [1.2, 0.3])
+        np.testing.assert_allclose(tfocus.axial_psf, [3.4, 0.5])
+
+    def test_psf(self):
+        tfocus = TemporalFocusing(
+            name='tfocus1',
+            description='Temporal focusing pattern',
+            duration=0.8,
+            number_of_stimulus_presentation=2,
+            inter_stimulus_interval=0.3,
+            lateral_point_spread_function='see methods',
+            axial_point_spread_function='8000 +/- 1000 nm',
+            lateral_psf=[2.0, 0.2],
+        )
+        np.testing.assert_allclose(tfocus.axial_psf, [8.0, 1.0])
+        lateral, axial = tfocus.get_psf_widths()
+        np.testing.assert_array_equal(lateral, [2.0, 0.2])
+        with self.assertRaisesWith(ValueError, "'voxel_size' is required because 'tfocus1' has no psf_voxel_size"):
+            tfocus.get_psf()
+        psf = tfocus.get_psf(voxel_size=[0.5, 0.5, 2.0])
+        self.assertAlmostEqual(psf.sum(), 1.0, places=5)
+        # the lateral profile through the center falls to half its peak one FWHM apart
+        profile = psf[:, psf.shape[1] // 2, psf.shape[2] // 2]
+        center = len(profile) // 2
+        self.assertAlmostEqual(profile[center + 2] / profile[center], 0.5, places=5)
+
+    def test_measured_psf(self):
+        with self.assertRaises(ValueError):
+            TemporalFocusing(
+                name='tfocus1',
+                description='Temporal focusing pattern',
+                duration=0.8,
+                number_of_stimulus_presentation=2,
+                inter_stimulus_interval=0.3,
+                lateral_point_spread_function='1.2 ± 0.3 µm',
+                axial_point_spread_function='3.4 ± 0.5 µm',
+                point_spread_function=np.ones((3, 3, 3)),
+            )
+        tfocus = TemporalFocusing(
+            name='tfocus1',
+            description='Temporal focusing pattern',
+            duration=0.8,
+            number_of_stimulus_presentation=2,
+            inter_stimulus_interval=0.3,
+            lateral_point_spread_function='1.2 ± 0.3 µm',
+            axial_point_spread_function='3.4 ± 0.5 µm',
+            point_spread_function=np.ones((3, 3, 3)),
+            psf_voxel_size=[0.5, 0.5, 2.0],
+        )
+        np.testing.assert_allclose(tfocus.get_psf(), np.full((3, 3, 3), 1 / 27))
+        with self.assertRaises(ValueError):
+            tfocus.get_psf(voxel_size=[1.0, 1.0, 1.0])
+
+    def test_from_arrays(self):
+        psf = np.random.default_rng(0).random((5, 5, 3)).astype(np.float32)
+        shared = dict(
+            description='Temporal focusing pattern',
+            number_of_stimulus_presentation=2,
+            inter_stimulus_interval=0.3,
+            axial_point_spread_function='8000 +/- 1000 nm',
+            psf_voxel_size=[0.5, 0.5, 2.0],
+        )
+        per_pattern = dict(
+            duration=[0.8, 0.9, 1.0],
+            lateral_point_spread_function=['1.2 ± 0.3 µm', 'see methods', '1.2 ± 0.3 µm'],
+            lateral_psf=[None, [2.0, 0.2], None],
+            point_spread_function=[None, psf, None],
+        )
+        patterns = TemporalFocusing.from_arrays(['tfocus%d' % number for number in range(3)], **shared, **per_pattern)
+        for number, pattern in enumerate(patterns):
+            expected = TemporalFocusing(
+                name='tfocus%d' % number,
+                **shared,
+                **{key: values[number] for key, values in per_pattern.items() if values[number] is not None}
+            )
+            self.assertContainerEqual(pattern, expected, ignore_hdmf_attrs=True)
+        np.testing.assert_allclose(patterns[0].lateral_psf, [1.2, 0.3])
+        np.testing.assert_allclose(patterns[2].axial_psf, [8.0, 1.0])
+        self.assertIsNone(patterns[0].point_spread_function)
+        np.testing.assert_array_equal(patterns[1].point_spread_function, psf)
+
+    def test_from_arrays_errors(self):
+        kwargs = dict(
+            description='Temporal focusing pattern',
+            duration=0.8,
+            number_of_stimulus_presentation=2,
+            inter_stimulus_interval=0.3,
+            lateral_point_spread_function='1.2 ± 0.3 µm',
+            axial_point_spread_function='3.4 ± 0.5 µm',
+        )
+        with self.assertRaisesWith(ValueError, "'psf_voxel_size' is required to use 'point_spread_function'"):
+            TemporalFocusing.from_arrays(['tfocus1', 'tfocus2'], point_spread_function=np.ones((3, 3, 3)), **kwargs)
+        with self.assertRaisesWith(ValueError, "'psf_voxel_size' is required to use 'point_spread_function'"):
+            TemporalFocusing.from_arrays(['tfocus1', 'tfocus2'], point_spread_function=[None, np.ones((3, 3, 3))],
+                                         psf_voxel_size=[[0.5, 0.5, 2.0], None], **kwargs)
+        with self.assertRaises(ValueError):
+            TemporalFocusing.from_arrays(['tfocus1'], psf_voxel_size=[0.5, 2.0], **kwargs)
+        with self.assertRaises(ValueError):
+            TemporalFocusing.from_arrays(['tfocus1', 'tfocus2'], point_spread_function=[np.ones((3, 3, 3))] * 3,
+                                         psf_voxel_size=[0.5, 0.5, 2.0], **kwargs)
+
 
 class TestTemporalFocusingRoundtrip(TestCase):
     def setUp(self):
@@ -66,3 +178,54 @@ class TestTemporalFocusingRoundtrip(TestCase):
             read_tfocus = read_nwbfile.lab_meta_data['tfocus1']
 
             self.assertContainerEqual(tfocus, read_tfocus)
+
+    def test_roundtrip_psf(self):
+        tfocus = TemporalFocusing(
+            name='tfocus1',
+            description='Temporal focusing pattern',
+            duration=0.8,
+            number_of_stimulus_presentation=2,
+            inter_stimulus_interval=0.3,
+            lateral_point_spread_function='see methods',
+            axial_point_spread_function='3.4 ± 0.5 µm',
+            lateral_psf=[1.2, 0.3],
+            point_spread_function=np.random.default_rng(0).random((5, 5, 3)).astype(np.float32),
+            psf_voxel_size=[0.5, 0.5, 2.0],
+        )
+
+        self.nwbfile.add_lab_meta_data(tfocus)
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_nwbfile = io.read()
+            read_tfocus = read_nwbfile.lab_meta_data['tfocus1']
+
+            self.assertContainerEqual(tfocus, read_tfocus)
+            np.testing.assert_allclose(read_tfocus.lateral_psf, [1.2, 0.3])
+            np.testing.assert_allclose(read_tfocus.get_psf(), tfocus.get_psf(), rtol=1e-6)
+
+    def test_roundtrip_from_arrays(self):
+        tfoci = TemporalFocusing.from_arrays(
+            names=['tfocus%d' % number for number in range(3)],
+            description='Temporal focusing pattern',
+            duration=[0.8, 0.9, 1.0],
+            number_of_stimulus_presentation=2,
+            inter_stimulus_interval=0.3,
+            lateral_point_spread_function=['1.2 ± 0.3 µm', 'see methods', '1.2 ± 0.3 µm'],
+            axial_point_spread_function='3.4 ± 0.5 µm',
+            lateral_psf=[None, [2.0, 0.2], None],
+            point_spread_function=[None, np.random.default_rng(0).random((5, 5, 3)).astype(np.float32), None],
+            psf_voxel_size=[None, [0.5, 0.5, 2.0], None],
+        )
+        for tfocus in tfoci:
+            self.nwbfile.add_lab_meta_data(tfocus)
+
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_nwbfile = io.read()
+            for tfocus in tfoci:
+                self.assertContainerEqual(tfocus, read_nwbfile.lab_meta_data[tfocus.name])
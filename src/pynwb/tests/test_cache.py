@@ -0,0 +1,110 @@
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_holostim import cache as cache_module
+from ndx_holostim.cache import ScanCache, file_hash
+from ndx_holostim.scan import scan_file, scan_files
+
+from .test_scan import _write_session
+
+
+class TestScanCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.paths = [os.path.join(self.directory.name, 'session%d.nwb' % number) for number in range(3)]
+        for number, path in enumerate(self.paths):
+            _write_session(path, number, number + 2)
+        self.cache = ScanCache(os.path.join(self.directory.name, 'cache.sqlite'))
+        self.addCleanup(self.cache.close)
+
+    def _scan(self):
+        with mock.patch('ndx_holostim.scan.scan_file', wraps=scan_file) as scanned:
+            result = scan_files(self.paths, max_workers=1, cache=self.cache)
+        return result, sorted(call.args[0] for call in scanned.call_args_list)
+
+    def _check_equal(self, result, expected):
+        for table, columns in expected.tables.items():
+            self.assertEqual(list(columns), list(result[table]))
+            for key, column in columns.items():
+                np.testing.assert_array_equal(result[table][key], column)
+
+    def test_cached_scan(self):
+        expected, scanned = self._scan()
+        self.assertEqual(scanned, self.paths)
+        self.assertEqual(len(self.cache), 3)
+        result, scanned = self._scan()
+        self.assertEqual(scanned, [])
+        self._check_equal(result, expected)
+
+    def test_modified_file(self):
+        self._scan()
+        _write_session(self.paths[1], 5, 7)
+        result, scanned = self._scan()
+        self.assertEqual(scanned, [self.paths[1]])
+        np.testing.assert_array_equal(result['series']['number_rois'], [2, 7, 4])
+
+    def test_touched_file(self):
+        self._scan()
+        stat = os.stat(self.paths[0])
+        os.utime(self.paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        # a fingerprint cannot tell that the content is unchanged, so the file is scanned again
+        self.assertEqual(self._scan()[1], [self.paths[0]])
+        self.assertEqual(self._scan()[1], [])
+
+    def test_touched_file_full_hash(self):
+        self.cache.close()
+        self.cache = ScanCache(self.cache.path, full_hash=True)
+        self.addCleanup(self.cache.close)
+        expected, _ = self._scan()
+        stat = os.stat(self.paths[0])
+        os.utime(self.paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with mock.patch.object(cache_module, 'file_hash', wraps=file_hash) as hashed:
+            result, scanned = self._scan()
+            self.assertEqual(hashed.call_count, 1)
+        # the content is unchanged, so the file is not scanned again
+        self.assertEqual(scanned, [])
+        self._check_equal(result, expected)
+        with mock.patch.object(cache_module, 'file_hash', wraps=file_hash) as hashed:
+            self._scan()
+            self.assertEqual(hashed.call_count, 0)
+
+    def test_same_size_edit(self):
+        path = self.paths[0]
+        with mock.patch.object(cache_module, 'FINGERPRINT_BYTES', 1024):
+            self._scan()
+            fingerprint = file_hash(path)
+            size = os.path.getsize(path)
+            self.assertGreater(size, 3 * 1024)
+            # flip a byte in the middle of the file, which the fingerprint does not read
+            with open(path, 'r+b') as stream:
+                stream.seek(size // 2)
+                byte = stream.read(1)[0]
+                stream.seek(size // 2)
+                stream.write(bytes([byte ^ 0xff]))
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertEqual(os.path.getsize(path), size)
+            self.assertEqual(file_hash(path), fingerprint)
+            self.assertIsNone(self.cache.get(path))
+            self.assertIsNotNone(self.cache.get(self.paths[1]))
+
+    def test_persistence(self):
+        self._scan()
+        self.cache.close()
+        self.cache = ScanCache(self.cache.path, full_hash=False)
+        self.addCleanup(self.cache.close)
+        self.assertEqual(self._scan()[1], [])
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self._scan()[1], self.paths)
+
+    def test_file_hash(self):
+        self.assertNotEqual(file_hash(self.paths[0]), file_hash(self.paths[1]))
+        self.assertTrue(file_hash(self.paths[0], full_hash=True).startswith('sha1:'))
+        with mock.patch.object(cache_module, 'FINGERPRINT_BYTES', 1024):
+            self.assertEqual(file_hash(self.paths[0]), file_hash(self.paths[0]))
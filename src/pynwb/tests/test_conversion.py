@@ -0,0 +1,90 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_holostim.conversion import (
+    centers_to_masks,
+    centers_to_pixels,
+    centers_to_plane_index,
+    group_rois_by_plane,
+    masks_to_centers,
+    masks_to_pixels,
+    pixels_to_centers,
+    pixels_to_masks,
+    pixels_to_sparse,
+    sparse_to_pixels,
+)
+from ndx_holostim.masks import encode_sparse_masks
+
+
+class TestRoiConversion(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.mask_shape = (128, 96, 3)
+        self.center_rois = np.column_stack((
+            rng.uniform(20, 76, 50),
+            rng.uniform(20, 76, 50),
+            rng.integers(0, 3, 50),
+            rng.uniform(2, 8, 50),
+        ))
+
+    def test_centers_to_pixels(self):
+        pixels, index = centers_to_pixels([[10, 20, 1, 1]])
+        np.testing.assert_array_equal(index, [5])
+        np.testing.assert_array_equal(pixels, [[9, 20, 1], [10, 19, 1], [10, 20, 1], [10, 21, 1], [11, 20, 1]])
+
+    def test_centers_to_pixels_clipped(self):
+        pixels, index = centers_to_pixels([[0, 0, 0, 1], [5, 5, 4, 1]], mask_shape=self.mask_shape)
+        np.testing.assert_array_equal(index, [3, 3])
+        self.assertTrue((pixels >= 0).all())
+
+    def test_centers_roundtrip(self):
+        masks = centers_to_masks(self.center_rois, self.mask_shape)
+        self.assertEqual(masks.shape, (50,) + self.mask_shape)
+        fitted = masks_to_centers(masks)
+        np.testing.assert_allclose(fitted[:, :2], self.center_rois[:, :2], atol=0.5)
+        np.testing.assert_array_equal(fitted[:, 2], self.center_rois[:, 2])
+        np.testing.assert_allclose(fitted[:, 3], self.center_rois[:, 3], atol=0.6)
+
+    def test_masks_pixels_roundtrip(self):
+        masks = centers_to_masks(self.center_rois, self.mask_shape)
+        pixels, index = masks_to_pixels(masks)
+        self.assertEqual(index[-1], masks.sum())
+        np.testing.assert_array_equal(pixels_to_masks(pixels, index, self.mask_shape), masks)
+
+    def test_empty_roi(self):
+        masks = np.zeros((2, 8, 8, 1), dtype=bool)
+        masks[1, 2:4, 2:4] = True
+        centers = pixels_to_centers(*masks_to_pixels(masks))
+        self.assertTrue(np.isnan(centers[0, :3]).all())
+        self.assertEqual(centers[0, 3], 0)
+        np.testing.assert_array_equal(centers[1, :3], [2.5, 2.5, 0])
+
+    def test_sparse_pixels(self):
+        masks = centers_to_masks(self.center_rois, self.mask_shape)
+        indices, index, mask_shape = encode_sparse_masks(masks)
+        pixels, pixel_index = sparse_to_pixels(indices, index, mask_shape)
+        expected_pixels, expected_index = masks_to_pixels(masks)
+        np.testing.assert_array_equal(pixels, expected_pixels)
+        np.testing.assert_array_equal(pixel_index, expected_index)
+        sparse_indices, sparse_index = pixels_to_sparse(pixels, pixel_index, mask_shape)
+        np.testing.assert_array_equal(sparse_indices, indices)
+        np.testing.assert_array_equal(sparse_index, index)
+
+    def test_group_rois_by_plane(self):
+        plane_rois, plane_rois_index = group_rois_by_plane([3, 0, 1, 0, 2], [1, 2, 1, 0, 2], number_planes=4)
+        np.testing.assert_array_equal(plane_rois, [0, 1, 3, 0, 2])
+        np.testing.assert_array_equal(plane_rois_index, [1, 3, 5, 5])
+        self.assertEqual(plane_rois.dtype, np.uint32)
+        with self.assertRaises(ValueError):
+            group_rois_by_plane([0], [4], number_planes=4)
+
+    def test_centers_to_plane_index(self):
+        plane_rois, plane_rois_index = centers_to_plane_index(self.center_rois)
+        self.assertEqual(len(plane_rois_index), 3)
+        for plane in range(3):
+            start = plane_rois_index[plane - 1] if plane else 0
+            np.testing.assert_array_equal(plane_rois[start:plane_rois_index[plane]],
+                                          np.flatnonzero(self.center_rois[:, 2] == plane))
+        plane_rois, plane_rois_index = centers_to_plane_index(self.center_rois[:, [0, 1, 3]])
+        np.testing.assert_array_equal(plane_rois, np.arange(50))
+        np.testing.assert_array_equal(plane_rois_index, [50])
@@ -0,0 +1,70 @@
+import itertools
+
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_holostim.conversion import centers_to_masks
+from ndx_holostim.excitation import (
+    convolve_masks,
+    estimate_excitation,
+    gaussian_psf,
+    parse_point_spread_function,
+)
+
+
+class TestExcitation(TestCase):
+    def setUp(self):
+        self.psf = gaussian_psf(2.0, 6.0, (0.5, 0.5, 2.0))
+        self.masks = centers_to_masks(np.array([[20, 20, 1, 5], [28, 20, 1, 5], [50, 50, 0, 4]], dtype=float),
+                                      (64, 64, 3))
+
+    def test_parse_point_spread_function(self):
+        np.testing.assert_allclose(parse_point_spread_function('1.2 ± 0.3 µm'), [1.2, 0.3])
+        np.testing.assert_allclose(parse_point_spread_function('1.2um +/- 0.3um'), [1.2, 0.3])
+        np.testing.assert_allclose(parse_point_spread_function('1200 +/- 300 nm'), [1.2, 0.3])
+        np.testing.assert_allclose(parse_point_spread_function('5'), [5, np.nan])
+        self.assertIsNone(parse_point_spread_function('not measured'))
+
+    def test_gaussian_psf(self):
+        self.assertEqual(self.psf.shape, (13, 13, 9))
+        self.assertAlmostEqual(self.psf.sum(), 1.0, places=5)
+        np.testing.assert_array_equal(np.unravel_index(self.psf.argmax(), self.psf.shape), [6, 6, 4])
+
+    def test_convolve_masks(self):
+        excitation = convolve_masks(self.masks[:2], self.psf)
+        self.assertEqual(excitation.shape, (2, 64, 64, 3))
+        self.assertEqual(excitation.dtype, np.float32)
+        # direct convolution of the first mask, zero-padded to keep its shape
+        half = [(k - 1) // 2 for k in self.psf.shape]
+        padded = np.pad(self.masks[0].astype(float), [(h, h) for h in half])
+        expected = np.zeros((64, 64, 3))
+        for i, j, k in itertools.product(*(range(s) for s in self.psf.shape)):
+            expected += self.psf[::-1, ::-1, ::-1][i, j, k] * padded[i:i + 64, j:j + 64, k:k + 3]
+        np.testing.assert_allclose(excitation[0], expected, atol=1e-6)
+        # a single plane with a 2-D PSF
+        self.assertEqual(convolve_masks(self.masks[:2, :, :, 1], self.psf[:, :, 4]).shape, (2, 64, 64))
+
+    def test_estimate_excitation(self):
+        volumes, (rois, values, index) = estimate_excitation([self.masks[:2], self.masks[2:]], self.psf,
+                                                             voxel_volume=0.5)
+        self.assertEqual(volumes.shape, (3,))
+        self.assertTrue((volumes > 0).all())
+        # the two neighboring ROIs excite each other, the distant ROI is isolated
+        np.testing.assert_array_equal(rois, [1, 0])
+        np.testing.assert_array_equal(index, [1, 2, 2])
+        excitation = convolve_masks(self.masks[:1], self.psf)[0]
+        self.assertAlmostEqual(values[0], excitation[self.masks[1]].mean(), places=5)
+        # the batches do not change the result
+        same_volumes, same_crosstalk = estimate_excitation(lambda: iter([self.masks]), self.psf, voxel_volume=0.5)
+        np.testing.assert_array_equal(same_volumes, volumes)
+        np.testing.assert_allclose(same_crosstalk[1], values, rtol=1e-5)
+
+    def test_estimate_excitation_empty_batches(self):
+        volumes, crosstalk = estimate_excitation([self.masks[:2], self.masks[:0], self.masks[2:]], self.psf,
+                                                 voxel_volume=0.5)
+        expected_volumes, expected_crosstalk = estimate_excitation([self.masks], self.psf, voxel_volume=0.5)
+        np.testing.assert_array_equal(volumes, expected_volumes)
+        for result, expected in zip(crosstalk, expected_crosstalk):
+            np.testing.assert_allclose(result, expected, rtol=1e-5)
+        volumes, (rois, values, index) = estimate_excitation([self.masks[:0]], self.psf)
+        self.assertEqual((len(volumes), len(rois), len(values), len(index)), (0, 0, 0, 0))
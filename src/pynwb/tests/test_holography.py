@@ -0,0 +1,62 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_holostim.holography import (
+    compute_phase_masks,
+    focal_plane_intensity,
+    gerchberg_saxton,
+    target_pixels,
+    targets_to_amplitudes,
+)
+
+
+class TestHolography(TestCase):
+    def setUp(self):
+        self.center_rois = np.array([
+            [10.0, 20.0, 0.0, 3.0],
+            [40.0, 50.0, 0.0, 3.0],
+            [30.0, 10.0, 1.0, 3.0],
+            [55.0, 35.0, 1.0, 3.0],
+            [np.nan, np.nan, np.nan, np.nan],
+        ])
+        self.fov_shape = (64, 64)
+        self.slm_shape = (128, 96)
+
+    def test_target_pixels(self):
+        pixels = target_pixels(self.center_rois, self.fov_shape, self.slm_shape)
+        # (x - 32) * 2 wrapped to 128 along x, (y - 32) * 1.5 wrapped to 96 along y
+        np.testing.assert_array_equal(pixels, [[84, 78], [16, 27], [124, 63], [46, 4], [-1, -1]])
+
+    def test_targets_to_amplitudes(self):
+        amplitudes = targets_to_amplitudes(self.center_rois, [0, 1, 2, 3, 4], [2, 5], self.fov_shape, self.slm_shape)
+        self.assertEqual(amplitudes.shape, (2, 128, 96))
+        self.assertEqual(amplitudes.dtype, np.float32)
+        np.testing.assert_array_equal(amplitudes.sum(axis=(1, 2)), [2, 2])
+        self.assertEqual(amplitudes[0, 84, 78], 1)
+        self.assertEqual(amplitudes[1, 46, 4], 1)
+
+    def test_gerchberg_saxton(self):
+        amplitudes = targets_to_amplitudes(self.center_rois, [0, 1, 2, 3], [4], self.fov_shape, self.slm_shape)
+        phase_masks = gerchberg_saxton(amplitudes, iterations=30)
+        self.assertEqual(phase_masks.shape, (1, 128, 96))
+        self.assertTrue(((phase_masks >= 0) & (phase_masks < 2 * np.pi)).all())
+        np.testing.assert_array_equal(gerchberg_saxton(amplitudes[0], iterations=30), phase_masks[0])
+        intensity = focal_plane_intensity(phase_masks)[0]
+        pixels = target_pixels(self.center_rois[:4], self.fov_shape, self.slm_shape)
+        spots = intensity[pixels[:, 0], pixels[:, 1]]
+        # most of the light reaches the targets, evenly
+        self.assertGreater(spots.sum(), 0.7)
+        self.assertLess(spots.max() / spots.min(), 1.2)
+
+    def test_compute_phase_masks_batches(self):
+        rois, index = [0, 1, 2, 3, 1, 3, 4], [2, 4, 6, 7]
+        phase_masks = compute_phase_masks(self.center_rois, rois, index, self.fov_shape, self.slm_shape,
+                                          iterations=10, batch_size=3)
+        self.assertEqual(phase_masks.shape, (4, 128, 96))
+        # the phase mask of a hologram does not depend on its batch
+        single = compute_phase_masks(self.center_rois, [1, 3], [2], self.fov_shape, self.slm_shape, iterations=10)
+        np.testing.assert_allclose(single[0], phase_masks[2], atol=1e-4)
+        # without targets, the phase is uniform
+        np.testing.assert_array_equal(phase_masks[3], 0)
+        with self.assertRaises(IndexError):
+            compute_phase_masks(self.center_rois, [5], [1], self.fov_shape, self.slm_shape)
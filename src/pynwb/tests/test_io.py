@@ -0,0 +1,49 @@
+import numpy as np
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb.testing import TestCase
+
+from ndx_holostim.io import DEFAULT_ROI_DATAIO, roi_chunk_shape, set_default_roi_dataio, wrap_roi_data
+
+
+class TestRoiChunkShape(TestCase):
+    def test_one_mask_per_chunk(self):
+        self.assertEqual(roi_chunk_shape((100, 512, 512, 1), 1), (1, 512, 512, 1))
+
+    def test_large_mask_is_split(self):
+        chunks = roi_chunk_shape((10, 1024, 1024, 8), 1)
+        self.assertEqual(chunks[0], 1)
+        self.assertLessEqual(np.prod(chunks), DEFAULT_ROI_DATAIO['chunk_bytes'])
+
+    def test_small_rows_are_grouped(self):
+        self.assertEqual(roi_chunk_shape((10, 4), 8), (10, 4))
+        self.assertEqual(roi_chunk_shape((100000, 4), 8), (2048, 4))
+
+
+class TestWrapRoiData(TestCase):
+    def test_wrap(self):
+        wrapped = wrap_roi_data(np.zeros((5, 256, 256, 1), dtype=bool))
+        self.assertIsInstance(wrapped, H5DataIO)
+        self.assertEqual(wrapped.io_settings['chunks'], (1, 256, 256, 1))
+        self.assertEqual(wrapped.io_settings['compression'], 'gzip')
+
+    def test_override(self):
+        wrapped = wrap_roi_data(np.zeros((5, 4)), compression=False)
+        self.assertNotIn('compression', wrapped.io_settings)
+
+    def test_no_wrap(self):
+        dataio = H5DataIO(np.zeros((5, 4)))
+        self.assertIs(wrap_roi_data(dataio), dataio)
+        self.assertIsNone(wrap_roi_data(None))
+        self.assertNotIsInstance(wrap_roi_data(np.zeros((0, 4))), H5DataIO)
+
+    def test_set_default(self):
+        previous = dict(DEFAULT_ROI_DATAIO)
+        try:
+            set_default_roi_dataio(compression_opts=9)
+            self.assertEqual(wrap_roi_data(np.zeros((5, 4))).io_settings['compression_opts'], 9)
+        finally:
+            set_default_roi_dataio(**previous)
+
+    def test_unknown_setting(self):
+        with self.assertRaises(ValueError):
+            set_default_roi_dataio(level=9)
@@ -0,0 +1,131 @@
+from unittest import mock
+
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_holostim.masks import (
+    PackedMaskArray,
+    decode_sparse_masks,
+    downsample_masks,
+    encode_sparse_masks,
+    pack_masks,
+    unpack_masks,
+)
+
+
+class TestSparseMasks(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.masks = rng.random((6, 32, 24, 2)) > 0.9
+        self.masks[3] = False  # empty ROI
+
+    def test_encode(self):
+        indices, index, mask_shape = encode_sparse_masks(self.masks)
+        self.assertEqual(indices.dtype, np.uint32)
+        self.assertEqual(index.dtype, np.uint32)
+        np.testing.assert_array_equal(mask_shape, [32, 24, 2])
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index[-1], self.masks.sum())
+        self.assertEqual(index[3], index[2])
+
+    def test_encode_2d(self):
+        _, _, mask_shape = encode_sparse_masks(self.masks[..., 0])
+        np.testing.assert_array_equal(mask_shape, [32, 24, 1])
+
+    def test_encode_no_rois(self):
+        indices, index, mask_shape = encode_sparse_masks(self.masks[:0])
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.dtype, np.uint32)
+        np.testing.assert_array_equal(mask_shape, [32, 24, 2])
+        self.assertEqual(decode_sparse_masks(indices, index, mask_shape).shape, (0, 32, 24, 2))
+
+    def test_encode_too_many_pixels(self):
+        # the limit is lowered to the size of one mask, as 2**32 pixels do not fit in memory
+        with mock.patch('ndx_holostim.masks._MAX_INDEX', 32 * 24 * 2):
+            encode_sparse_masks(self.masks)
+            with self.assertRaisesWith(ValueError, "masks with 9216 pixels in total are too many for the uint32 "
+                                                   "offsets of the sparse encoding"):
+                encode_sparse_masks(np.ones((6, 32, 24, 2), dtype=bool))
+
+    def test_roundtrip(self):
+        decoded = decode_sparse_masks(*encode_sparse_masks(self.masks))
+        np.testing.assert_array_equal(decoded, self.masks)
+
+    def test_decode_selected_rois(self):
+        decoded = decode_sparse_masks(*encode_sparse_masks(self.masks), rois=[4, 0, 3])
+        np.testing.assert_array_equal(decoded, self.masks[[4, 0, 3]])
+
+    def test_decode_from_sequence(self):
+        # datasets are read one hyperslab per ROI
+        indices, index, mask_shape = encode_sparse_masks(self.masks)
+        decoded = decode_sparse_masks(indices.tolist(), index, mask_shape, rois=[1, 2])
+        np.testing.assert_array_equal(decoded, self.masks[[1, 2]])
+
+    def test_bad_shape(self):
+        with self.assertRaises(ValueError):
+            encode_sparse_masks(np.ones((2, 3)))
+
+
+class TestPackedMasks(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # x is not a multiple of 8, so the last byte of each row is padded
+        self.masks = rng.random((5, 13, 6, 2)) > 0.5
+
+    def test_pack(self):
+        packed, mask_shape = pack_masks(self.masks)
+        self.assertEqual(packed.dtype, np.uint8)
+        self.assertEqual(packed.shape, (5, 2, 6, 2))
+        np.testing.assert_array_equal(mask_shape, [13, 6, 2])
+
+    def test_pack_2d(self):
+        packed, mask_shape = pack_masks(self.masks[..., 0].astype(float))
+        self.assertEqual(packed.shape, (5, 2, 6, 1))
+        np.testing.assert_array_equal(mask_shape, [13, 6, 1])
+
+    def test_roundtrip(self):
+        unpacked = unpack_masks(*pack_masks(self.masks))
+        self.assertEqual(unpacked.dtype, bool)
+        np.testing.assert_array_equal(unpacked, self.masks)
+
+    def test_array(self):
+        masks = PackedMaskArray(*pack_masks(self.masks))
+        self.assertEqual(masks.shape, self.masks.shape)
+        self.assertEqual(len(masks), 5)
+        np.testing.assert_array_equal(masks[-1], self.masks[-1])
+        np.testing.assert_array_equal(masks[1:4, 3:, 2], self.masks[1:4, 3:, 2])
+        np.testing.assert_array_equal(masks[[4, 0, 4]], self.masks[[4, 0, 4]])
+        np.testing.assert_array_equal(masks[..., 1], self.masks[..., 1])
+        np.testing.assert_array_equal(np.asarray(masks), self.masks)
+        with self.assertRaises(IndexError):
+            masks[5]
+
+    def test_array_from_sequence(self):
+        packed, mask_shape = pack_masks(self.masks)
+        masks = PackedMaskArray(list(packed), mask_shape)
+        np.testing.assert_array_equal(masks[[3, 1, 3]], self.masks[[3, 1, 3]])
+
+    def test_bad_shape(self):
+        with self.assertRaises(ValueError):
+            pack_masks(np.ones((2, 3)))
+
+
+class TestDownsampleMasks(TestCase):
+    def test_max_pool(self):
+        masks = np.zeros((2, 5, 4, 1), dtype=bool)
+        masks[0, 4, 3] = True
+        masks[1, 0, 0] = True
+        downsampled = downsample_masks(masks, 2)
+        self.assertEqual(downsampled.shape, (2, 3, 2, 1))
+        np.testing.assert_array_equal(np.argwhere(downsampled), [[0, 2, 1, 0], [1, 0, 0, 0]])
+
+    def test_labels(self):
+        labels = np.array([[-1, 3, -1], [2, -1, -1], [-1, -1, -1]], dtype=np.int32)
+        np.testing.assert_array_equal(downsample_masks(labels, 2, axes=(0, 1)), [[3, -1], [-1, -1]])
+
+    def test_factor_one(self):
+        masks = np.ones((1, 3, 3), dtype=bool)
+        self.assertIs(downsample_masks(masks, 1), masks)
+        with self.assertRaises(ValueError):
+            downsample_masks(masks, 0)
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from pynwb import get_class, get_type_map
+from pynwb.testing import TestCase
+
+from ndx_holostim.namespace import CachedSpecReader
+
+# maximum time, in seconds, to import ndx_holostim after pynwb. Wall-clock timings depend on the machine, so the
+# import time test only runs when a budget is set; the asv benchmarks in benchmarks/ track it otherwise.
+IMPORT_BUDGET = os.environ.get('NDX_HOLOSTIM_IMPORT_BUDGET')
+
+
+class TestCachedSpecReader(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.spec_dir = os.path.join(self.tmp_dir.name, 'spec')
+        self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+        os.makedirs(self.spec_dir)
+        self.spec_path = os.path.join(self.spec_dir, 'test.extensions.yaml')
+        with open(self.spec_path, 'w') as stream:
+            stream.write("groups:\n- neurodata_type_def: TestType\n  doc: test type\n")
+
+    def test_cache(self):
+        specs = CachedSpecReader(indir=self.spec_dir, cache_dir=self.cache_dir).read_spec('test.extensions.yaml')
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        with mock.patch('hdmf.spec.namespace.yaml.YAML', side_effect=AssertionError("YAML was parsed")):
+            cached = CachedSpecReader(indir=self.spec_dir, cache_dir=self.cache_dir).read_spec('test.extensions.yaml')
+        self.assertEqual(cached, specs)
+
+    def test_modified_spec(self):
+        CachedSpecReader(indir=self.spec_dir, cache_dir=self.cache_dir).read_spec('test.extensions.yaml')
+        with open(self.spec_path, 'a') as stream:
+            stream.write("- neurodata_type_def: OtherType\n  doc: other type\n")
+        specs = CachedSpecReader(indir=self.spec_dir, cache_dir=self.cache_dir).read_spec('test.extensions.yaml')
+        self.assertEqual(len(specs['groups']), 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_disabled(self):
+        CachedSpecReader(indir=self.spec_dir, cache_dir=None).read_spec('test.extensions.yaml')
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_unwritable(self):
+        # a cache directory below a regular file cannot be created, even by root
+        cache_dir = os.path.join(self.spec_path, 'cache')
+        reader = CachedSpecReader(indir=self.spec_dir, cache_dir=cache_dir)
+        specs = reader.read_spec('test.extensions.yaml')
+        self.assertEqual(specs, CachedSpecReader(indir=self.spec_dir).read_spec('test.extensions.yaml'))
+        self.assertIsNone(reader.cache_dir)
+
+    def test_failed_write(self):
+        reader = CachedSpecReader(indir=self.spec_dir, cache_dir=self.cache_dir)
+        with mock.patch('os.replace', side_effect=PermissionError("read-only")):
+            specs = reader.read_spec('test.extensions.yaml')
+        self.assertEqual(len(specs['groups']), 1)
+        # the partial cache file is removed
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class TestImport(TestCase):
+    def test_module_attributes(self):
+        import ndx_holostim
+
+        self.assertIn('SpiralScanning', dir(ndx_holostim))
+        self.assertEqual(ndx_holostim.SpiralScanning.__name__, 'SpiralScanning')
+        with self.assertRaises(AttributeError):
+            ndx_holostim.NotAType
+
+    def test_import_unwritable_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            not_a_dir = os.path.join(tmp_dir, 'file')
+            open(not_a_dir, 'w').close()
+            env = dict(os.environ, NDX_HOLOSTIM_CACHE_DIR=os.path.join(not_a_dir, 'cache'))
+            code = "import ndx_holostim; print(ndx_holostim.SpiralScanning.__name__)"
+            output = subprocess.check_output([sys.executable, '-c', code], env=env)
+            self.assertEqual(output.decode().strip(), 'SpiralScanning')
+            self.assertEqual(os.listdir(tmp_dir), ['file'])
+
+    def test_all(self):
+        import ndx_holostim
+
+        spec_types = get_type_map().namespace_catalog.get_types('ndx-holostim.extensions.yaml')
+        self.assertEqual(ndx_holostim.__all__, list(spec_types))
+        for name in ndx_holostim.__all__:
+            self.assertIs(get_class(name, 'ndx-holostim'), getattr(ndx_holostim, name))
+
+    @unittest.skipIf(IMPORT_BUDGET is None, "set NDX_HOLOSTIM_IMPORT_BUDGET to check the import time")
+    def test_import_time(self):
+        code = ("import time, pynwb; start = time.perf_counter(); import ndx_holostim; "
+                "print(time.perf_counter() - start)")
+        timings = [float(subprocess.check_output([sys.executable, '-c', code])) for _ in range(3)]
+        self.assertLess(min(timings), float(IMPORT_BUDGET))
@@ -0,0 +1,137 @@
+import os
+import tempfile
+
+import numpy as np
+from datetime import datetime
+from pynwb import NWBHDF5IO, NWBFile
+from pynwb.testing import TestCase
+
+from ndx_holostim import PatternedOptogeneticSeries, PatternedOptogeneticStimulusSite, LightSource
+from ndx_holostim import SpatialLightModulator, SpiralScanning, TemporalFocusing
+from ndx_holostim.scan import scan_file, scan_files
+
+
+def _write_session(path, number, number_rois):
+    nwbfile = NWBFile(
+        session_description='scan test %d' % number,
+        identifier='SCAN%d' % number,
+        session_start_time=datetime.now().astimezone(),
+    )
+    device = nwbfile.create_device(name='device1')
+    light_source = LightSource(
+        name='light_source',
+        stimulation_wavelength=1035.0 + number,
+        filter_description='none',
+        peak_power=70e-3,
+    )
+    nwbfile.add_device(light_source)
+    spatial_light_modulator = SpatialLightModulator(name='slm', model_name='Hamamatsu X13138', resolution=0.65)
+    nwbfile.add_device(spatial_light_modulator)
+    site = PatternedOptogeneticStimulusSite(
+        name='site', device=device, description='test site', excitation_lambda=1035.0, location='V1')
+    nwbfile.add_ogen_site(site)
+    spiral = SpiralScanning(
+        name='spiral',
+        description='spiral scanning',
+        duration=0.01 * (number + 1),
+        number_of_stimulus_presentation=5,
+        inter_stimulus_interval=0.02,
+        diameter=15e-6,
+        height=10e-6,
+        number_of_revolutions=5,
+    )
+    nwbfile.add_lab_meta_data(spiral)
+    focusing = TemporalFocusing(
+        name='temporal_focusing',
+        description='temporal focusing',
+        duration=0.02,
+        number_of_stimulus_presentation=1,
+        inter_stimulus_interval=0.0,
+        lateral_point_spread_function='9 um +/- 0.7 um',
+        axial_point_spread_function='32 um +/- 1.6 um',
+    )
+    nwbfile.add_lab_meta_data(focusing)
+    center_rois = np.column_stack((np.arange(number_rois), np.full(number_rois, number), np.zeros(number_rois),
+                                   np.full(number_rois, 5.0)))
+    nwbfile.add_acquisition(PatternedOptogeneticSeries(
+        name='photostim',
+        site=site,
+        device=device,
+        light_source=light_source,
+        spatial_light_modulator=spatial_light_modulator,
+        stimulus_pattern=spiral,
+        description='series %d' % number,
+        center_rois=center_rois,
+    ))
+    with NWBHDF5IO(path, mode='w') as io:
+        io.write(nwbfile)
+    return center_rois
+
+
+class TestScan(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.paths = [os.path.join(self.directory.name, 'session%d.nwb' % number) for number in range(3)]
+        self.centers = [_write_session(path, number, number + 2) for number, path in enumerate(self.paths)]
+
+    def test_scan_file(self):
+        rows = scan_file(self.paths[1])
+        self.assertEqual(len(rows['series']), 1)
+        series = rows['series'][0]
+        self.assertEqual(series['path'], '/acquisition/photostim')
+        self.assertEqual(series['description'], 'series 1')
+        self.assertEqual(series['light_source'], '/general/devices/light_source')
+        self.assertEqual(series['stimulus_pattern'], '/general/spiral')
+        self.assertEqual(series['number_rois'], 3)
+        self.assertEqual(sorted(row['neurodata_type'] for row in rows['patterns']),
+                         ['SpiralScanning', 'TemporalFocusing'])
+        self.assertEqual(sorted(row['neurodata_type'] for row in rows['devices']),
+                         ['LightSource', 'SpatialLightModulator'])
+        np.testing.assert_array_equal(rows['rois'][0][1], self.centers[1])
+
+    def _check_result(self, result):
+        self.assertEqual(result.files, self.paths)
+        self.assertEqual(result.errors, {})
+        series = result['series']
+        self.assertEqual(list(series['file']), self.paths)
+        np.testing.assert_array_equal(series['number_rois'], [2, 3, 4])
+        patterns = result['patterns']
+        spirals = patterns['neurodata_type'] == 'SpiralScanning'
+        np.testing.assert_allclose(patterns['duration'][spirals], [0.01, 0.02, 0.03])
+        # fields of other pattern types are missing for spirals
+        self.assertTrue(np.isnan(patterns['diameter'][~spirals]).all())
+        self.assertEqual(set(patterns['lateral_point_spread_function'][~spirals]), {'9 um +/- 0.7 um'})
+        devices = result['devices']
+        light_sources = devices['neurodata_type'] == 'LightSource'
+        np.testing.assert_array_equal(devices['stimulation_wavelength'][light_sources], [1035.0, 1036.0, 1037.0])
+        rois = result['rois']
+        self.assertEqual(len(rois['x']), 9)
+        np.testing.assert_array_equal(rois['roi'], [0, 1, 0, 1, 2, 0, 1, 2, 3])
+        np.testing.assert_array_equal(rois['y'], [0, 0, 1, 1, 1, 2, 2, 2, 2])
+        self.assertEqual(set(rois['series']), {'/acquisition/photostim'})
+
+    def test_scan_files_serial(self):
+        self._check_result(scan_files(self.paths, max_workers=1))
+
+    def test_scan_files_parallel(self):
+        self._check_result(scan_files(self.paths, max_workers=2, chunksize=1))
+
+    def test_scan_errors(self):
+        missing = os.path.join(self.directory.name, 'missing.nwb')
+        with self.assertRaises(OSError):
+            scan_files(self.paths + [missing], max_workers=1)
+        result = scan_files(self.paths + [missing], max_workers=1, skip_errors=True)
+        self.assertEqual(list(result.errors), [missing])
+        self.assertEqual(len(result['series']['file']), 3)
+
+    def test_to_arrow(self):
+        result = scan_files(self.paths, max_workers=1)
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            with self.assertRaises(ImportError):
+                result.to_arrow('series')
+        else:
+            table = result.to_arrow('rois')
+            self.assertEqual(table.num_rows, 9)
@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_holostim.spatial import RoiSpatialIndex, _has_scipy
+
+
+class TestRoiSpatialIndex(TestCase):
+    use_scipy = False
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.center_rois = np.column_stack((
+            rng.uniform(0, 512, 3000),
+            rng.uniform(0, 512, 3000),
+            rng.integers(0, 3, 3000),
+            rng.uniform(2, 8, 3000),
+        ))
+        self.center_rois[7, :3] = np.nan  # empty ROI
+        self.scale = (0.8, 0.8, 20.0)
+        self.index = RoiSpatialIndex(self.center_rois, scale=self.scale, use_scipy=self.use_scipy)
+        self.points = np.concatenate((np.column_stack((rng.uniform(0, 410, (50, 2)), rng.integers(0, 3, 50) * 20.0)),
+                                      [self.center_rois[0, :3]]))
+        self.distances = np.sqrt(((self.points[:, np.newaxis] - self.center_rois[:, :3] * self.scale) ** 2).sum(-1))
+        self.distances[:, 7] = np.inf
+
+    def test_nearest(self):
+        distances, rois = self.index.nearest(self.points / self.scale, k=5)
+        expected = np.argsort(self.distances, axis=1, kind='stable')[:, :5]
+        np.testing.assert_array_equal(rois, expected)
+        np.testing.assert_allclose(distances, np.take_along_axis(self.distances, expected, axis=1))
+
+    def test_nearest_missing(self):
+        distances, rois = RoiSpatialIndex(self.center_rois[:2], use_scipy=self.use_scipy).nearest([[0, 0, 0]], k=3)
+        self.assertEqual(rois[0, 2], -1)
+        self.assertEqual(distances[0, 2], np.inf)
+
+    def test_nearest_far_points(self):
+        points = np.array([[-5000, 100, 0], [100, 9000, 40], [1e6, -1e6, -1e3]])
+        distances, rois = self.index.nearest(points, k=3)
+        scaled = np.sqrt(((points[:, np.newaxis] * self.scale - self.center_rois[:, :3] * self.scale) ** 2).sum(-1))
+        scaled[:, 7] = np.inf
+        expected = np.argsort(scaled, axis=1, kind='stable')[:, :3]
+        np.testing.assert_array_equal(rois, expected)
+        np.testing.assert_allclose(distances, np.take_along_axis(scaled, expected, axis=1))
+
+    def test_same_centers(self):
+        index = RoiSpatialIndex(np.tile([[3.0, 4.0, 0.0, 1.0]], (6, 1)), use_scipy=self.use_scipy)
+        distances, rois = index.nearest([[0, 0, 0], [3, 4, 0]], k=2)
+        # all centers are tied, so any two distinct ROIs are nearest
+        self.assertTrue(all(len(set(row)) == 2 for row in rois.tolist()))
+        self.assertTrue(((rois >= 0) & (rois < 6)).all())
+        np.testing.assert_allclose(distances, [[5, 5], [0, 0]])
+        rois, index_ = index.within_radius([[0, 0], [3, 4]], 4.0)
+        np.testing.assert_array_equal(rois, np.arange(6))
+        np.testing.assert_array_equal(index_, [0, 6])
+
+    def test_empty(self):
+        index = RoiSpatialIndex(np.zeros((0, 4)), use_scipy=self.use_scipy)
+        distances, rois = index.nearest([[0, 0, 0]], k=2)
+        np.testing.assert_array_equal(rois, [[-1, -1]])
+        rois, index_ = index.within_box([[0, 0, 0]], [[10, 10, 10]])
+        self.assertEqual(len(rois), 0)
+        np.testing.assert_array_equal(index_, [0])
+
+    def test_within_radius(self):
+        rois, index = self.index.within_radius(self.points / self.scale, 20.0)
+        expected = [np.flatnonzero(row <= 20.0) for row in self.distances]
+        np.testing.assert_array_equal(index, np.cumsum([len(e) for e in expected]))
+        np.testing.assert_array_equal(rois, np.concatenate(expected))
+
+    def test_within_radius_roi_radius(self):
+        rois, index = self.index.within_radius(self.points / self.scale, 5.0, include_roi_radius=True)
+        limit = 5.0 + self.center_rois[:, 3] * self.scale[0]
+        expected = [np.flatnonzero(row <= limit) for row in self.distances]
+        np.testing.assert_array_equal(rois, np.concatenate(expected))
+
+    def test_within_box(self):
+        lower = np.array([[0, 0, 0], [100, 200, 1], [400, 400, 2]])
+        upper = np.array([[50, 80, 2], [300, 220, 1], [600, 600, 2]])
+        rois, index = self.index.within_box(lower, upper)
+        inside = [np.flatnonzero(((self.center_rois[:, :3] >= low) & (self.center_rois[:, :3] <= high)).all(1))
+                  for low, high in zip(lower, upper)]
+        np.testing.assert_array_equal(index, np.cumsum([len(e) for e in inside]))
+        np.testing.assert_array_equal(rois, np.concatenate(inside))
+
+
+@unittest.skipUnless(_has_scipy(), "scipy is not installed")
+class TestRoiSpatialIndexScipy(TestRoiSpatialIndex):
+    use_scipy = True
@@ -0,0 +1,87 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_holostim.conversion import pixels_to_masks
+from ndx_holostim.spiral import dwell_maps, spiral_illumination, spiral_kernel, spiral_trajectories, spiral_trajectory
+
+
+class TestSpiral(TestCase):
+    def setUp(self):
+        self.center_rois = np.array([
+            [10.2, 20.7, 0.0, 3.0],
+            [40.0, 50.0, 1.0, 5.0],
+            [np.nan, np.nan, np.nan, np.nan],
+            [62.0, 5.0, 1.0, 3.0],
+        ])
+
+    def test_spiral_trajectory(self):
+        trajectory = spiral_trajectory(8.0, 2.0, 3, 301)
+        self.assertEqual(trajectory.shape, (301, 3))
+        self.assertFalse(trajectory.flags.writeable)
+        np.testing.assert_allclose(trajectory[0], [0, 0, -1], atol=1e-12)
+        np.testing.assert_allclose(trajectory[-1], [4, 0, 1], atol=1e-12)
+        np.testing.assert_allclose(np.hypot(trajectory[:, 0], trajectory[:, 1]), np.linspace(0, 4, 301))
+        # identical spirals are computed once
+        self.assertIs(spiral_trajectory(8.0, 2.0, 3, 301), trajectory)
+
+    def test_spiral_trajectories(self):
+        trajectories = spiral_trajectories(self.center_rois, 3, height=2.0, number_of_samples=301)
+        self.assertEqual(trajectories.shape, (4, 301, 3))
+        np.testing.assert_allclose(trajectories[1], self.center_rois[1, :3] + spiral_trajectory(10.0, 2.0, 3, 301))
+        np.testing.assert_allclose(trajectories[3], self.center_rois[3, :3] + spiral_trajectory(6.0, 2.0, 3, 301))
+        self.assertTrue(np.isnan(trajectories[2]).all())
+
+    def test_spiral_kernel(self):
+        offsets, dwell = spiral_kernel(8.0, 3, 0.01, 300)
+        self.assertAlmostEqual(dwell.sum(), 0.01)
+        self.assertTrue((dwell > 0).all())
+        self.assertLessEqual(np.abs(offsets).max(), 4)
+        wide_offsets, wide_dwell = spiral_kernel(8.0, 3, 0.01, 300, beam_radius=1.5)
+        self.assertGreater(len(wide_offsets), len(offsets))
+        self.assertAlmostEqual(wide_dwell.sum(), 0.01)
+        # the pixels visited by the beam keep their dwell time
+        visited = wide_dwell > 0
+        np.testing.assert_array_equal(wide_offsets[visited], offsets)
+        np.testing.assert_allclose(wide_dwell[visited], dwell)
+
+    def test_spiral_illumination(self):
+        mask_shape = (64, 64, 2)
+        pixels, dwell, index = spiral_illumination(self.center_rois, 3, 0.01, diameter=8.0, number_of_samples=300,
+                                                   mask_shape=mask_shape)
+        offsets, times = spiral_kernel(8.0, 3, 0.01, 300)
+        self.assertEqual(index[0], len(offsets))
+        np.testing.assert_array_equal(pixels[:index[0], :2], offsets + [10, 21])
+        np.testing.assert_array_equal(pixels[:index[0], 2], 0)
+        np.testing.assert_allclose(dwell[:index[0]], times)
+        # no pixels for the ROI without a center, and the pixels outside of the field of view are dropped
+        self.assertEqual(index[2], index[1])
+        self.assertLess(index[3] - index[2], len(offsets))
+        maps = dwell_maps(pixels, dwell, index, mask_shape)
+        np.testing.assert_allclose(maps.sum(axis=(1, 2, 3)), [0.01, 0.01, 0, dwell[index[2]:].sum()], rtol=1e-6)
+        np.testing.assert_array_equal(pixels_to_masks(pixels, index, mask_shape), maps > 0)
+
+    def test_spiral_illumination_roi_diameters(self):
+        pixels, dwell, index = spiral_illumination(self.center_rois, 3, 0.01, number_of_samples=300)
+        for roi, center in ((0, [10, 21]), (1, [40, 50]), (3, [62, 5])):
+            offsets, times = spiral_kernel(2 * self.center_rois[roi, 3], 3, 0.01, 300)
+            start = index[roi - 1] if roi else 0
+            np.testing.assert_array_equal(pixels[start:index[roi], :2], offsets + center)
+            np.testing.assert_allclose(dwell[start:index[roi]], times)
+
+    def test_spiral_illumination_diameter_step(self):
+        rng = np.random.default_rng(0)
+        center_rois = np.column_stack((rng.uniform(10, 90, (500, 2)), np.zeros(500), rng.uniform(2, 8, 500)))
+        spiral_kernel.cache_clear()
+        pixels, dwell, index = spiral_illumination(center_rois, 3, 0.01, number_of_samples=300)
+        # radii between 2 and 8 give 13 kernels of diameters 4 to 16 pixels
+        self.assertEqual(spiral_kernel.cache_info().misses, 13)
+        offsets, times = spiral_kernel(np.rint(2 * center_rois[0, 3]), 3, 0.01, 300)
+        np.testing.assert_array_equal(pixels[:index[0], :2], offsets + np.rint(center_rois[0, :2]))
+        np.testing.assert_allclose(dwell[:index[0]], times)
+        # half-pixel steps add the 12 odd diameters, or exact diameters
+        misses = spiral_kernel.cache_info().misses
+        spiral_illumination(center_rois, 3, 0.01, number_of_samples=300, diameter_step=0.5)
+        self.assertEqual(spiral_kernel.cache_info().misses, misses + 12)
+        exact = spiral_illumination(center_rois[:1], 3, 0.01, number_of_samples=300, diameter_step=0)
+        offsets, times = spiral_kernel(2 * center_rois[0, 3], 3, 0.01, 300)
+        np.testing.assert_array_equal(exact[0][:, :2], offsets + np.rint(center_rois[0, :2]))
@@ -0,0 +1,145 @@
+from unittest import mock
+
+import numpy as np
+from pynwb.device import Device
+from pynwb.testing import TestCase
+
+from ndx_holostim import PatternedOptogeneticSeries, PatternedOptogeneticStimulusSite, LightSource
+from ndx_holostim import OptogeneticStimulusPattern, SpatialLightModulator
+from ndx_holostim.conversion import centers_to_masks
+from ndx_holostim.masks import downsample_masks, encode_sparse_masks, pack_masks
+from ndx_holostim.tiles import RoiTileRenderer
+
+
+def _labels(masks, plane):
+    """Label image of the ROIs of a plane, where later ROIs cover earlier ones."""
+    labels = np.full(masks.shape[1:3], -1, dtype=np.int32)
+    for roi, mask in enumerate(masks[..., plane]):
+        labels[mask] = roi
+    return labels
+
+
+class TestRoiTileRenderer(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.mask_shape = (70, 50, 2)
+        self.center_rois = np.column_stack((
+            rng.uniform(5, 65, 40),
+            rng.uniform(5, 45, 40),
+            rng.integers(0, 2, 40),
+            rng.uniform(1, 5, 40),
+        ))
+        self.masks = centers_to_masks(self.center_rois, self.mask_shape)
+        device = Device(name='device')
+        self.links = dict(
+            site=PatternedOptogeneticStimulusSite(
+                name='site', device=device, description='site', excitation_lambda=1035.0, location='V1'
+            ),
+            device=device,
+            light_source=LightSource(
+                name='light_source', stimulation_wavelength=1035.0, filter_description='none', peak_power=0.7
+            ),
+            spatial_light_modulator=SpatialLightModulator(name='slm', model_name='slm', resolution=0.65),
+            stimulus_pattern=OptogeneticStimulusPattern(
+                name='pattern',
+                description='pattern',
+                duration=0.01,
+                number_of_stimulus_presentation=1,
+                inter_stimulus_interval=0.1,
+            ),
+        )
+
+    def _series(self, **kwargs):
+        return PatternedOptogeneticSeries(name='photostim_series', roi_dataio=False, **self.links, **kwargs)
+
+    def test_render(self):
+        renderer = RoiTileRenderer(self._series(image_mask_roi=self.masks), tile_size=16)
+        self.assertEqual(renderer.field_of_view, self.mask_shape)
+        for plane in range(2):
+            expected = _labels(self.masks, plane)
+            labels, level, origin = renderer.render(plane, level=1)
+            self.assertEqual((level, origin), (1, (0, 0)))
+            np.testing.assert_array_equal(labels, expected)
+            labels, level, _ = renderer.render(plane, level=4)
+            np.testing.assert_array_equal(labels, downsample_masks(expected, 4, axes=(0, 1)))
+
+    def test_render_window(self):
+        renderer = RoiTileRenderer(self._series(image_mask_roi=self.masks), tile_size=16)
+        expected = _labels(self.masks, 1)
+        labels, level, origin = renderer.render(1, x_range=(13, 40), y_range=(30, 100), level=2)
+        self.assertEqual(origin, (12, 30))
+        np.testing.assert_array_equal(labels, downsample_masks(expected[12:40, 30:], 2, axes=(0, 1)))
+        self.assertEqual(renderer.choose_level((0, 70), (0, 50), max_size=20), 4)
+        self.assertEqual(renderer.choose_level((0, 70), (0, 50), max_size=5), 8)
+
+    def test_visible_rois(self):
+        renderer = RoiTileRenderer(self._series(image_mask_roi=self.masks))
+        rois = renderer.visible_rois(0, (0, 20), (0, 20))
+        in_window = self.masks[:, :20, :20, 0].any(axis=(1, 2))
+        np.testing.assert_array_equal(rois[in_window[rois]], np.flatnonzero(in_window))
+        self.assertTrue((self.masks[rois, ..., 0].any(axis=(1, 2))).all())
+
+    def test_sparse_masks(self):
+        indices, index, mask_shape = encode_sparse_masks(self.masks)
+        series = self._series(image_mask_roi_indices=indices, image_mask_roi_index=index, image_mask_shape=mask_shape)
+        labels, _, _ = RoiTileRenderer(series, tile_size=32).render(0, level=1)
+        np.testing.assert_array_equal(labels, _labels(self.masks, 0))
+
+    def test_packed_masks(self):
+        packed, mask_shape = pack_masks(self.masks)
+        series = self._series(image_mask_roi_packed=packed, image_mask_shape=mask_shape)
+        labels, _, _ = RoiTileRenderer(series, tile_size=16).render(1, x_range=(13, 61), level=1)
+        np.testing.assert_array_equal(labels, _labels(self.masks, 1)[13:61])
+
+    def test_masks_read_once(self):
+        series = self._series(image_mask_roi=self.masks)
+        renderer = RoiTileRenderer(series, tile_size=16)
+        with mock.patch.object(PatternedOptogeneticSeries, 'iter_rois', autospec=True,
+                               side_effect=PatternedOptogeneticSeries.iter_rois) as iter_rois, \
+                mock.patch.object(PatternedOptogeneticSeries, 'compute_plane_index') as compute_plane_index:
+            for plane in range(2):
+                np.testing.assert_array_equal(renderer.render(plane, level=1)[0], _labels(self.masks, plane))
+        # the bounding boxes are computed in one pass over the masks, which also gives the planes of the ROIs
+        self.assertEqual(iter_rois.call_count, 1)
+        compute_plane_index.assert_not_called()
+
+    def test_boxes_from_centers(self):
+        series = self._series(image_mask_roi=self.masks, center_rois=self.center_rois)
+        renderer = RoiTileRenderer(series, tile_size=16)
+        with mock.patch.object(PatternedOptogeneticSeries, 'iter_rois') as iter_rois, \
+                mock.patch.object(PatternedOptogeneticSeries, 'compute_plane_index') as compute_plane_index:
+            for plane in range(2):
+                np.testing.assert_array_equal(renderer.render(plane, level=1)[0], _labels(self.masks, plane))
+        iter_rois.assert_not_called()
+        compute_plane_index.assert_not_called()
+        # masks may extend beyond the plane of their center, so boxes from centers span all planes
+        np.testing.assert_array_equal(renderer.roi_boxes()[:, 2], np.tile([0, 2], (40, 1)))
+
+    def test_centers(self):
+        renderer = RoiTileRenderer(self._series(center_rois=self.center_rois), tile_size=32)
+        labels, _, _ = renderer.render(1, x_range=(0, 70), y_range=(0, 50), level=1)
+        np.testing.assert_array_equal(labels, _labels(self.masks, 1)[:labels.shape[0], :labels.shape[1]])
+
+    def test_mask_pyramid(self):
+        series = self._series(image_mask_roi=self.masks)
+        series.create_mask_pyramid(roi_dataio=False)
+        renderer = RoiTileRenderer(series, tile_size=16)
+        plain = RoiTileRenderer(self._series(image_mask_roi=self.masks), tile_size=16)
+        for level in (2, 4, 8):
+            np.testing.assert_array_equal(renderer.render(1, level=level)[0], plain.render(1, level=level)[0])
+        boxes = renderer.roi_boxes()
+        exact = plain.roi_boxes()
+        nonempty = exact[:, 0, 1] > 0
+        self.assertTrue((boxes[nonempty, :, 0] <= exact[nonempty, :, 0]).all())
+        self.assertTrue((boxes[nonempty, :, 1] >= exact[nonempty, :, 1]).all())
+
+    def test_cache(self):
+        renderer = RoiTileRenderer(self._series(image_mask_roi=self.masks), tile_size=16, cache_size=3)
+        renderer.render(0, level=2)
+        self.assertEqual(len(renderer._tiles), 3)
+        renderer.clear_cache()
+        self.assertEqual(len(renderer._tiles), 0)
+
+    def test_bad_levels(self):
+        with self.assertRaises(ValueError):
+            RoiTileRenderer(self._series(image_mask_roi=self.masks), tile_size=20, levels=(1, 8))
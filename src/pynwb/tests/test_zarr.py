@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from datetime import datetime
+from pynwb import NWBFile
+from pynwb.testing import TestCase
+
+from ndx_holostim import PatternedOptogeneticSeries, OptogeneticStimulusPattern, LightSource
+from ndx_holostim import SpatialLightModulator, PatternedOptogeneticStimulusSite
+from ndx_holostim.io import appendable_roi_dataio, wrap_roi_data
+
+try:
+    from hdmf_zarr import NWBZarrIO, ZarrDataIO
+except ImportError:
+    NWBZarrIO = None
+
+
+@unittest.skipIf(NWBZarrIO is None, "hdmf-zarr is not installed")
+class TestZarrBackend(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'test_patterned_optogenetic_series.nwb.zarr')
+        self.nwbfile = NWBFile(
+            session_description='Zarr POS test',
+            identifier='POSZARR',
+            session_start_time=datetime.now().astimezone(),
+        )
+        self.device = self.nwbfile.create_device(name='device1')
+        self.light_source = LightSource(name='light_source', stimulation_wavelength=1035.0, filter_description='none')
+        self.nwbfile.add_device(self.light_source)
+        self.spatial_light_modulator = SpatialLightModulator(name='slm', model_name='Hamamatsu X13138',
+                                                             resolution=0.65)
+        self.nwbfile.add_device(self.spatial_light_modulator)
+        self.stimulus_pattern = OptogeneticStimulusPattern(
+            name='stim_pattern',
+            description='test stim pattern',
+            duration=0.5,
+            number_of_stimulus_presentation=5,
+            inter_stimulus_interval=0.2,
+        )
+        self.nwbfile.add_lab_meta_data(self.stimulus_pattern)
+        self.site = PatternedOptogeneticStimulusSite(
+            name='site', device=self.device, description='test site', excitation_lambda=1035.0, location='V1')
+        self.nwbfile.add_ogen_site(self.site)
+        # masks of 64 KiB, stored one ROI per chunk
+        self.image_mask_roi = np.zeros((40, 256, 256, 1), dtype=bool)
+        for roi in range(40):
+            self.image_mask_roi[roi, 6 * roi:6 * roi + 5, 200 - 4 * roi:205 - 4 * roi] = True
+        self.center_rois = np.column_stack((np.arange(40.0), np.arange(40.0), np.zeros(40), np.full(40, 2.0)))
+
+    def _series(self, **kwargs):
+        series = PatternedOptogeneticSeries(
+            name='photostim_series',
+            site=self.site,
+            device=self.device,
+            light_source=self.light_source,
+            spatial_light_modulator=self.spatial_light_modulator,
+            stimulus_pattern=self.stimulus_pattern,
+            **kwargs
+        )
+        self.nwbfile.add_acquisition(series)
+        return series
+
+    def _write(self, **kwargs):
+        with NWBZarrIO(self.path, mode='w') as io:
+            io.write(self.nwbfile, **kwargs)
+
+    def test_wrap(self):
+        wrapped = wrap_roi_data(self.image_mask_roi, backend='zarr')
+        self.assertIsInstance(wrapped, ZarrDataIO)
+        self.assertEqual(wrapped.io_settings['chunks'], [1, 256, 256, 1])
+        wrapped = wrap_roi_data(self.center_rois, backend='zarr', compression='blosc')
+        self.assertEqual(wrapped.io_settings['compressor'].cname, 'zstd')
+        with self.assertRaises(ValueError):
+            wrap_roi_data(self.center_rois, backend='zarr', compression='lzf')
+        with self.assertRaises(ValueError):
+            wrap_roi_data(self.center_rois, backend='n5')
+
+    def _check_read(self):
+        with NWBZarrIO(self.path, mode='r') as io:
+            series = io.read().acquisition['photostim_series']
+            self.assertEqual(series.image_mask_roi.chunks, (1, 256, 256, 1))
+            self.assertEqual(series.number_rois, 40)
+            np.testing.assert_array_equal(series.get_roi(7), self.image_mask_roi[7])
+            np.testing.assert_array_equal(series.get_image_masks(), self.image_mask_roi)
+            np.testing.assert_array_equal(series.center_rois[:], self.center_rois)
+
+    def test_roundtrip(self):
+        self._series(image_mask_roi=self.image_mask_roi, center_rois=self.center_rois, roi_dataio=dict(backend='zarr'))
+        self._write()
+        self._check_read()
+
+    def test_parallel_write(self):
+        self._series(image_mask_roi=self.image_mask_roi, center_rois=self.center_rois, roi_dataio=dict(backend='zarr'))
+        self._write(number_of_jobs=2, multiprocessing_context='fork')
+        self._check_read()
+
+    def test_append_rois(self):
+        self._series(
+            image_mask_roi=appendable_roi_dataio((256, 256, 1), bool, backend='zarr'),
+            center_rois=appendable_roi_dataio((4,), np.float64, backend='zarr'),
+        )
+        self._write()
+        for start in range(0, 40, 16):
+            with NWBZarrIO(self.path, mode='a') as io:
+                series = io.read().acquisition['photostim_series']
+                self.assertEqual(series.append_rois(image_mask_roi=self.image_mask_roi[start:start + 16],
+                                                    center_rois=self.center_rois[start:start + 16]), start)
+        self._check_read()
+
+    def test_in_memory_access(self):
+        series = self._series(image_mask_roi=self.image_mask_roi, roi_dataio=dict(backend='zarr'))
+        self.assertEqual(series.number_rois, 40)
+        np.testing.assert_array_equal(series.get_roi(3), self.image_mask_roi[3])
@@ -81,6 +81,43 @@ def main():
                 dtype='text',
                 required=True,
             ),
+            NWBAttributeSpec(
+                name='lateral_psf',
+                doc=('lateral full width at half maximum of the point spread function, as [mean, s.d.] in um. '
+                     'The numeric form of lateral_point_spread_function'),
+                dtype='float32',
+                dims=('mean, sd',),
+                shape=(2,),
+                required=False,
+            ),
+            NWBAttributeSpec(
+                name='axial_psf',
+                doc=('axial full width at half maximum of the point spread function, as [mean, s.d.] in um. '
+                     'The numeric form of axial_point_spread_function'),
+                dtype='float32',
+                dims=('mean, sd',),
+                shape=(2,),
+                required=False,
+            ),
+            NWBAttributeSpec(
+                name='psf_voxel_size',
+                doc='size [x, y, z] of a voxel of point_spread_function, in um',
+                dtype='float32',
+                dims=('3',),
+                shape=(3,),
+                required=False,
+            ),
+        ],
+        datasets=[
+            NWBDatasetSpec(
+                name='point_spread_function',
+                doc=('measured 3-D point spread function, sampled on voxels of size psf_voxel_size and centered on '
+                     'its middle voxel'),
+                dtype='float32',
+                quantity='?',
+                dims=('x', 'y', 'z'),
+                shape=(None, None, None),
+            ),
         ],
     )
 
@@ -100,6 +137,156 @@ def main():
         ],
     )
 
+    # Stimulus events
+
+    PatternedOptogeneticStimulusTable = NWBGroupSpec(
+        neurodata_type_def='PatternedOptogeneticStimulusTable',
+        neurodata_type_inc='TimeIntervals',
+        doc=('Table of individual photostimulation pulses, one row per pulse and ROI, with the onset and offset of '
+             'the pulse in start_time and stop_time. Rows are sorted by start_time.'),
+        attributes=[
+            NWBAttributeSpec(
+                name='pattern_names',
+                doc='names of the OptogeneticStimulusPattern objects referred to by the pattern column',
+                dtype='text',
+                dims=('number_patterns',),
+                shape=(None,),
+                required=False,
+            ),
+        ],
+        datasets=[
+            NWBDatasetSpec(
+                name='roi',
+                neurodata_type_inc='VectorData',
+                doc='index of the stimulated ROI in the ROI datasets of the PatternedOptogeneticSeries',
+                dtype='uint32',
+            ),
+            NWBDatasetSpec(
+                name='pattern',
+                neurodata_type_inc='VectorData',
+                doc='index into pattern_names of the stimulus pattern that generated the pulse',
+                dtype='uint16',
+            ),
+            NWBDatasetSpec(
+                name='max_stop_time',
+                neurodata_type_inc='VectorData',
+                doc=('running maximum of stop_time over the rows sorted by start_time, i.e. the latest offset of this '
+                     'and all earlier pulses. Together with start_time it forms an interval index: the pulses active '
+                     'at time t are among the rows with max_stop_time > t and start_time <= t, found by binary '
+                     'search on both columns'),
+                dtype='float64',
+                quantity='?',
+            ),
+        ],
+    )
+
+    # Pattern library
+
+    StimulusPatternLibrary = NWBGroupSpec(
+        neurodata_type_def='StimulusPatternLibrary',
+        neurodata_type_inc='LabMetaData',
+        doc=('Library of the stimulus patterns and ROI masks used in a session, each stored once. Masks are '
+             'identified by a hash of their content, so masks shared by several series or trials are not '
+             'duplicated. Series refer to the masks by their index in the library.'),
+        attributes=[
+            NWBAttributeSpec(
+                name='mask_shape',
+                doc='shape [x, y, z] of a single mask',
+                dtype='uint32',
+                dims=('3',),
+                shape=(3,),
+                required=False,
+            ),
+        ],
+        datasets=[
+            NWBDatasetSpec(
+                name='mask_indices',
+                doc=('Flat (C-order) indices into a mask of shape mask_shape of the pixels or voxels of each mask, '
+                     'concatenated over masks. The pixels of mask i are mask_indices[mask_index[i-1]:mask_index[i]]'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_voxels',),
+                shape=(None,),
+            ),
+            NWBDatasetSpec(
+                name='mask_index',
+                doc='Index into mask_indices. Each element is the end offset of the pixels of the corresponding mask',
+                dtype='uint32',
+                quantity='?',
+                dims=('number_masks',),
+                shape=(None,),
+            ),
+            NWBDatasetSpec(
+                name='mask_hashes',
+                doc='hexadecimal SHA-1 digest of the content of each mask, used to find duplicate masks',
+                dtype='text',
+                quantity='?',
+                dims=('number_masks',),
+                shape=(None,),
+            ),
+        ],
+        groups=[
+            NWBGroupSpec(
+                neurodata_type_inc='OptogeneticStimulusPattern',
+                doc='the distinct stimulus patterns of the library',
+                quantity='*',
+            ),
+        ],
+    )
+
+    # Mask pyramid
+
+    RoiMaskPyramid = NWBGroupSpec(
+        neurodata_type_def='RoiMaskPyramid',
+        neurodata_type_inc='NWBDataInterface',
+        doc=('Downsampled copies of the ROI masks of a PatternedOptogeneticSeries, for overview displays and quality '
+             'control. In the masks of level f, a pixel is set if any pixel of its block of f x f pixels along x and '
+             'y belongs to the ROI. Axes whose length is not a multiple of f have ceil(length / f) pixels.'),
+        attributes=[
+            NWBAttributeSpec(
+                name='mask_shape',
+                doc='shape [x, y, z] of a single ROI mask at full resolution',
+                dtype='uint32',
+                dims=('3',),
+                shape=(3,),
+            ),
+        ],
+        datasets=[
+            NWBDatasetSpec(
+                name='masks_2x',
+                doc='ROI masks max-pooled over blocks of 2 x 2 pixels along x and y',
+                dtype='bool',
+                quantity='?',
+                dims=('number_rois', 'x', 'y', 'z'),
+                shape=(None, None, None, None),
+            ),
+            NWBDatasetSpec(
+                name='masks_4x',
+                doc='ROI masks max-pooled over blocks of 4 x 4 pixels along x and y',
+                dtype='bool',
+                quantity='?',
+                dims=('number_rois', 'x', 'y', 'z'),
+                shape=(None, None, None, None),
+            ),
+            NWBDatasetSpec(
+                name='masks_8x',
+                doc='ROI masks max-pooled over blocks of 8 x 8 pixels along x and y',
+                dtype='bool',
+                quantity='?',
+                dims=('number_rois', 'x', 'y', 'z'),
+                shape=(None, None, None, None),
+            ),
+            NWBDatasetSpec(
+                name='footprint',
+                doc='union of the masks of all ROIs at full resolution, i.e. the pixels that belong to any ROI',
+                dtype='bool',
+                quantity='?',
+                dims=('x', 'y', 'z'),
+                shape=(None, None, None),
+            ),
+        ],
+    )
+
     # Series
 
     PatternedOptogeneticSeries = NWBGroupSpec(
@@ -109,7 +296,23 @@ def main():
         attributes=[
             NWBAttributeSpec(name='description', doc='description of the series', dtype='text', required=False),
             NWBAttributeSpec(name='rate', doc='series framerate', dtype='float32', required=False),
+            NWBAttributeSpec(
+                name='starting_time',
+                doc=('time of the first sample of data, in seconds, when the samples are regularly spaced at rate '
+                     'instead of given by timestamps. Defaults to 0'),
+                dtype='float64',
+                required=False,
+            ),
             NWBAttributeSpec(name='unit', doc='SI unit of data', dtype='text', default_value='watts', required=False),
+            NWBAttributeSpec(
+                name='image_mask_shape',
+                doc=('shape [x, y, z] of a single ROI mask. Required when the masks are stored sparsely in '
+                     'image_mask_roi_indices and image_mask_roi_index or bit-packed in image_mask_roi_packed'),
+                dtype='uint32',
+                dims=('3',),
+                shape=(3,),
+                required=False,
+            ),
         ],
         datasets=[
             NWBDatasetSpec(
@@ -122,6 +325,33 @@ def main():
                 quantity='?',
                 dims=('number_rois', 'x', 'y', 'z'),
                 shape=None),
+            NWBDatasetSpec(
+                name='image_mask_roi_indices',
+                doc=('Sparse encoding of image_mask_roi. Flat (C-order) indices into a mask of shape '
+                     'image_mask_shape of all the pixels or voxels belonging to each ROI, concatenated '
+                     'over ROIs. The pixels of ROI i are image_mask_roi_indices[image_mask_roi_index[i-1]:'
+                     'image_mask_roi_index[i]]'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_voxels',),
+                shape=(None,)),
+            NWBDatasetSpec(
+                name='image_mask_roi_index',
+                doc=('Index into image_mask_roi_indices. Each element is the end offset of the pixels of '
+                     'the corresponding ROI'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_rois',),
+                shape=(None,)),
+            NWBDatasetSpec(
+                name='image_mask_roi_packed',
+                doc=('ROI masks packed 8 pixels per byte along x with numpy.packbits (most significant bit first). '
+                     'Each mask of shape image_mask_shape [x, y, z] is stored as [ceil(x / 8), y, z] bytes, and '
+                     'the padding bits of the last byte along x are 0'),
+                dtype='uint8',
+                quantity='?',
+                dims=('number_rois', 'packed_x', 'y', 'z'),
+                shape=(None, None, None, None)),
             NWBDatasetSpec(
              name='center_rois',
              doc=('ROIs designated as a list specifying the pixel and radio'
@@ -138,10 +368,101 @@ def main():
                 doc=('ROIs designated as a list specifying all the pixels'
                      '([x1, y1], or voxel ([x1, y1, z1]) of each ROI, where'
                      ' the items in the list are each of the pixels belonging'
-                     ' to the roi'),
+                     ' to the roi. Either padded to the largest ROI, with shape'
+                     ' [number_rois, number_pixels, 3], or ragged, with the pixels'
+                     ' of all ROIs concatenated into shape [number_pixels, 3] and'
+                     ' indexed by pixel_rois_index'),
+                quantity='?',
+                dims=(('number_pixels', '3'), ('number_rois', 'number_pixels', '3')),
+                shape=((None, None), (None, None, None))),
+            NWBDatasetSpec(
+                name='pixel_rois_index',
+                doc=('Index into a ragged pixel_rois. Each element is the end offset'
+                     ' of the pixels of the corresponding ROI, so the pixels of ROI i'
+                     ' are pixel_rois[pixel_rois_index[i-1]:pixel_rois_index[i]]'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_rois',),
+                shape=(None,)),
+            NWBDatasetSpec(
+                name='plane_rois',
+                doc=('numbers of the ROIs in each imaging plane, grouped by plane in increasing order of plane '
+                     'and sorted within each plane. A ROI spanning several planes is listed in each of them. The '
+                     'ROIs of plane p are plane_rois[plane_rois_index[p-1]:plane_rois_index[p]]'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_plane_rois',),
+                shape=(None,)),
+            NWBDatasetSpec(
+                name='plane_rois_index',
+                doc=('Index into plane_rois. Each element is the end offset of the ROIs of the corresponding '
+                     'plane'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_planes',),
+                shape=(None,)),
+            NWBDatasetSpec(
+                name='phase_masks',
+                doc=('phase, in radians in [0, 2 pi), displayed on spatial_light_modulator for each hologram, i.e. '
+                     'each group of ROIs stimulated together. A phase mask projects a spot at the center of each of '
+                     'its ROIs in the focal plane'),
+                dtype='float32',
+                quantity='?',
+                dims=('number_holograms', 'slm_x', 'slm_y'),
+                shape=(None, None, None)),
+            NWBDatasetSpec(
+                name='phase_mask_rois',
+                doc=('numbers of the ROIs targeted by each hologram, concatenated over holograms. The ROIs of '
+                     'hologram h are phase_mask_rois[phase_mask_rois_index[h-1]:phase_mask_rois_index[h]]'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_hologram_rois',),
+                shape=(None,)),
+            NWBDatasetSpec(
+                name='phase_mask_rois_index',
+                doc=('Index into phase_mask_rois. Each element is the end offset of the ROIs of the corresponding '
+                     'hologram'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_holograms',),
+                shape=(None,)),
+            NWBDatasetSpec(
+                name='data',
+                doc=('power delivered to each ROI over time, in the unit given by the unit attribute of the '
+                     'series. Sample times are given by timestamps or by starting_time and rate'),
+                dtype='numeric',
                 quantity='?',
-                dims=('number_rois', 'number_pixels', '3'),
-                shape=None)],
+                dims=('num_times', 'number_rois'),
+                shape=(None, None)),
+            NWBDatasetSpec(
+                name='library_roi_index',
+                doc=('index of the mask of each ROI in the mask library linked by pattern_library, instead of '
+                     'storing the masks in the series'),
+                dtype='uint32',
+                quantity='?',
+                dims=('number_rois',),
+                shape=(None,)),
+            NWBDatasetSpec(
+                name='timestamps',
+                doc='sorted time of each sample of data, in seconds',
+                dtype='float64',
+                quantity='?',
+                dims=('num_times',),
+                shape=(None,))],
+        groups=[
+            NWBGroupSpec(
+                name='stimulus_events',
+                neurodata_type_inc='PatternedOptogeneticStimulusTable',
+                doc='the individual photostimulation pulses delivered to the ROIs of this series',
+                quantity='?',
+            ),
+            NWBGroupSpec(
+                name='mask_pyramid',
+                neurodata_type_inc='RoiMaskPyramid',
+                doc='downsampled copies of the ROI masks of this series',
+                quantity='?',
+            ),
+        ],
         links=[
             NWBLinkSpec(
                 name='site', doc='link to the patterned stimulus site', target_type='PatternedOptogeneticStimulusSite'
@@ -158,6 +479,12 @@ def main():
                 target_type='SpatialLightModulator',
             ),
             NWBLinkSpec(name='light_source', doc='link to the light source', target_type='LightSource'),
+            NWBLinkSpec(
+                name='pattern_library',
+                doc='link to the library holding the masks referred to by library_roi_index',
+                target_type='StimulusPatternLibrary',
+                quantity='?',
+            ),
         ],
     )
 
@@ -170,6 +497,14 @@ def main():
         attributes=[
             NWBAttributeSpec(name='model_name', doc='Model of the Spatial Light Modulator', dtype='text'),
             NWBAttributeSpec(name='resolution', doc='Resolution of the Spatial Light Modulator in um', dtype='float32'),
+            NWBAttributeSpec(
+                name='dimensions',
+                doc='number of pixels [x, y] of the Spatial Light Modulator',
+                dtype='uint32',
+                dims=('2',),
+                shape=(2,),
+                required=False,
+            ),
         ],
     )
 
@@ -205,6 +540,9 @@ def main():
         SpiralScanning,
         TemporalFocusing,
         PatternedOptogeneticStimulusSite,
+        PatternedOptogeneticStimulusTable,
+        StimulusPatternLibrary,
+        RoiMaskPyramid,
         PatternedOptogeneticSeries,
         SpatialLightModulator,
         LightSource,